@@ -0,0 +1,20 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+
+class PipelineConsumer(AsyncJsonWebsocketConsumer):
+    """Pushes the luigi task events published to the pipeline group to the browser"""
+
+    async def connect(self):
+        await self.channel_layer.group_add(
+            settings.PIPELINE_EVENTS_GROUP, self.channel_name
+        )
+        await self.accept()
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(
+            settings.PIPELINE_EVENTS_GROUP, self.channel_name
+        )
+
+    async def pipeline_event(self, message):
+        await self.send_json(message["event"])
@@ -0,0 +1,207 @@
+"""Server-side aggregation of the raw data shown by the visualization.
+
+A csv file is converted once, in chunks, into a columnar copy on disk: every value
+is replaced by the index of its bin among BASE_BINS equal-width bins between the
+column minimum and maximum, stored as uint16, one memory-mapped file per column.
+All sessions and server processes share these pages through the page cache, and no
+session holds the data itself.
+
+Histograms at any resolution dividing BASE_BINS, filtered by value ranges of other
+columns, and 2D histograms of two columns are computed from the bin indices with
+np.bincount, so only the aggregated bins are ever sent to the browser. A copy is
+rebuilt when the modification time or the size of the csv file changes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from tempfile import mkdtemp
+
+import numpy as np
+import pandas as pd
+
+BASE_BINS = 1600  # finest resolution; every resolution divides it
+RESOLUTIONS = (25, 50, 100, 200, 400, 800, 1600)
+MISSING = BASE_BINS  # bin index of missing values
+ROWS_PER_BLOCK = 1 << 20  # rows aggregated at once, bounds temporary memory
+
+
+def _column_range(low, high):
+    # Same range as np.histogram, which widens constant columns by 0.5 on each side
+    if low == high:
+        return low - 0.5, high + 0.5
+    return low, high
+
+
+def build_columnar(csv_path, directory, chunksize=1000000):
+    """Writes the bin indices of every column of the csv file to directory in two passes over the file"""
+    low, high, n_rows = None, None, 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        values = chunk.astype(np.float64)
+        low = values.min() if low is None else np.fmin(low, values.min())
+        high = values.max() if high is None else np.fmax(high, values.max())
+        n_rows += len(chunk)
+    ranges = {
+        column: _column_range(float(low[column]), float(high[column]))
+        for column in low.index
+    }
+
+    tmp = mkdtemp(dir=os.path.dirname(directory))
+    files = {
+        column: open(os.path.join(tmp, str(i) + ".u16"), "wb")
+        for i, column in enumerate(ranges)
+    }
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            for column, (column_low, column_high) in ranges.items():
+                values = chunk[column].values.astype(np.float64)
+                position = (values - column_low) / (column_high - column_low)
+                with np.errstate(invalid="ignore"):
+                    codes = np.clip(np.floor(position * BASE_BINS), 0, BASE_BINS - 1)
+                codes[np.isnan(values)] = MISSING
+                files[column].write(codes.astype(np.uint16).tobytes())
+    finally:
+        for f in files.values():
+            f.close()
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"n_rows": n_rows, "columns": list(ranges), "ranges": ranges}, f)
+    try:
+        os.replace(tmp, directory)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+        shutil.rmtree(tmp)  # another process built the same copy first
+
+
+class ColumnarDataset:
+    """Memory-mapped bin indices of every column of one version of a csv file"""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.n_rows = meta["n_rows"]
+        self.columns = sorted(meta["columns"])
+        self.ranges = {
+            column: tuple(meta["ranges"][column]) for column in meta["columns"]
+        }
+        self.codes = {
+            column: (
+                np.memmap(
+                    os.path.join(directory, str(i) + ".u16"),
+                    dtype=np.uint16,
+                    mode="r",
+                    shape=(self.n_rows,),
+                )
+                if self.n_rows
+                else np.empty(0, dtype=np.uint16)
+            )
+            for i, column in enumerate(meta["columns"])
+        }
+        self._full = {}  # column -> unfiltered histogram at BASE_BINS
+
+    def edges(self, column, bins=BASE_BINS):
+        low, high = self.ranges[column]
+        return np.linspace(low, high, bins + 1)
+
+    def _blocks(self, filters):
+        """Yields (start, stop, mask) of row blocks; mask selects the rows inside all filter ranges or is None"""
+        bounds = {
+            column: np.searchsorted(self.edges(column)[1:-1], value_range, side="right")
+            for column, value_range in (filters or {}).items()
+        }
+        for start in range(0, self.n_rows, ROWS_PER_BLOCK):
+            stop = min(start + ROWS_PER_BLOCK, self.n_rows)
+            mask = None
+            for column, (low_bin, high_bin) in bounds.items():
+                codes = self.codes[column][start:stop]
+                inside = (codes >= low_bin) & (codes <= high_bin)
+                mask = inside if mask is None else mask & inside
+            yield start, stop, mask
+
+    def histogram(self, column, bins=50, filters=None):
+        """Returns counts and edges of column in bins bins, counting only rows inside the filters {column: (low, high)}"""
+        if BASE_BINS % bins:
+            raise ValueError("bins must divide %d" % BASE_BINS)
+        if not filters and column in self._full:
+            counts = self._full[column]
+        else:
+            counts = np.zeros(BASE_BINS + 1, dtype=np.int64)
+            for start, stop, mask in self._blocks(filters):
+                codes = self.codes[column][start:stop]
+                if mask is not None:
+                    codes = codes[mask]
+                counts += np.bincount(codes, minlength=BASE_BINS + 1)
+            counts = counts[:BASE_BINS]
+            if not filters:
+                self._full[column] = counts
+        return counts.reshape(bins, -1).sum(axis=1), self.edges(column, bins)
+
+    def histogram2d(self, x, y, bins=50, filters=None):
+        """Returns counts[x bin, y bin] and the edges of both columns"""
+        if BASE_BINS % bins:
+            raise ValueError("bins must divide %d" % BASE_BINS)
+        factor = BASE_BINS // bins
+        counts = np.zeros((bins + 1) * (bins + 1), dtype=np.int64)
+        for start, stop, mask in self._blocks(filters):
+            # Missing values fall into the extra last bin of each axis
+            x_codes = self.codes[x][start:stop] // factor
+            y_codes = self.codes[y][start:stop] // factor
+            if mask is not None:
+                x_codes, y_codes = x_codes[mask], y_codes[mask]
+            cells = x_codes.astype(np.int64) * (bins + 1) + y_codes
+            counts += np.bincount(cells, minlength=len(counts))
+        counts = counts.reshape(bins + 1, bins + 1)[:bins, :bins]
+        return counts, self.edges(x, bins), self.edges(y, bins)
+
+
+class DatasetCache:
+    """Thread-safe LRU cache of ColumnarDatasets keyed by csv path, invalidated by the file's mtime and size.
+    The columnar copies are kept in cache_dir, one directory per version of a file."""
+
+    def __init__(self, cache_dir, max_datasets=8):
+        self.cache_dir = cache_dir
+        self.max_datasets = max_datasets
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # path -> ((mtime, size), ColumnarDataset)
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        # Concurrent sessions wait for the first one instead of all reading the file
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                self._entries.move_to_end(path)
+                return entry[1]
+            self.misses += 1
+            dataset = ColumnarDataset(self._columnar_copy(path, version))
+            self._entries[path] = (version, dataset)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_datasets:
+                self._entries.popitem(last=False)
+            return dataset
+
+    def _columnar_copy(self, path, version):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        digest = hashlib.sha1(path.encode()).hexdigest()[:8]
+        prefix = "%s-%s-" % (os.path.basename(path), digest)
+        directory = os.path.join(self.cache_dir, prefix + "%d-%d" % version)
+        if not os.path.isdir(directory):
+            build_columnar(path, directory)
+            # Copies of older versions of the file are not needed anymore
+            for name in os.listdir(self.cache_dir):
+                old = os.path.join(self.cache_dir, name)
+                if name.startswith(prefix) and old != directory:
+                    shutil.rmtree(old, ignore_errors=True)
+        return directory
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,13 +1,19 @@
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.apps import apps
+from django.urls import path
+
+from .consumers import PipelineConsumer
 
 bokeh_app_config = apps.get_app_config("bokeh.server.django")
 
 application = ProtocolTypeRouter(
     {
         "websocket": AuthMiddlewareStack(
-            URLRouter(bokeh_app_config.routes.get_websocket_urlpatterns())
+            URLRouter(
+                [path("ws/pipeline/", PipelineConsumer)]
+                + bokeh_app_config.routes.get_websocket_urlpatterns()
+            )
         ),
         "http": AuthMiddlewareStack(
             URLRouter(bokeh_app_config.routes.get_http_urlpatterns())
@@ -9,6 +9,8 @@ https://docs.djangoproject.com/en/2.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
+
+import os
 from os.path import abspath, dirname, join
 from pathlib import Path
 
@@ -73,6 +75,20 @@ TEMPLATES = [
 
 ASGI_APPLICATION = "Visualizer.routing.application"
 
+# Channel layer of the live pipeline dashboard. The in-memory layer only reaches consumers of
+# this process; to receive events of a pipeline run elsewhere, set REDIS_URL to the Redis
+# server also configured in the [events] section of the pipeline's luigi.cfg
+if os.environ.get("REDIS_URL"):
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": [os.environ["REDIS_URL"]]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+PIPELINE_EVENTS_GROUP = "pipeline"
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -120,3 +136,12 @@ STATIC_URL = "/static/"
 STATICFILES_DIRS = [bokehjsdir()]
 
 THEMES_DIR = join(MODULE_DIR, "themes")
+
+# Raw data shown by the visualization and its memory-mapped, pre-binned columnar copies
+RAW_DATA_PATH = join(dirname(BASE_DIR), "data", "heart.csv")
+AGGREGATION_CACHE_DIR = join(dirname(BASE_DIR), "data", "cache", "visualizer")
+AGGREGATION_CACHE_SIZE = 8  # number of data files kept open
+
+# Chart specs written by the Report tasks of the pipeline (one per data file and list of models);
+# the pipeline page draws the most recent one
+REPORT_PATTERN = join(dirname(BASE_DIR), "data", "*", "report_test_*.json")
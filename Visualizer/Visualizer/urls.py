@@ -30,6 +30,8 @@ bokeh_app_config = apps.get_app_config("bokeh.server.django")
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("visualization/", views.visualization),
+    path("pipeline/", views.pipeline),
+    path("report/", views.report),
 ]
 
 base_path = settings.BASE_PATH
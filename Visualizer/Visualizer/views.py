@@ -1,36 +1,63 @@
-import os
-from os.path import join
+import json
+from glob import glob
+from os.path import getmtime, join
 
-import numpy as np
-import pandas as pd
 from bokeh.document import Document
 from bokeh.embed import server_document
 from bokeh.layouts import column, row
-from bokeh.models import Select
+from bokeh.models import ColumnDataSource, RangeSlider, Select
 from bokeh.plotting import figure
 from bokeh.themes import Theme
 from django.conf import settings
-from django.http import HttpRequest, HttpResponse
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import render
 
+from .histograms import BASE_BINS, RESOLUTIONS, DatasetCache
+
 theme = Theme(filename=join(settings.THEMES_DIR, "theme.yaml"))
 
+# Shared by all sessions of the process
+dataset_cache = DatasetCache(
+    settings.AGGREGATION_CACHE_DIR, settings.AGGREGATION_CACHE_SIZE
+)
+
 
 def visualization_handler(doc: Document) -> None:
-    df = pd.read_csv(os.path.join(os.getcwd(), "../data/heart.csv")).copy()
-    columns = sorted(df.columns)
+    dataset = dataset_cache.get(settings.RAW_DATA_PATH)
+    columns = dataset.columns
+
+    def filters():
+        low, high = dataset.ranges[filter_column.value]
+        if tuple(filter_range.value) == (low, high):
+            return None
+        return {filter_column.value: filter_range.value}
+
+    def histogram_data():
+        hist, edges = dataset.histogram(x.value, int(bins.value), filters())
+        return dict(top=hist, left=edges[:-1], right=edges[1:])
+
+    def histogram2d_data():
+        counts, x_edges, y_edges = dataset.histogram2d(
+            x.value, y.value, int(bins.value), filters()
+        )
+        return dict(
+            image=[counts.T],
+            x=[x_edges[0]],
+            y=[y_edges[0]],
+            dw=[x_edges[-1] - x_edges[0]],
+            dh=[y_edges[-1] - y_edges[0]],
+        )
 
     def create_figure():
-        xs = df[x.value].values
         x_title = x.value.title()
 
-        hist, edges = np.histogram(xs, density=False, bins=50)
         p = figure(title=x_title, tools="", background_fill_color="#fafafa")
         p.quad(
-            top=hist,
+            source=source,
+            top="top",
             bottom=0,
-            left=edges[:-1],
-            right=edges[1:],
+            left="left",
+            right="right",
             fill_color="navy",
             line_color="white",
             alpha=0.5,
@@ -44,14 +71,65 @@ def visualization_handler(doc: Document) -> None:
         p.grid.grid_line_color = "white"
         return p
 
+    def create_figure2d():
+        p = figure(
+            title=x.value.title() + " vs " + y.value.title(),
+            tools="",
+            background_fill_color="#fafafa",
+        )
+        p.image(
+            source=source2d,
+            image="image",
+            x="x",
+            y="y",
+            dw="dw",
+            dh="dh",
+            palette="Viridis256",
+        )
+        p.xaxis.axis_label = x.value.title()
+        p.yaxis.axis_label = y.value.title()
+        return p
+
     def callback(attr: str, *args, **kwargs) -> None:
-        layout_plot.children[1] = create_figure()
+        # Only the aggregated bins are sent to the browser; the figures are reused
+        source.data = histogram_data()
+        source2d.data = histogram2d_data()
+        plot.title.text = plot.xaxis.axis_label = x.value.title()
+        plot2d.title.text = x.value.title() + " vs " + y.value.title()
+        plot2d.xaxis.axis_label = x.value.title()
+        plot2d.yaxis.axis_label = y.value.title()
+
+    def filter_column_callback(attr: str, *args, **kwargs) -> None:
+        low, high = dataset.ranges[filter_column.value]
+        filter_range.update(
+            start=low, end=high, value=(low, high), step=(high - low) / BASE_BINS
+        )
+        callback(attr)
 
     x = Select(title="x-axis", value="age", options=columns)
-    x.on_change("value", callback)
+    y = Select(title="y-axis (2D histogram)", value="chol", options=columns)
+    bins = Select(title="bins", value="50", options=[str(n) for n in RESOLUTIONS])
+    filter_column = Select(title="filter", value="age", options=columns)
+    low, high = dataset.ranges[filter_column.value]
+    filter_range = RangeSlider(
+        title="range",
+        start=low,
+        end=high,
+        value=(low, high),
+        step=(high - low) / BASE_BINS,
+    )
+    for control in (x, y, bins):
+        control.on_change("value", callback)
+    filter_column.on_change("value", filter_column_callback)
+    filter_range.on_change("value_throttled", callback)
+
+    source = ColumnDataSource(data=histogram_data())
+    source2d = ColumnDataSource(data=histogram2d_data())
 
-    controls = column(x, width=200)
-    layout_plot = row(controls, create_figure())
+    controls = column(x, y, bins, filter_column, filter_range, width=200)
+    plot = create_figure()
+    plot2d = create_figure2d()
+    layout_plot = row(controls, plot, plot2d)
 
     doc.theme = theme
     doc.add_root(layout_plot)
@@ -61,3 +139,16 @@ def visualization_handler(doc: Document) -> None:
 def visualization(request: HttpRequest) -> HttpResponse:
     script = server_document(request.build_absolute_uri())
     return render(request, "visualization.html", dict(script=script))
+
+
+def pipeline(request: HttpRequest) -> HttpResponse:
+    return render(request, "pipeline.html")
+
+
+def report(request: HttpRequest) -> JsonResponse:
+    """Returns the chart spec of the last pipeline report, which the pipeline page draws"""
+    paths = glob(settings.REPORT_PATTERN)
+    if not paths:
+        raise Http404("No report yet")
+    with open(max(paths, key=getmtime)) as f:
+        return JsonResponse(json.load(f))
@@ -0,0 +1,53 @@
+"""Measures how long opening a Bokeh session of the visualization takes under load.
+
+Opens `sessions` sessions over `concurrency` parallel connections to a running
+server and reports latency percentiles and sessions opened per second:
+
+    python session_latency.py --url http://127.0.0.1:8000/visualization --concurrency 16
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from bokeh.client import pull_session
+
+
+def open_session(url):
+    """Opens a session, waits for its document and returns the elapsed seconds"""
+    start = time.perf_counter()
+    session = pull_session(url=url)
+    seconds = time.perf_counter() - start
+    session.close()
+    return seconds
+
+
+def measure(url, concurrency=16, sessions=100):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(open_session, [url] * sessions))
+    seconds = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "sessions": len(latencies),
+        "seconds": seconds,
+        "sessions_per_second": len(latencies) / seconds,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000/visualization")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--sessions", type=int, default=100)
+    args = parser.parse_args()
+    stats = measure(args.url, args.concurrency, args.sessions)
+    for name, value in stats.items():
+        print("%-20s %12.2f" % (name, value))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Compares a single-process run of the training stage with a run on a central scheduler.
+
+A grid of models is trained on synthetic heart data, once by one luigi worker on the
+local scheduler and once by several processes ("hosts"), each with several luigi
+workers, sharing a luigid launched on this machine (final_project.execution). The
+central scheduler gets the cores of this machine as cpu capacity, so models using
+several cores (n_jobs) are never run alongside more work than the machine holds.
+With --flaky every model fails its first run, to exercise the retries of the
+scheduler. The wall time of both runs, the speedup and the failed runs are reported.
+
+    pipenv run python -m benchmarks.distributed --rows 50000 --hosts 2 --workers 2
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+from tempfile import TemporaryDirectory
+
+import pandas as pd
+from luigi import BoolParameter, IntParameter, LocalTarget, Parameter, build
+from luigi.configuration import get_config
+
+from final_project.caching import CachedTask
+from final_project.estimators import ModelSpecParameter
+from final_project.execution import central_scheduler, configure, machine_capacity
+from final_project.model_io import save_model
+from final_project.preprocess_heart import HeartPreprocessor
+from final_project.profiling import read_records
+from final_project.synthetic import generate
+from final_project.train import fit_model
+from final_project.zoo import cores_needed
+
+MODELS = [
+    {
+        "estimator": "sklearn.ensemble.RandomForestClassifier",
+        "params": {"n_estimators": 100, "max_depth": depth, "random_state": 0},
+    }
+    for depth in (None, 6, 10, 14)
+] + [
+    {
+        "estimator": "sklearn.linear_model.LogisticRegression",
+        "params": {"C": c, "max_iter": 1000},
+    }
+    for c in (0.01, 0.1, 1.0, 10.0)
+]
+# One model using all cores, which the scheduler runs alone
+MODELS.append(
+    {
+        "estimator": "sklearn.ensemble.RandomForestClassifier",
+        "params": {"n_estimators": 200, "n_jobs": -1, "random_state": 0},
+    }
+)
+
+
+class SyntheticTrainData(CachedTask):
+    """Preprocessed synthetic train data in the root folder"""
+
+    root = Parameter()
+    rows = IntParameter()
+
+    def output(self):
+        return LocalTarget(os.path.join(self.root, "train.parquet"))
+
+    def run(self):
+        df = generate(self.rows)
+        preprocessor = HeartPreprocessor.fit(df)
+        df = preprocessor.transform(df, remove_outliers=True)
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.output().path + "-tmp-%d" % os.getpid()
+        df[preprocessor.feature_columns + ["target"]].to_parquet(tmp)
+        os.replace(tmp, self.output().path)
+
+
+class FitSyntheticModel(CachedTask):
+    """A model trained on the synthetic train data. With flaky, the first run fails."""
+
+    root = Parameter()
+    rows = IntParameter()
+    model = ModelSpecParameter()
+    flaky = BoolParameter(default=False, significant=False)
+
+    def cores(self):
+        return cores_needed(self.model.params, os.cpu_count())
+
+    def requires(self):
+        return SyntheticTrainData(self.root, self.rows)
+
+    def output(self):
+        return LocalTarget(os.path.join(self.root, self.model.name + "_model"))
+
+    def run(self):
+        marker = self.output().path + ".failed"
+        if self.flaky and not os.path.exists(marker):
+            open(marker, "w").close()
+            raise RuntimeError("First run of %s fails on purpose" % self.model.name)
+        df = pd.read_parquet(self.input().path)
+        x_train, y_train = df.drop(columns=["target"]), df["target"]
+        clf, _, score = fit_model(
+            self.model.estimator, x_train, y_train, self.model.params, self.model.name
+        )
+        save_model(clf, self.output().path, x_train.columns, scores={"train": score})
+
+
+def _set(section, option, value):
+    config = get_config()
+    if not config.has_section(section):
+        config.add_section(section)
+    config.set(section, option, str(value))
+
+
+def use_folder(root):
+    """Keeps outputs, manifests, profiles and the registry of a benchmark run in its folder"""
+    _set("cache", "path", os.path.join(root, "cache"))
+    _set("profiling", "path", os.path.join(root, "profile"))
+    _set("registry", "path", os.path.join(root, "registry.sqlite3"))
+
+
+def run_workers(root, rows, flaky, workers, scheduler_url=None):
+    """Builds the models of MODELS in this process with workers luigi workers"""
+    use_folder(root)
+    # Short polls of idle workers, as the tasks take seconds
+    _set("worker", "wait_jitter", 0.5)
+    _set("scheduler", "retry_delay", 1.0)
+    configure(local_scheduler=scheduler_url is None, resources=machine_capacity())
+    tasks = [FitSyntheticModel(root, rows, model, flaky) for model in MODELS]
+    if scheduler_url:
+        build(tasks, scheduler_url=scheduler_url, workers=workers)
+    else:
+        build(tasks, local_scheduler=True, workers=workers)
+
+
+def timed_run(context, root, args, hosts, workers, scheduler_url=None):
+    """Runs hosts processes of workers luigi workers; returns seconds, success and failed runs"""
+    start = time.perf_counter()
+    # Plain processes rather than a pool, whose daemonic processes cannot start luigi workers
+    processes = [
+        context.Process(
+            target=run_workers,
+            args=(root, args.rows, args.flaky, workers, scheduler_url),
+        )
+        for _ in range(hosts)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    seconds = time.perf_counter() - start
+    # luigi.build fails when a run failed, even if its retry succeeded, so outputs are checked instead
+    use_folder(root)
+    ok = all(FitSyntheticModel(root, args.rows, model).complete() for model in MODELS)
+    records = read_records(os.path.join(root, "profile"))
+    failures = sum(record["status"] == "failure" for record in records)
+    return seconds, ok, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--hosts", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--flaky", action="store_true")
+    args = parser.parse_args()
+
+    # Forked, so that the task processes of luigi workers inherit the config of their host
+    context = multiprocessing.get_context("fork")
+    print("%-28s %10s %8s %10s" % ("run", "seconds", "success", "failures"))
+    with TemporaryDirectory() as tmp:
+        single = timed_run(context, os.path.join(tmp, "single"), args, 1, 1)
+        print("%-28s %10.2f %8s %10d" % (("single process",) + single))
+        with central_scheduler(machine_capacity(), retry_delay=1.0) as url:
+            distributed = timed_run(
+                context,
+                os.path.join(tmp, "distributed"),
+                args,
+                args.hosts,
+                args.workers,
+                url,
+            )
+        name = "%d hosts x %d workers" % (args.hosts, args.workers)
+        print("%-28s %10.2f %8s %10d" % ((name,) + distributed))
+    print("Speedup: %.2fx" % (single[0] / distributed[0]))
+
+
+if __name__ == "__main__":
+    main()
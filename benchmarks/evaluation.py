@@ -0,0 +1,102 @@
+"""Compares bootstrap evaluation of models one by one with the shared evaluation engine.
+
+Models are fitted on synthetic heart data and their probabilities on held-out rows
+are evaluated with --bootstrap replicates, for a growing number of models:
+
+* per model: every model draws its own resamples and scores each with the
+  scikit-learn metrics, as a loop over the models would
+* shared: final_project.evaluation.evaluate, which draws the resamples once for all
+  models and computes all metrics and intervals vectorized, in --workers processes
+
+The seconds of both and the seconds added by each model are reported.
+
+    pipenv run python -m benchmarks.evaluation --rows 20000 --bootstrap 200 --models 8
+"""
+
+import argparse
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import (
+    accuracy_score,
+    average_precision_score,
+    brier_score_loss,
+    roc_auc_score,
+)
+
+from final_project.evaluation import evaluate
+from final_project.preprocess_heart import HeartPreprocessor
+from final_project.synthetic import generate
+
+
+def fitted_scores(rows, n_models):
+    """Returns the labels of held-out rows and the probabilities of n_models models, shape (models, rows)"""
+    train = generate(rows, seed=1)
+    test = generate(rows, seed=2)
+    preprocessor = HeartPreprocessor.fit(train)
+    train = preprocessor.transform(train, remove_outliers=True)
+    test = preprocessor.transform(test)
+    columns = preprocessor.feature_columns
+    scores = []
+    for i in range(n_models):
+        if i % 2:
+            clf = RandomForestClassifier(
+                n_estimators=20, max_depth=4 + i, random_state=i
+            )
+        else:
+            clf = LogisticRegression(C=10.0 ** (i // 2 - 2), max_iter=1000)
+        clf.fit(train[columns], train["target"])
+        scores.append(clf.predict_proba(test[columns])[:, 1])
+    return test["target"].values, np.vstack(scores)
+
+
+def per_model(y, scores, n_bootstrap, seed=0):
+    """Bootstrap intervals of every model with its own resamples and the scikit-learn metrics"""
+    for model, score in enumerate(scores):
+        rng = np.random.default_rng([seed, model])
+        values = []
+        for _ in range(n_bootstrap):
+            index = rng.integers(0, len(y), len(y))
+            values.append(
+                (
+                    roc_auc_score(y[index], score[index]),
+                    average_precision_score(y[index], score[index]),
+                    accuracy_score(y[index], score[index] > 0.5),
+                    brier_score_loss(y[index], score[index]),
+                )
+            )
+        np.percentile(values, [2.5, 97.5], axis=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--bootstrap", type=int, default=200)
+    parser.add_argument("--models", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    y, scores = fitted_scores(args.rows, args.models)
+    print("%8s %12s %12s %8s" % ("models", "per model s", "shared s", "speedup"))
+    previous = None
+    for n_models in sorted({1, 2, 4, args.models}):
+        if n_models > args.models:
+            continue
+        start = time.perf_counter()
+        per_model(y, scores[:n_models], args.bootstrap)
+        loop = time.perf_counter() - start
+        start = time.perf_counter()
+        names = ["model_%d" % i for i in range(n_models)]
+        evaluate(names, y, scores[:n_models], args.bootstrap, max_workers=args.workers)
+        shared = time.perf_counter() - start
+        print("%8d %12.2f %12.2f %7.1fx" % (n_models, loop, shared, loop / shared))
+        if previous is not None:
+            added = (shared - previous[1]) / (n_models - previous[0])
+            print("%8s %25.3f s per added model" % ("", added))
+        previous = n_models, shared
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Compares loading the features of every consumer from the preprocessed artifacts and from the feature store.
+
+Synthetic heart data is split and preprocessed once and the preprocessed train and
+test data is saved as csv and as Parquet (see artifacts) and written to the feature
+store (final_project.features). Then --consumers consumers (Train, Tune, TestModel,
+Evaluate, ...) each load the features and labels of a split and sum every column,
+so every value is read:
+
+* csv, parquet: every consumer reads the artifact and splits off the labels, as the
+  tasks did before the feature store
+* store: every consumer opens the memory-mapped FeatureSet; the first consumer reads
+  the pages from disk and the others from the page cache
+
+The seconds of the one-time store build and of all consumers are reported.
+
+    pipenv run python -m benchmarks.features --rows 1000000 --consumers 4
+"""
+
+import argparse
+import os
+import time
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from final_project.artifacts import frame_target, preprocessed_schema
+from final_project.features import FeatureSet, write_features
+from final_project.load_data import stratified_test_mask
+from final_project.preprocess_heart import HeartPreprocessor
+from final_project.synthetic import generate
+
+
+def consume_artifact(target):
+    df = target.read()
+    x = df.drop(columns=["target"]).to_numpy(dtype=np.float32)
+    y = df["target"].values
+    return x.sum(axis=0), y.sum()
+
+
+def consume_store(path, split):
+    features = FeatureSet(path)
+    return features.matrix(split).sum(axis=0), features.target(split).sum()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--consumers", type=int, default=4)
+    args = parser.parse_args()
+
+    df = generate(args.rows, seed=1)
+    mask = stratified_test_mask(df["target"].values)
+    preprocessor = HeartPreprocessor.fit(df[~mask])
+    frames = {
+        "train": preprocessor.transform(df[~mask], remove_outliers=True),
+        "test": preprocessor.transform(df[mask]),
+    }
+    splits = ["train", "test"] * args.consumers
+    splits = splits[: args.consumers]
+    with TemporaryDirectory() as tmp:
+        results = []
+        for frame_format in ("csv", "parquet"):
+            targets = {}
+            for split, frame in frames.items():
+                targets[split] = frame_target(
+                    os.path.join(tmp, split), frame_format=frame_format
+                )
+                targets[split].write(frame, preprocessed_schema(frame.columns))
+            start = time.perf_counter()
+            for split in splits:
+                consume_artifact(targets[split])
+            results.append((frame_format, 0.0, time.perf_counter() - start))
+
+        path = os.path.join(tmp, "features")
+        start = time.perf_counter()
+        write_features(path, frames)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        for split in splits:
+            consume_store(path, split)
+        results.append(("store", build, time.perf_counter() - start))
+
+    print("%-8s %10s %12s %10s" % ("source", "build s", "consumers s", "speedup"))
+    for name, build, seconds in results:
+        print(
+            "%-8s %10.3f %12.3f %9.1fx"
+            % (name, build, seconds, results[1][2] / seconds)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compares the intermediate artifact formats end to end.
+
+For each format, in a fresh process: writes the train/test split, reads it back,
+preprocesses both splits, writes and reads the preprocessed artifacts and fits a
+model. Wall time and the peak RSS of the process are reported.
+
+    pipenv run python -m benchmarks.formats --rows 1000000
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+from tempfile import TemporaryDirectory
+
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+
+from final_project.artifacts import (
+    FORMATS,
+    HEART_SCHEMA,
+    frame_target,
+    preprocessed_schema,
+)
+from final_project.load_data import stratified_test_mask, write_split
+from final_project.monitor import peak_rss_mb
+from final_project.preprocess_heart import HeartPreprocessor
+
+
+def run_pipeline(frame_format, raw_path, rows):
+    """Runs the stage boundaries of the pipeline in one format, returns seconds and peak RSS"""
+    raw = pd.read_csv(raw_path).sample(rows, replace=True, random_state=0)
+    raw = raw.reset_index(drop=True)
+    with TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        split = {
+            name: frame_target(os.path.join(tmp, name), HEART_SCHEMA, frame_format)
+            for name in ("train", "test")
+        }
+        with split["train"].open("w") as train_file, split["test"].open(
+            "w"
+        ) as test_file:
+            write_split(
+                [raw],
+                stratified_test_mask(raw["target"].values),
+                split["train"].writer(train_file),
+                split["test"].writer(test_file),
+            )
+        del raw
+
+        preprocessed = {}
+        preprocessor = HeartPreprocessor.fit(split["train"].read())
+        for name, target in split.items():
+            df = preprocessor.transform(target.read(), remove_outliers=name == "train")
+            preprocessed[name] = frame_target(
+                os.path.join(tmp, "preprocessed_" + name), frame_format=frame_format
+            )
+            preprocessed[name].write(df, preprocessed_schema(df.columns))
+            del df
+
+        train = preprocessed["train"].read()
+        LogisticRegression().fit(train.drop(columns=["target"]), train["target"])
+        test = preprocessed["test"].read()
+        return time.perf_counter() - start, peak_rss_mb(), len(test)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.join("data", "heart.csv"))
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print("%-8s %12s %14s" % ("format", "seconds", "peak RSS (MB)"))
+    for frame_format in FORMATS:
+        with context.Pool(1) as pool:
+            seconds, rss, _ = pool.apply(
+                run_pipeline, (frame_format, args.data, args.rows)
+            )
+        print("%-8s %12.2f %14.1f" % (frame_format, seconds, rss))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Compares incremental training with a full retrain as appended data grows.
+
+Synthetic heart data is appended as partitions of --partition-rows rows. After every
+partition one copy of each model is updated incrementally (final_project.incremental:
+partial_fit, or new trees for a forest) and another is retrained from scratch on all
+partitions. The wall time of both and their accuracy on held-out rows are reported.
+With --drift-at the continuous columns of that partition and all later ones are
+shifted, which should make the incremental model rebuild once.
+
+    pipenv run python -m benchmarks.incremental --partitions 10 --partition-rows 50000
+"""
+
+import argparse
+import os
+from tempfile import TemporaryDirectory
+
+from sklearn.metrics import accuracy_score
+
+from final_project.estimators import ModelSpec
+from final_project.incremental import DEFAULT_MODEL, IncrementalModel, append_partition
+from final_project.preprocess_heart import CONTINUOUS_COLUMNS, HeartPreprocessor
+from final_project.synthetic import generate
+
+MODELS = [
+    DEFAULT_MODEL,
+    {
+        "estimator": "sklearn.ensemble.RandomForestClassifier",
+        "params": {"n_estimators": 50, "max_depth": 10, "random_state": 0},
+    },
+]
+
+
+def held_out_accuracy(model, test):
+    preprocessor = HeartPreprocessor.from_dict(model.state["preprocessor"])
+    df = preprocessor.transform(test)
+    return accuracy_score(
+        df["target"], model.clf.predict(df[model.clf.feature_names_in_])
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--partitions", type=int, default=10)
+    parser.add_argument("--partition-rows", type=int, default=50000)
+    parser.add_argument("--drift-at", type=int, default=None)
+    parser.add_argument("--shift", type=float, default=0.5)  # in standard deviations
+    args = parser.parse_args()
+
+    data = generate(args.partitions * args.partition_rows, seed=1)
+    test = generate(20000, seed=2)
+    shift = data[CONTINUOUS_COLUMNS].std() * args.shift
+    print(
+        "%-24s %10s %12s %10s %8s %10s %10s %s"
+        % ("model", "rows", "incremental", "full", "speedup", "acc inc", "acc full", "")
+    )
+    for spec in map(ModelSpec.of, MODELS):
+        with TemporaryDirectory() as tmp:
+            folder = os.path.join(tmp, "partitions")
+            online = IncrementalModel(os.path.join(tmp, "incremental"), spec)
+            full = IncrementalModel(os.path.join(tmp, "full"), spec)
+            for i in range(args.partitions):
+                start = i * args.partition_rows
+                part = data.iloc[start : start + args.partition_rows].copy()
+                if args.drift_at is not None and i >= args.drift_at:
+                    part[CONTINUOUS_COLUMNS] += shift
+                append_partition(folder, part)
+                summary = online.update(folder)
+                retrain = full.update(folder, rebuild=True)
+                print(
+                    "%-24s %10d %12.3f %10.3f %7.1fx %10.4f %10.4f %s"
+                    % (
+                        spec.path.rpartition(".")[2],
+                        summary["rows"],
+                        summary["seconds"],
+                        retrain["seconds"],
+                        retrain["seconds"] / summary["seconds"],
+                        held_out_accuracy(online, test),
+                        held_out_accuracy(full, test),
+                        (
+                            "rebuilt (%s)" % summary["reason"]
+                            if summary["rebuilt"]
+                            else ""
+                        ),
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Compares the latency of scikit-learn and compiled inference at several batch sizes.
+
+Both models of the pipeline are fitted on synthetic data. For every batch size the
+median latency of scoring raw records is reported for two paths:
+
+* sklearn: HeartPreprocessor.transform of a DataFrame and predict_proba of the estimator
+* compiled: HeartPreprocessor.transform_values of an array and the compiled model
+
+Probabilities of both paths are checked to be identical.
+
+    pipenv run python -m benchmarks.inference --batch-sizes 1 32 10000
+"""
+
+import argparse
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+from final_project.artifacts import FEATURE_COLUMNS
+from final_project.inference import compile_model
+from final_project.preprocess_heart import HeartPreprocessor
+from final_project.synthetic import generate
+
+
+def median_seconds(func, min_seconds=0.5, min_calls=5):
+    """Calls func repeatedly for at least min_seconds and returns the median seconds per call"""
+    seconds = []
+    start = time.perf_counter()
+    while len(seconds) < min_calls or time.perf_counter() - start < min_seconds:
+        call_start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - call_start)
+    return float(np.median(seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32, 10000])
+    args = parser.parse_args()
+
+    train = generate(args.rows)
+    preprocessor = HeartPreprocessor.fit(train)
+    train = preprocessor.transform(train, remove_outliers=True)
+    columns = preprocessor.feature_columns
+    records = generate(max(args.batch_sizes), seed=1).drop(columns=["target"])
+
+    print(
+        "%-24s %8s %14s %14s %8s"
+        % ("model", "batch", "sklearn ms", "compiled ms", "speedup")
+    )
+    for model in (RandomForestClassifier(), LogisticRegression()):
+        model.fit(train[columns], train["target"])
+        compiled = compile_model(model)
+        for batch_size in args.batch_sizes:
+            frame = records.iloc[:batch_size]
+            values = frame[FEATURE_COLUMNS].values
+            if batch_size == 1:
+                values = values[0]
+
+            def sklearn_path():
+                return model.predict_proba(preprocessor.transform(frame)[columns])
+
+            def compiled_path():
+                x = preprocessor.transform_values(values, columns)
+                return compiled.predict_proba(x)
+
+            if not np.array_equal(sklearn_path(), compiled_path()):
+                raise AssertionError("Compiled probabilities differ from sklearn")
+            sklearn_ms = median_seconds(sklearn_path) * 1000
+            compiled_ms = median_seconds(compiled_path) * 1000
+            print(
+                "%-24s %8d %14.3f %14.3f %7.1fx"
+                % (
+                    type(model).__name__,
+                    batch_size,
+                    sklearn_ms,
+                    compiled_ms,
+                    sklearn_ms / compiled_ms,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
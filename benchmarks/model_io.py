@@ -0,0 +1,109 @@
+"""Compares loading a large model from a pickle file and from model folders.
+
+A random forest (and a logistic regression) is fitted on synthetic data, then saved
+as a pickle file, as an uncompressed model folder and as a compressed one. Each
+way of loading runs in a fresh process, which reports the load time, the growth
+of its resident memory and the size of the file:
+
+* pickle: pickle.load of the file, the former artifact
+* joblib: load_model without memory mapping
+* mmap: load_model with memory-mapped arrays
+* compressed: load_model of the zlib compressed folder
+* lazy: LazyModel, which reads only the manifest
+
+    pipenv run python -m benchmarks.model_io --rows 200000 --trees 100
+"""
+
+import argparse
+import multiprocessing
+import os
+import pickle
+import time
+from tempfile import TemporaryDirectory
+
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+from final_project.model_io import MODEL_FILE, LazyModel, load_model, save_model
+from final_project.synthetic import generate
+
+METHODS = ("pickle", "joblib", "mmap", "compressed", "lazy")
+
+
+def resident_mb():
+    """Returns the current resident set size of the process in megabytes (Linux)"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def fit_and_save(model, rows, trees, directory):
+    """Fits the model on synthetic data and saves it in every format to directory"""
+    df = generate(rows)
+    x, y = df.drop(columns=["target"]), df["target"]
+    if model == "forest":
+        clf = RandomForestClassifier(n_estimators=trees, n_jobs=-1, random_state=0)
+    else:
+        clf = LogisticRegression(max_iter=1000)
+    clf.fit(x, y)
+    with open(os.path.join(directory, "model.pkl"), "wb") as f:
+        pickle.dump(clf, f, protocol=pickle.HIGHEST_PROTOCOL)
+    save_model(clf, os.path.join(directory, "model"), x.columns)
+    save_model(clf, os.path.join(directory, "compressed"), x.columns, compress=3)
+
+
+def load(method, directory):
+    """Loads the model in one way, returns seconds, resident memory growth in MB and file size in MB"""
+    # Import the estimator modules first, so that only loading the model is measured
+    import sklearn.ensemble  # noqa: F401
+    import sklearn.linear_model  # noqa: F401
+
+    folder = os.path.join(
+        directory, "compressed" if method == "compressed" else "model"
+    )
+    path = os.path.join(folder, MODEL_FILE)
+    before = resident_mb()
+    start = time.perf_counter()
+    if method == "pickle":
+        path = os.path.join(directory, "model.pkl")
+        with open(path, "rb") as f:
+            model = pickle.load(f)
+    elif method == "lazy":
+        model = LazyModel(folder)
+    else:
+        model = load_model(folder, mmap=method == "mmap")
+    seconds = time.perf_counter() - start
+    rss = resident_mb() - before
+    del model
+    return seconds, rss, os.path.getsize(path) / 1024**2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--trees", type=int, default=100)
+    args = parser.parse_args()
+
+    # Every step runs in a fresh process, so memory of one does not count for the others
+    context = multiprocessing.get_context("spawn")
+    print(
+        "%-8s %-12s %10s %14s %12s"
+        % ("model", "method", "seconds", "RSS growth MB", "file MB")
+    )
+    for model in ("forest", "logistic"):
+        with TemporaryDirectory() as tmp:
+            with context.Pool(1) as pool:
+                pool.apply(fit_and_save, (model, args.rows, args.trees, tmp))
+            for method in METHODS:
+                with context.Pool(1) as pool:
+                    seconds, rss, size = pool.apply(load, (method, tmp))
+                print(
+                    "%-8s %-12s %10.3f %14.1f %12.1f"
+                    % (model, method, seconds, rss, size)
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Benchmarks the stages of the pipeline on synthetic data and detects regressions.
+
+Synthetic heart data (final_project.synthetic) of the requested size is generated
+locally, so no network access is needed. Every case is timed `repeat` times after
+its setup and the best and median seconds are reported:
+
+* split: stratified test mask and train/test split written as Parquet
+* preprocess_fit, preprocess_transform: HeartPreprocessor on the train split
+* train_<model>, score_<model>: the models of the pipeline on the preprocessed data
+* visualization_build, visualization_histogram, visualization_histogram2d: the
+  columnar copy built for the first session and the filtered aggregations of the
+  Visualizer callbacks
+
+Results are compared to the baseline stored for the same number of rows; a case
+whose best time exceeds the baseline by more than the tolerance is a regression
+and makes the command exit with status 1:
+
+    pipenv run python -m benchmarks.pipeline --rows 100000
+    pipenv run python -m benchmarks.pipeline --rows 100000 --save-baseline
+
+Baselines depend on the machine; save new ones after changing the hardware.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+from final_project.artifacts import HEART_SCHEMA, frame_target
+from final_project.load_data import stratified_test_mask, write_split
+from final_project.preprocess_heart import HeartPreprocessor
+from final_project.synthetic import generate, write_csv
+from Visualizer.Visualizer.histograms import ColumnarDataset, build_columnar
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "pipeline.json")
+MODELS = (LogisticRegression, RandomForestClassifier)
+
+
+def measure(func, repeat):
+    """Returns the best and the median seconds of repeat calls of func"""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    return {"best": min(seconds), "median": float(np.median(seconds))}
+
+
+def run_suite(rows, repeat=3, seed=0):
+    """Times every case on rows rows of synthetic data, returns {case: {"best", "median"}}"""
+    results = {}
+    raw = generate(rows, seed)
+    with TemporaryDirectory() as tmp:
+
+        def split():
+            targets = {
+                name: frame_target(os.path.join(tmp, name), HEART_SCHEMA, "parquet")
+                for name in ("train", "test")
+            }
+            test_mask = stratified_test_mask(raw["target"].values)
+            with targets["train"].open("w") as train_file:
+                with targets["test"].open("w") as test_file:
+                    write_split(
+                        [raw],
+                        test_mask,
+                        targets["train"].writer(train_file),
+                        targets["test"].writer(test_file),
+                    )
+            return targets
+
+        results["split"] = measure(split, repeat)
+        targets = split()
+        train, test = targets["train"].read(), targets["test"].read()
+
+        results["preprocess_fit"] = measure(
+            lambda: HeartPreprocessor.fit(train), repeat
+        )
+        preprocessor = HeartPreprocessor.fit(train)
+        results["preprocess_transform"] = measure(
+            lambda: preprocessor.transform(train, remove_outliers=True), repeat
+        )
+        train = preprocessor.transform(train, remove_outliers=True)
+        test = preprocessor.transform(test)
+        x_train, y_train = train.drop(columns=["target"]), train["target"]
+        x_test, y_test = test.drop(columns=["target"]), test["target"]
+
+        for model in MODELS:
+            name = model.__name__
+            results["train_" + name] = measure(
+                lambda: model().fit(x_train, y_train), repeat
+            )
+            clf = model().fit(x_train, y_train)
+            results["score_" + name] = measure(
+                lambda: clf.score(x_test, y_test), repeat
+            )
+
+        csv_path = os.path.join(tmp, "heart.csv")
+        write_csv(csv_path, rows, seed)
+        columnar = os.path.join(tmp, "columnar")
+
+        # Later builds find the directory of the first one and discard their copy
+        results["visualization_build"] = measure(
+            lambda: build_columnar(csv_path, columnar), repeat
+        )
+        dataset = ColumnarDataset(columnar)
+        filters = {"age": (40, 60), "chol": (200, 300)}
+        results["visualization_histogram"] = measure(
+            lambda: dataset.histogram("thalach", 50, filters), repeat
+        )
+        results["visualization_histogram2d"] = measure(
+            lambda: dataset.histogram2d("age", "thalach", 50, filters), repeat
+        )
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns the cases whose best time exceeds the baseline by more than tolerance, as {case: ratio}"""
+    regressions = {}
+    for case, timing in results.items():
+        if case in baseline:
+            ratio = timing["best"] / baseline[case]["best"]
+            if ratio > 1 + tolerance:
+                regressions[case] = ratio
+    return regressions
+
+
+def load_baselines(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = run_suite(args.rows, args.repeat)
+    baselines = load_baselines(args.baseline)
+    baseline = baselines.get(str(args.rows), {}).get("results", {})
+
+    print("%-32s %10s %10s %10s" % ("case", "best s", "median s", "baseline"))
+    for case, timing in results.items():
+        reference = baseline[case]["best"] if case in baseline else float("nan")
+        print(
+            "%-32s %10.4f %10.4f %10.4f"
+            % (case, timing["best"], timing["median"], reference)
+        )
+
+    if args.save_baseline:
+        baselines[str(args.rows)] = {
+            "machine": {
+                "platform": platform.platform(),
+                "processor": platform.processor(),
+                "cpus": os.cpu_count(),
+                "python": platform.python_version(),
+            },
+            "results": results,
+        }
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print("Baseline for %d rows saved to %s" % (args.rows, args.baseline))
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    for case, ratio in regressions.items():
+        print("Regression: %s is %.2fx slower than the baseline" % (case, ratio))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
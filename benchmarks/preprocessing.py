@@ -0,0 +1,118 @@
+"""Compares fitting the preprocessor in memory and streaming.
+
+The raw data is resampled to the requested number of rows and written as Parquet.
+Each method then fits the preprocessor from that file in a fresh process:
+
+* legacy: the former implementation, pandas quantiles and one statsmodels OLS fit per VIF column
+* memory: HeartPreprocessor.fit, exact quantiles and VIF from one correlation matrix inverse
+* streaming: HeartPreprocessor.fit_chunks, two passes over Parquet row batches with KLL sketches
+
+Wall time, peak RSS and the largest difference of the outlier bounds to the exact ones are reported.
+
+    pipenv run python -m benchmarks.preprocessing --rows 10000000
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_selection import chi2
+from statsmodels.stats.outliers_influence import variance_inflation_factor
+
+from final_project.artifacts import HEART_SCHEMA, frame_target
+from final_project.monitor import peak_rss_mb
+from final_project.preprocess_heart import (
+    BINARY_AND_CATEGORICAL_COLUMNS,
+    CONTINUOUS_COLUMNS,
+    TARGET_COLUMN,
+    HeartPreprocessor,
+    _inliers,
+    _mask_invalid,
+    _scale,
+)
+
+
+def legacy_fit(df):
+    """The preprocessor fit before streaming statistics, kept as the baseline"""
+    df = _mask_invalid(df)
+    medians = df.drop(columns=[TARGET_COLUMN]).median(skipna=True, numeric_only=True)
+    df = df.fillna(medians)
+    quantile_25 = df[CONTINUOUS_COLUMNS].quantile(0.25).values
+    quantile_75 = df[CONTINUOUS_COLUMNS].quantile(0.75).values
+    outlier_cutoff = (quantile_75 - quantile_25) * 1.5
+    lower, upper = quantile_25 - outlier_cutoff, quantile_75 + outlier_cutoff
+    df = df[_inliers(df, lower, upper)]
+    continuous = df[CONTINUOUS_COLUMNS].values
+    scale_min, scale_max = continuous.min(axis=0), continuous.max(axis=0)
+    _, p_values = chi2(df[BINARY_AND_CATEGORICAL_COLUMNS], df[TARGET_COLUMN])
+    dropped = list(np.array(BINARY_AND_CATEGORICAL_COLUMNS)[p_values > 0.05])
+    ck = _scale(continuous, scale_min, scale_max)
+    vif = np.array([variance_inflation_factor(ck, i) for i in range(ck.shape[1])])
+    dropped += list(np.array(CONTINUOUS_COLUMNS)[vif > 5][:-1])
+    columns = [column for column in df.columns if column not in dropped]
+    return HeartPreprocessor(
+        medians.to_dict(), lower, upper, scale_min, scale_max, columns
+    )
+
+
+def write_sample(data, rows, path):
+    """Resamples the raw data to rows rows and writes it as Parquet"""
+    raw = pd.read_csv(data).sample(rows, replace=True, random_state=0)
+    # Jitter the continuous columns so that quantiles are not trivially exact
+    noise = np.random.RandomState(0).normal(0, 0.5, (len(raw), 2))
+    raw[["chol", "trestbps"]] += noise
+    target = frame_target(path, HEART_SCHEMA, "parquet")
+    with target.open("w") as f:
+        writer = target.writer(f)
+        for start in range(0, len(raw), 100000):
+            writer.write(raw.iloc[start : start + 100000])
+        writer.close()
+
+
+def run_fit(method, path):
+    """Fits the preprocessor from the Parquet file with one method, returns seconds, peak RSS and outlier bounds"""
+    target = frame_target(path, HEART_SCHEMA, "parquet")
+    start = time.perf_counter()
+    if method == "streaming":
+        preprocessor = HeartPreprocessor.fit_chunks(lambda: target.read_chunks(100000))
+    elif method == "memory":
+        preprocessor = HeartPreprocessor.fit(target.read())
+    else:
+        preprocessor = legacy_fit(target.read())
+    bounds = np.concatenate([preprocessor.lower, preprocessor.upper])
+    return time.perf_counter() - start, peak_rss_mb(), bounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.join("data", "heart.csv"))
+    parser.add_argument("--rows", type=int, default=10000000)
+    args = parser.parse_args()
+
+    # Every step runs in a fresh process: the peak RSS of a process is inherited by the processes it starts
+    context = multiprocessing.get_context("spawn")
+    with TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "train")
+        with context.Pool(1) as pool:
+            pool.apply(write_sample, (args.data, args.rows, path))
+
+        print(
+            "%-10s %12s %14s %18s"
+            % ("method", "seconds", "peak RSS (MB)", "max bound error")
+        )
+        exact = None
+        for method in ("legacy", "memory", "streaming"):
+            with context.Pool(1) as pool:
+                seconds, rss, bounds = pool.apply(run_fit, (method, path))
+            if exact is None:
+                exact = bounds
+            error = np.abs(bounds - exact).max()
+            print("%-10s %12.2f %14.1f %18.4f" % (method, seconds, rss, error))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Compares reading pipeline inputs from S3 with plain luigi targets and with the storage module.
+
+--objects objects of --mb MB each are uploaded to a bucket, then read three ways:
+
+* plain: a new luigi S3Target (and so a new boto3 session) per object, read from S3
+* pooled: final_project.storage targets sharing the client of the thread, read
+  through the object cache; the first pass downloads, the second reads local copies
+* prefetched: the objects are fetched concurrently by storage.prefetch before they
+  are read one after the other, as when a task starts
+
+Without --endpoint-url the bucket is an in-process moto mock, which has no network
+latency, so the gains of pooling and prefetching are smallest there; pass the url of
+an S3 compatible server (or of S3 itself with --bucket) to measure them over a network.
+
+    pipenv run python -m benchmarks.storage --objects 20 --mb 4
+"""
+
+import argparse
+import os
+import time
+from contextlib import ExitStack
+from tempfile import TemporaryDirectory
+
+import boto3
+from luigi import format
+from luigi.configuration import get_config
+from luigi.contrib.s3 import S3Target
+
+from final_project import storage
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def read_all(targets):
+    for target in targets:
+        with target.open("r") as f:
+            f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--objects", type=int, default=20)
+    parser.add_argument("--mb", type=float, default=4)
+    parser.add_argument("--bucket", default="storage-benchmark")
+    parser.add_argument("--endpoint-url", default=None)
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        if args.endpoint_url:
+            get_config().set("s3", "endpoint_url", args.endpoint_url)
+        else:
+            from moto import mock_aws
+
+            stack.enter_context(mock_aws())
+        tmp = stack.enter_context(TemporaryDirectory())
+        get_config().set("cache", "path", tmp)
+        client = boto3.client(
+            "s3", region_name="us-east-1", endpoint_url=args.endpoint_url
+        )
+        if not args.endpoint_url:
+            client.create_bucket(Bucket=args.bucket)
+        paths = []
+        for i in range(args.objects):
+            key = "benchmark/%d.bin" % i
+            client.put_object(
+                Bucket=args.bucket, Key=key, Body=os.urandom(int(args.mb * 1024**2))
+            )
+            paths.append("s3://%s/%s" % (args.bucket, key))
+
+        def plain():
+            read_all([S3Target(path, format=format.Nop) for path in paths])
+
+        def pooled():
+            read_all([storage.file_target(path) for path in paths])
+
+        def prefetched():
+            targets = [storage.file_target(path) for path in paths]
+            storage.prefetch(targets)
+            read_all(targets)
+
+        results = [("plain", timed(plain)), ("pooled, first read", timed(pooled))]
+        results.append(("pooled, cached", timed(pooled)))
+        get_config().set("cache", "path", os.path.join(tmp, "empty"))
+        results.append(("prefetched, first read", timed(prefetched)))
+        for name, seconds in results:
+            print(
+                "%-24s %8.2f s %8.1f MB/s"
+                % (name, seconds, args.objects * args.mb / seconds)
+            )
+        print("speedup of cached reads: %.1fx" % (results[0][1] / results[2][1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Formats and luigi targets for the data frames passed between pipeline stages.
+
+Intermediate data is stored as Parquet by default; Arrow IPC and csv can be chosen
+with the [artifacts] section of luigi.cfg:
+
+    [artifacts]
+    format=arrow
+
+Every artifact is written with an explicit pyarrow schema. Local Parquet and Arrow
+files, and the local copies of S3 artifacts (see storage), are read memory-mapped and
+only the requested columns are decoded.
+"""
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from luigi import ChoiceParameter, Config, LocalTarget, format
+from luigi.mock import MockTarget
+
+from .storage import CachedS3Target, local_copy, storage
+
+TARGET_COLUMN = "target"
+FEATURE_COLUMNS = [
+    "age",
+    "sex",
+    "cp",
+    "trestbps",
+    "chol",
+    "fbs",
+    "restecg",
+    "thalach",
+    "exang",
+    "oldpeak",
+    "slope",
+    "ca",
+    "thal",
+]
+
+# Features are float64 so that missing values survive the round trip
+HEART_SCHEMA = pa.schema(
+    [(column, pa.float64()) for column in FEATURE_COLUMNS]
+    + [(TARGET_COLUMN, pa.int64())]
+)
+
+
+def preprocessed_schema(columns):
+    """Returns the schema of preprocessed data with the given columns"""
+    return pa.schema(
+        [
+            (column, pa.int64() if column == TARGET_COLUMN else pa.float64())
+            for column in columns
+        ]
+    )
+
+
+def _to_table(df, schema):
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def _pandas_dtypes(schema):
+    return schema.empty_table().to_pandas().dtypes.to_dict()
+
+
+class CsvWriter:
+    """Writes data frames to a binary file as csv, with the header written once"""
+
+    def __init__(self, f, schema=None):
+        self.f = f
+        self.schema = schema
+        self.header = True
+
+    def write(self, df):
+        if self.schema is not None:
+            df = df[self.schema.names].astype(_pandas_dtypes(self.schema))
+        self.f.write(df.to_csv(index=False, header=self.header).encode())
+        self.header = False
+
+    def close(self):
+        if self.header and self.schema is not None:
+            self.write(self.schema.empty_table().to_pandas())
+
+
+class ParquetWriter:
+    """Writes data frames to a binary file as Parquet row groups"""
+
+    def __init__(self, f, schema):
+        self.schema = schema
+        self.writer = pq.ParquetWriter(f, schema)
+
+    def write(self, df):
+        self.writer.write_table(_to_table(df, self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class ArrowWriter:
+    """Writes data frames to a binary file as Arrow IPC record batches"""
+
+    def __init__(self, f, schema):
+        self.schema = schema
+        self.writer = ipc.new_file(f, schema)
+
+    def write(self, df):
+        self.writer.write_table(_to_table(df, self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def _read_csv(source, columns, schema):
+    dtypes = None if schema is None else _pandas_dtypes(schema)
+    df = pd.read_csv(source, usecols=columns, dtype=dtypes)
+    return df if columns is None else df[list(columns)]
+
+
+def _read_parquet(source, columns, schema):
+    return pq.read_table(source, columns=columns, memory_map=True)
+
+
+def _read_arrow(source, columns, schema):
+    if isinstance(source, str):
+        source = pa.memory_map(source)
+    table = ipc.open_file(source).read_all()
+    return table if columns is None else table.select(columns)
+
+
+def _iter_csv(source, columns, schema, chunksize):
+    dtypes = None if schema is None else _pandas_dtypes(schema)
+    for df in pd.read_csv(source, usecols=columns, dtype=dtypes, chunksize=chunksize):
+        yield df if columns is None else df[list(columns)]
+
+
+def _iter_parquet(source, columns, schema, chunksize):
+    parquet_file = pq.ParquetFile(source, memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+        yield batch.to_pandas()
+
+
+def _iter_arrow(source, columns, schema, chunksize):
+    # The memory-mapped table is not copied; only one batch at a time is converted
+    for batch in _read_arrow(source, columns, schema).to_batches(chunksize):
+        yield batch.to_pandas()
+
+
+FORMATS = {
+    "parquet": (".parquet", ParquetWriter, _read_parquet, _iter_parquet),
+    "arrow": (".arrow", ArrowWriter, _read_arrow, _iter_arrow),
+    "csv": (".csv", CsvWriter, _read_csv, _iter_csv),
+}
+
+
+class artifacts(Config):
+    """Configuration of the intermediate data format"""
+
+    format = ChoiceParameter(choices=list(FORMATS), default="parquet")
+
+
+class FrameTargetMixin:
+    """Adds read and write of data frames in a given format to a luigi target"""
+
+    def _init_frame(self, frame_format, schema):
+        self.frame_format = frame_format
+        self.schema = schema
+        _, self.writer_class, self.reader, self.chunk_reader = FORMATS[frame_format]
+
+    def writer(self, f, schema=None):
+        """Returns a writer that appends data frames to the open binary file f"""
+        return self.writer_class(f, schema or self.schema)
+
+    def write(self, df, schema=None):
+        """Writes a data frame atomically to the target"""
+        with self.open("w") as f:
+            writer = self.writer(f, schema)
+            writer.write(df)
+            writer.close()
+
+    def read(self, columns=None):
+        """Reads the target as a data frame, decoding only the given columns"""
+        data = self.reader(self._source(), columns, self.schema)
+        return data if isinstance(data, pd.DataFrame) else data.to_pandas()
+
+    def read_chunks(self, chunksize=100000, columns=None):
+        """Iterates over the target as data frames of at most chunksize rows"""
+        return self.chunk_reader(self._source(), columns, self.schema, chunksize)
+
+
+class LocalFrameTarget(FrameTargetMixin, LocalTarget):
+    """Local data frame artifact, read memory-mapped"""
+
+    def __init__(self, path, frame_format, schema=None):
+        super().__init__(path, format=format.Nop)
+        self._init_frame(frame_format, schema)
+
+    def _source(self):
+        return self.path
+
+
+class S3FrameTarget(FrameTargetMixin, CachedS3Target):
+    """Data frame artifact in amazon s3 bucket, read from its local copy"""
+
+    def __init__(self, path, frame_format, schema=None):
+        super().__init__(path, format=format.Nop)
+        self._init_frame(frame_format, schema)
+
+    def _source(self):
+        if storage().read_cache:
+            return local_copy(self)
+        with self.open("r") as f:
+            return pa.BufferReader(f.read())
+
+
+class MemoryFrameTarget(FrameTargetMixin, MockTarget):
+    """Data frame artifact in memory"""
+
+    def __init__(self, path, frame_format, schema=None):
+        super().__init__(path, format=format.Nop)
+        self._init_frame(frame_format, schema)
+
+    def _source(self):
+        return pa.BufferReader(self.fs.get_data(self.path))
+
+
+def frame_target(path, schema=None, frame_format=None):
+    """Returns the data frame target for path (without extension) in the configured format"""
+    frame_format = frame_format or artifacts().format
+    path = path + FORMATS[frame_format][0]
+    if path.startswith("s3://"):
+        return S3FrameTarget(path, frame_format, schema)
+    if path.startswith("memory://"):
+        return MemoryFrameTarget(path, frame_format, schema)
+    return LocalFrameTarget(path, frame_format, schema)
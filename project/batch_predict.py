@@ -0,0 +1,164 @@
+"""Scores large files of unlabeled patient records with a trained model.
+
+The input file (csv, Parquet or Arrow, with the feature columns of heart.csv) is read
+in chunks of chunksize rows. Worker processes load the fitted preprocessor and the
+model once, then transform and score the chunks they receive and write each one as
+a Parquet part of the output folder. At most two chunks per worker are read ahead,
+so memory does not grow with the size of the input. Parts hold the input row number,
+the probability of heart disease and the predicted label, and the folder can be read
+at once with pandas.read_parquet.
+"""
+
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from luigi import ExternalTask, IntParameter, LocalTarget, Parameter
+
+from . import artifacts, preprocess_heart
+from .artifacts import FEATURE_COLUMNS, FORMATS, LocalFrameTarget, frame_target
+from .caching import CachedTask
+from .estimators import ModelSpecParameter
+from .events import ROWS_PROCESSED
+from .load_data import data_output_path
+from .model_io import LazyModel
+from .preprocess_data import FitPreprocessor
+from .preprocess_heart import HeartPreprocessor
+from .train import Train
+
+SHARED_RELATIVE_PATH = "data"
+
+PREDICTION_SCHEMA = pa.schema(
+    [("row", pa.int64()), ("probability", pa.float64()), ("label", pa.int64())]
+)
+
+
+class ScoringData(ExternalTask):
+    """A local file of records to score, in one of the artifact formats given by its extension"""
+
+    path = Parameter()
+
+    def output(self):
+        extension = os.path.splitext(self.path)[1]
+        for frame_format, (format_extension, _, _, _) in FORMATS.items():
+            if extension == format_extension:
+                return LocalFrameTarget(self.path, frame_format)
+        raise ValueError("Unsupported file type: " + self.path)
+
+
+def score_frame(preprocessor, model, df):
+    """Returns the probability of the positive class and the label of every row of raw records.
+    model is a LazyModel, whose manifest gives the order of the feature columns."""
+    x = preprocessor.transform(df)[model.feature_names]
+    probability = model.predict_proba(x)[:, 1]
+    return probability, (probability > 0.5).astype(np.int64)
+
+
+_scorer = None  # (preprocessor, model) of a worker process
+
+
+def _load_scorer(preprocessor_path, model_path):
+    global _scorer
+    with open(preprocessor_path) as f:
+        preprocessor = HeartPreprocessor.load(f)
+    _scorer = preprocessor, LazyModel(model_path)
+
+
+def _score_part(df, first_row, part_path):
+    """Scores one chunk in a worker process and writes it as a Parquet part"""
+    probability, label = score_frame(*_scorer, df)
+    predictions = pd.DataFrame(
+        {
+            "row": np.arange(first_row, first_row + len(df), dtype=np.int64),
+            "probability": probability,
+            "label": label,
+        }
+    )
+    frame_target(part_path, PREDICTION_SCHEMA, "parquet").write(predictions)
+    return len(df)
+
+
+def batch_predict(
+    chunks, preprocessor_path, model_path, output_dir, workers=None, max_pending=None
+):
+    """Scores the data frames of chunks in parallel and writes part-<n>.parquet files to output_dir.
+    Returns the number of rows scored."""
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or 2 * workers
+    os.makedirs(output_dir, exist_ok=True)
+    rows = 0
+    pending = set()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_load_scorer,
+        initargs=(preprocessor_path, model_path),
+    ) as pool:
+        first_row = 0
+        for part, df in enumerate(chunks):
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                rows += sum(future.result() for future in done)
+            part_path = os.path.join(output_dir, "part-%05d" % part)
+            pending.add(
+                pool.submit(_score_part, df.astype(float), first_row, part_path)
+            )
+            first_row += len(df)
+        rows += sum(future.result() for future in pending)
+    return rows
+
+
+class BatchPredict(CachedTask):
+    """Scores every record of the input file given by path with the model trained on data.
+    Probabilities and labels are written to a folder of Parquet parts in the local folder of the data.
+    workers worker processes (default: one per core) score chunks of chunksize rows in parallel.
+    """
+
+    path = Parameter()
+    data = Parameter(default="heart.csv")
+    model = ModelSpecParameter(default="sklearn.ensemble.RandomForestClassifier")
+    chunksize = IntParameter(default=100000, significant=False)
+    workers = IntParameter(default=0, significant=False)
+
+    salt_modules = (artifacts, preprocess_heart)
+
+    def cores(self):
+        return self.workers or os.cpu_count()
+
+    def requires(self):
+        return {
+            "records": ScoringData(self.path),
+            "preprocessor": FitPreprocessor(self.data),
+            "model": Train(self.data, "train", self.model),
+        }
+
+    def output(self):
+        name = os.path.splitext(os.path.basename(self.path))[0]
+        path = data_output_path(self.data, "predictions", self.model.name + "_" + name)
+        return LocalTarget(path)
+
+    def run(self):
+        """Scores the input in parallel chunks into a temporary folder, which then replaces the output"""
+        inputs = self.input()
+        output_dir = self.output().path
+        tmp = output_dir + "-tmp-%d" % os.getpid()
+        start = time.perf_counter()
+        rows = batch_predict(
+            inputs["records"].read_chunks(self.chunksize, FEATURE_COLUMNS),
+            inputs["preprocessor"].path,
+            inputs["model"].path,
+            tmp,
+            self.workers or None,
+        )
+        seconds = time.perf_counter() - start
+        if os.path.isdir(output_dir):
+            shutil.rmtree(output_dir)
+        os.replace(tmp, output_dir)
+        self.trigger_event(ROWS_PROCESSED, self, rows, rows)
+        print(
+            "Scored %d rows in %.2fs (%.0f rows/s) to %s"
+            % (rows, seconds, rows / seconds, output_dir)
+        )
@@ -0,0 +1,211 @@
+"""Content-addressed completion of pipeline stages.
+
+Luigi considers a task complete as soon as its output exists, so stale outputs are
+silently reused after the raw data or the code changes. A CachedTask is complete
+only if its outputs exist and were written by a run with the same salt: a hash of
+the task family, its significant parameters, the source of the code it depends on,
+the salts of its requirements and, for external data at the root of the graph, a
+fingerprint of the data itself (the S3 ETag or the sha256 of a local or in-memory file).
+Salts of missing data are not kept, so data uploaded by the same run (UploadRawData)
+salts the tasks reading it.
+
+After every successful run a manifest with the salt and the output paths is written
+to the cache folder. Local outputs are evicted least recently used first once they
+exceed a size limit:
+
+    [cache]
+    path=data/cache
+    max_bytes=1073741824
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+from functools import lru_cache
+
+from botocore.exceptions import ClientError
+from luigi import Config, Event, ExternalTask, IntParameter, LocalTarget, Parameter
+from luigi.contrib.s3 import S3Target
+from luigi.mock import MockTarget
+from luigi.task import flatten
+
+from .execution import ScheduledTask
+from .transfer import file_sha256, split_s3_path
+
+SHARED_RELATIVE_PATH = "data"
+
+
+class cache(Config):
+    """Configuration of the stage cache"""
+
+    path = Parameter(default=os.path.join(SHARED_RELATIVE_PATH, "cache"))
+    max_bytes = IntParameter(default=1024**3)  # size limit of local outputs
+
+
+@lru_cache(maxsize=None)
+def _source_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def data_fingerprint(target):
+    """Returns an identifier of the content of a target: the ETag of S3 objects, the sha256 of local and in-memory files"""
+    if isinstance(target, S3Target):
+        bucket, key = split_s3_path(target.path)
+        try:
+            return target.fs.s3.meta.client.head_object(Bucket=bucket, Key=key)["ETag"]
+        except ClientError:
+            return "missing"
+    if isinstance(target, LocalTarget) and os.path.isfile(target.path):
+        return file_sha256(target.path)
+    if isinstance(target, MockTarget) and target.exists():
+        return hashlib.sha256(target.fs.get_data(target.path)).hexdigest()
+    return "missing"
+
+
+def task_salt(task):
+    """Returns the salt of a task; computed once per task instance when its external data exists"""
+    return _salt(task)[0]
+
+
+def _salt(task):
+    """Returns the salt of a task and whether it is memoized. Salts depending on missing external data
+    are computed again at every call, as the data may be made by a task of the same run (UploadRawData):
+    the run of a dependent task then sees the salt of the data it reads."""
+    salt = getattr(task, "_cache_salt", None)
+    if salt is not None:
+        return salt, True
+    digest = hashlib.sha256(task.get_task_family().encode())
+    params = task.to_str_params(only_significant=True)
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    modules = [inspect.getmodule(type(task))]
+    modules += list(getattr(task, "salt_modules", ()))
+    for module in modules:
+        digest.update(_source_digest(inspect.getsourcefile(module)).encode())
+    final = True
+    if isinstance(task, ExternalTask):
+        for target in flatten(task.output()):
+            fingerprint = data_fingerprint(target)
+            final = final and fingerprint != "missing"
+            digest.update(fingerprint.encode())
+    for requirement in flatten(task.requires()):
+        requirement_salt, requirement_final = _salt(requirement)
+        final = final and requirement_final
+        digest.update(requirement_salt.encode())
+    salt = digest.hexdigest()
+    if final:
+        task._cache_salt = salt
+    return salt, final
+
+
+def manifest_path(task):
+    return os.path.join(cache().path, "manifests", task.task_id + ".json")
+
+
+def read_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp-%d" % os.getpid()
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+class CachedTask(ScheduledTask):
+    """A task that is complete only if its outputs were produced from the current data, code and parameters.
+
+    Modules other than the one defining the task whose code changes the outputs are listed in salt_modules.
+    """
+
+    salt_modules = ()
+
+    def complete(self):
+        if not super().complete():
+            return False
+        path = manifest_path(self)
+        manifest = read_manifest(path)
+        if manifest is None or manifest["salt"] != task_salt(self):
+            return False
+        manifest["last_used"] = time.time()
+        write_manifest(path, manifest)
+        return True
+
+
+@CachedTask.event_handler(Event.SUCCESS)
+def record_manifest(task):
+    """Records the salt and outputs of a successful run"""
+    now = time.time()
+    write_manifest(
+        manifest_path(task),
+        {
+            "task_id": task.task_id,
+            "salt": task_salt(task),
+            "outputs": [target.path for target in flatten(task.output())],
+            "created": now,
+            "last_used": now,
+        },
+    )
+
+
+def _local_size(path):
+    """Returns the bytes of a local file or of all files of a local folder"""
+    if os.path.isdir(path):
+        return sum(
+            _local_size(os.path.join(root, name))
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+    try:
+        return os.path.getsize(path)
+    except OSError:  # not local or already removed
+        return 0
+
+
+def evict(max_bytes=None, cache_path=None):
+    """Removes the local outputs and manifests of the least recently used stages until
+    the outputs take at most max_bytes. Returns the number of bytes freed."""
+    max_bytes = cache().max_bytes if max_bytes is None else max_bytes
+    directory = os.path.join(cache_path or cache().path, "manifests")
+    if not os.path.isdir(directory):
+        return 0
+    manifests = []
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            path = os.path.join(directory, name)
+            manifest = read_manifest(path)
+            if manifest is not None:
+                manifests.append((manifest["last_used"], path, manifest["outputs"]))
+    manifests.sort()
+
+    sizes = {
+        output: _local_size(output) for _, _, outputs in manifests for output in outputs
+    }
+    total = sum(sizes.values())
+    freed = 0
+    for _, path, outputs in manifests:
+        if total <= max_bytes:
+            break
+        if not any(sizes[output] for output in outputs):
+            continue  # nothing local to free
+        os.remove(path)
+        for output in outputs:
+            if not sizes[output]:
+                continue
+            if os.path.isdir(output):
+                shutil.rmtree(output)
+            else:
+                os.remove(output)
+            total -= sizes[output]
+            freed += sizes[output]
+            sizes[output] = 0
+    return freed
@@ -1,18 +1,76 @@
+import argparse
+import os
+import time
+
 from luigi import build
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.linear_model import LogisticRegression
 
-from .load_data import DownloadRawData, UploadRawData
-from .testperformance_model import TestModel
+from .caching import evict
+from .execution import configure
+from .experiment import (
+    DEFAULT_EXPERIMENT,
+    experiment_tasks,
+    load_experiment,
+    parse_experiment,
+    zoo_tasks,
+)
+from .profiling import profiling, read_records, summary_table, write_chrome_trace
+from .report import wait_for_renders
 
 
-def main():
-    build(
-        [
-            UploadRawData(),
-            DownloadRawData(),
-            TestModel(model=RandomForestClassifier, source_test="test"),
-            TestModel(model=LogisticRegression, source_test="test"),
-        ],
-        local_scheduler=True,
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="final_project")
+    parser.add_argument(
+        "--zoo",
+        action="store_true",
+        help="train the models in parallel in a process pool before testing them",
+    )
+    parser.add_argument(
+        "--config",
+        help="experiment file with the models, data and workers to run "
+        "(default: experiment.yaml if it exists)",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="number of workers, overriding the experiment"
     )
+    parser.add_argument(
+        "--scheduler-url",
+        help="url of a central luigi scheduler (luigid) to run the tasks with, "
+        "instead of the local scheduler (see the execution module)",
+    )
+    args = parser.parse_args(argv)
+    if args.config:
+        experiment = load_experiment(args.config)
+    elif os.path.isfile("experiment.yaml"):
+        experiment = load_experiment("experiment.yaml")
+    else:
+        experiment = parse_experiment(DEFAULT_EXPERIMENT)
+    workers = args.workers or experiment["workers"]
+    if args.scheduler_url:
+        scheduler = {"scheduler_url": args.scheduler_url}
+    else:
+        scheduler = {"local_scheduler": True}
+    configure(local_scheduler=not args.scheduler_url)
+    started = time.time()
+
+    if args.zoo:
+        build(zoo_tasks(experiment), workers=workers, **scheduler)
+    build(experiment_tasks(experiment), workers=workers, **scheduler)
+    seconds = time.time() - started
+    freed = evict()
+    if freed:
+        print("Evicted %.1f MB of least recently used outputs" % (freed / 1024 ** 2))
+
+    records = read_records(since=started)
+    if records:
+        trace_path = os.path.join(profiling().path, "trace.json")
+        write_chrome_trace(records, trace_path)
+        print(summary_table(records))
+        task_seconds = sum(record["wall_seconds"] for record in records)
+        print(
+            "%.1fs of task time ran in %.1fs: %.1fx faster than one task at a time"
+            % (task_seconds, seconds, task_seconds / seconds)
+        )
+        print("Chrome trace of this run written to", trace_path)
+    # Reports of this run, made in this process or in forked workers, may still be rendering their png
+    if not wait_for_renders(since=started):
+        print("Rendering the png of a report failed, see the errors above")
@@ -0,0 +1,131 @@
+"""Estimators referred to by dotted path, so tasks can pass them around as strings.
+
+A ModelSpec is an estimator class with its hyperparameters. ModelSpecParameter
+serializes it to canonical json, for example
+
+    {"estimator":"sklearn.linear_model.LogisticRegression","params":{"C":0.5}}
+
+so that the task id is the same in every process and on every machine, and tasks
+can be given models on the command line and in experiment files. A plain dotted
+path or an estimator class is accepted too.
+"""
+
+import hashlib
+import importlib
+import json
+
+from luigi import Parameter
+
+
+def import_estimator(path):
+    """Returns the estimator class of a dotted path such as sklearn.linear_model.LogisticRegression"""
+    module, _, name = path.rpartition(".")
+    return getattr(importlib.import_module(module), name)
+
+
+def public_path(estimator):
+    """Returns the shortest dotted path of an estimator class, e.g. sklearn.ensemble.RandomForestClassifier
+    rather than sklearn.ensemble._forest.RandomForestClassifier"""
+    parts = estimator.__module__.split(".")
+    for end in range(1, len(parts) + 1):
+        module = importlib.import_module(".".join(parts[:end]))
+        if getattr(module, estimator.__name__, None) is estimator:
+            return module.__name__ + "." + estimator.__name__
+    return estimator.__module__ + "." + estimator.__name__
+
+
+def model_name(path, params):
+    """Returns the class name, suffixed by a short hash of the hyperparameters if there are any"""
+    name = path.rpartition(".")[2]
+    if params:
+        digest = hashlib.sha1(
+            json.dumps(dict(params), sort_keys=True).encode()
+        ).hexdigest()
+        name += "_" + digest[:8]
+    return name
+
+
+class ModelSpec:
+    """An estimator class, given by its public dotted path, and its hyperparameters"""
+
+    def __init__(self, path, params=None):
+        self.path = public_path(import_estimator(path))
+        self.params = dict(params or {})
+
+    @classmethod
+    def of(cls, value):
+        """Returns the ModelSpec of a ModelSpec, an estimator class, a dict with estimator
+        and params keys, or a string holding a dotted path or such a dict as json"""
+        if isinstance(value, ModelSpec):
+            return value
+        if isinstance(value, type):
+            return cls(public_path(value))
+        if isinstance(value, str):
+            if not value.lstrip().startswith("{"):
+                return cls(value.strip())
+            value = json.loads(value)
+        if isinstance(value, dict):
+            unknown = set(value) - {"estimator", "params"}
+            if unknown:
+                raise ValueError("Unknown model spec keys: %s" % sorted(unknown))
+            return cls(value["estimator"], value.get("params"))
+        raise TypeError("Cannot make a model spec of %r" % (value,))
+
+    @property
+    def estimator(self):
+        return import_estimator(self.path)
+
+    @property
+    def name(self):
+        """Name of the model in outputs and the run registry, see model_name"""
+        return model_name(self.path, self.params)
+
+    def to_json(self):
+        return json.dumps(
+            {"estimator": self.path, "params": self.params},
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, ModelSpec) and self.to_json() == other.to_json()
+
+    def __hash__(self):
+        return hash(self.to_json())
+
+    def __repr__(self):
+        return self.to_json()
+
+
+class ModelSpecParameter(Parameter):
+    """Parameter whose value is a ModelSpec, serialized as canonical json"""
+
+    def parse(self, x):
+        return ModelSpec.of(x)
+
+    def normalize(self, x):
+        return ModelSpec.of(x)
+
+    def serialize(self, x):
+        return ModelSpec.of(x).to_json()
+
+
+class ModelSpecListParameter(Parameter):
+    """Parameter whose value is a tuple of ModelSpecs, serialized as a json list of canonical specs"""
+
+    def parse(self, x):
+        return self.normalize(json.loads(x))
+
+    def normalize(self, x):
+        return tuple(ModelSpec.of(value) for value in x)
+
+    def serialize(self, x):
+        return "[" + ",".join(ModelSpec.of(value).to_json() for value in x) + "]"
+
+
+def models_digest(models):
+    """Returns a short hash of a list of models (model specs or values accepted by ModelSpec.of), which names
+    the outputs made from all of them"""
+    return hashlib.sha1(
+        ModelSpecListParameter().serialize(models).encode()
+    ).hexdigest()[:8]
@@ -0,0 +1,328 @@
+"""Evaluation of several models on one test matrix, with bootstrap confidence intervals.
+
+The test data is read once from the feature store, and the probabilities of every model are stacked into a
+(models, rows) matrix, from which all metrics are computed with vectorized NumPy:
+ROC-AUC, PR-AUC (average precision), accuracy, the Brier score, the confusion
+matrix at threshold 0.5, a reliability curve with the expected calibration error
+(ECE), and precision, recall, F1 and accuracy at every threshold of a grid.
+
+A bootstrap replicate is a row of counts, how often every test row was drawn. All
+metrics are computed from counts as weights, so the counts of a chunk of replicates
+are drawn once and shared by all models: accuracy and Brier score of all models are
+one matrix product, and the curves of a model one cumulative sum over its rows
+sorted by probability. Chunks of replicates are spread over worker processes; every
+chunk draws from its own seed, so the intervals only depend on seed, not on the
+number of workers.
+"""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from luigi import FloatParameter, IntParameter, LocalTarget, Parameter
+
+from .caching import CachedTask
+from .estimators import ModelSpecListParameter, models_digest
+from .events import ROWS_PROCESSED
+from .features import BuildFeatures, FeatureSet
+from .load_data import data_output_path
+from .model_io import LazyModel
+from .profiling import span
+from .registry import data_hash, get_registry
+from .train import Train
+
+SHARED_RELATIVE_PATH = "data"
+THRESHOLDS = np.linspace(0, 1, 101)
+CALIBRATION_BINS = 10
+CHUNK_CELLS = 2**22  # replicates x rows of counts per chunk, 32 MB
+
+
+def ranking_metrics(y, scores, weights):
+    """Returns the ROC-AUC and the average precision of scores (n_rows,) of labels y (0 or 1) for every row
+    of weights (n_replicates, n_rows); nan where a replicate lacks one of the classes"""
+    order = np.argsort(-scores, kind="mergesort")
+    scores, weights = scores[order], weights[:, order]
+    positives = weights * y[order]
+    negatives = weights - positives
+    ends = np.flatnonzero(np.diff(scores))
+    tied = len(ends) < len(scores) - 1
+    if tied:
+        # Tied scores form one point of the curves: sum the weights of each group of ties
+        starts = np.r_[0, ends + 1]
+        positives = np.add.reduceat(positives, starts, axis=1)
+        negatives = np.add.reduceat(negatives, starts, axis=1)
+        weights = positives + negatives
+    tp = np.cumsum(positives, axis=1)
+    n_positive, n_negative = tp[:, -1], negatives.sum(axis=1)
+    # Area under the ROC curve by the trapezoidal rule: every negative weight times the positives ranked
+    # above it, plus half the positives tied with it (Mann-Whitney U)
+    area = np.einsum("ij,ij->i", negatives, tp)
+    if tied:
+        area -= np.einsum("ij,ij->i", negatives, positives) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        roc_auc = area / (n_positive * n_negative)
+        # Precision at every point, weighted by the recall it adds
+        seen = np.cumsum(weights, axis=1)
+        precision = np.divide(tp, seen, out=np.zeros_like(tp), where=seen > 0)
+        average_precision = np.einsum("ij,ij->i", positives, precision) / n_positive
+    return roc_auc, average_precision
+
+
+def threshold_metrics(y, scores, thresholds=THRESHOLDS):
+    """Returns the confusion counts, precision, recall, F1 and accuracy of predicting the positive class for
+    scores >= threshold, for every model (row of scores) and threshold, as a DataFrame
+    """
+    y = y.astype(bool)
+    n_positive = y.sum()
+    frames = []
+    for model, score in enumerate(scores):
+        positive = np.sort(score[y])
+        negative = np.sort(score[~y])
+        tp = len(positive) - np.searchsorted(positive, thresholds, side="left")
+        fp = len(negative) - np.searchsorted(negative, thresholds, side="left")
+        frames.append(
+            pd.DataFrame(
+                {
+                    "model": model,
+                    "threshold": thresholds,
+                    "tp": tp,
+                    "fp": fp,
+                    "fn": n_positive - tp,
+                    "tn": len(negative) - fp,
+                }
+            )
+        )
+    df = pd.concat(frames, ignore_index=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["precision"] = (df["tp"] / (df["tp"] + df["fp"])).fillna(1.0)
+        df["recall"] = df["tp"] / max(n_positive, 1)
+        df["f1"] = 2 * df["tp"] / (2 * df["tp"] + df["fp"] + df["fn"])
+    df["accuracy"] = (df["tp"] + df["tn"]) / len(y)
+    return df
+
+
+def calibration(y, scores, bins=CALIBRATION_BINS):
+    """Returns the rows, mean probability and fraction of positives per probability bin, shapes (models, bins),
+    and the expected calibration error of every model"""
+    n_models, n_rows = scores.shape
+    index = np.minimum((scores * bins).astype(np.intp), bins - 1)
+    index += np.arange(n_models)[:, np.newaxis] * bins
+    size = n_models * bins
+    counts = np.bincount(index.ravel(), minlength=size).reshape(n_models, bins)
+    sums = np.bincount(index.ravel(), scores.ravel(), size).reshape(n_models, bins)
+    labels = np.broadcast_to(y, scores.shape).ravel().astype(np.float64)
+    hits = np.bincount(index.ravel(), labels, size).reshape(n_models, bins)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_predicted = sums / counts
+        fraction_positive = hits / counts
+    ece = np.nansum(counts * np.abs(fraction_positive - mean_predicted), axis=1)
+    return counts, mean_predicted, fraction_positive, ece / n_rows
+
+
+def replicate_metrics(y, scores, weights):
+    """Returns {metric: array (replicates, models)} of accuracy, Brier score, ROC-AUC and PR-AUC for every row
+    of weights (counts of the test rows in each replicate)"""
+    n = weights.sum(axis=1, keepdims=True)
+    correct = ((scores > 0.5) == y).T.astype(np.float64)
+    squared_error = ((scores - y) ** 2).T
+    metrics = {
+        "accuracy": weights @ correct / n,
+        "brier": weights @ squared_error / n,
+    }
+    ranking = [ranking_metrics(y, score, weights) for score in scores]
+    metrics["roc_auc"] = np.column_stack([auc for auc, _ in ranking])
+    metrics["pr_auc"] = np.column_stack([ap for _, ap in ranking])
+    return metrics
+
+
+def _bootstrap_chunk(y, scores, seed, chunk, replicates):
+    """Draws replicates bootstrap samples from the seed of the chunk and returns their metrics"""
+    n_rows = len(y)
+    rng = np.random.default_rng([seed, chunk])
+    index = rng.integers(0, n_rows, size=(replicates, n_rows))
+    index += np.arange(replicates)[:, np.newaxis] * n_rows
+    weights = np.bincount(index.ravel(), minlength=replicates * n_rows)
+    weights = weights.reshape(replicates, n_rows).astype(np.float64)
+    return replicate_metrics(y, scores, weights)
+
+
+def bootstrap(y, scores, n_bootstrap=1000, seed=0, max_workers=None):
+    """Returns {metric: array (n_bootstrap, models)} of bootstrap replicates of the metrics of all models"""
+    chunk_size = max(1, min(n_bootstrap, CHUNK_CELLS // len(y)))
+    chunks = [
+        (chunk, min(chunk_size, n_bootstrap - start))
+        for chunk, start in enumerate(range(0, n_bootstrap, chunk_size))
+    ]
+    if len(chunks) == 1 or max_workers == 1:
+        results = [_bootstrap_chunk(y, scores, seed, *chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(_bootstrap_chunk, y, scores, seed, *chunk)
+                for chunk in chunks
+            ]
+            results = [future.result() for future in futures]
+    return {
+        metric: np.concatenate([result[metric] for result in results])
+        for metric in results[0]
+    }
+
+
+def evaluate(names, y, scores, n_bootstrap=1000, alpha=0.05, seed=0, max_workers=None):
+    """Evaluates models (names) from their probabilities of the positive class, shape (models, rows), for
+    labels y (0 or 1). Returns a json-ready report and the threshold metrics as a DataFrame.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    scores = np.asarray(scores, dtype=np.float64)
+    point = replicate_metrics(y, scores, np.ones((1, len(y))))
+    counts, mean_predicted, fraction_positive, ece = calibration(y, scores)
+    thresholds = threshold_metrics(y, scores)
+    predicted = scores > 0.5
+    positive = y.astype(bool)
+    report = {"rows": len(y), "n_bootstrap": n_bootstrap, "alpha": alpha, "models": {}}
+    intervals = {}
+    if n_bootstrap:
+        replicates = bootstrap(y, scores, n_bootstrap, seed, max_workers)
+        q = [100 * alpha / 2, 100 * (1 - alpha / 2)]
+        intervals = {
+            metric: np.nanpercentile(values, q, axis=0)
+            for metric, values in replicates.items()
+        }
+    for i, name in enumerate(names):
+        metrics = {metric: float(values[0, i]) for metric, values in point.items()}
+        metrics["ece"] = float(ece[i])
+        metrics["confusion_matrix"] = [
+            [
+                int(np.sum(~positive & ~predicted[i])),
+                int(np.sum(~positive & predicted[i])),
+            ],
+            [
+                int(np.sum(positive & ~predicted[i])),
+                int(np.sum(positive & predicted[i])),
+            ],
+        ]
+        metrics["calibration"] = {
+            "count": counts[i].tolist(),
+            "mean_predicted": np.nan_to_num(mean_predicted[i]).tolist(),
+            "fraction_positive": np.nan_to_num(fraction_positive[i]).tolist(),
+        }
+        metrics["intervals"] = {
+            metric: bounds[:, i].tolist() for metric, bounds in intervals.items()
+        }
+        report["models"][name] = metrics
+    thresholds["model"] = np.asarray(names)[thresholds["model"].values]
+    return report, thresholds
+
+
+class Evaluate(CachedTask):
+    """Takes data, source_train, source_test and models (a list of model specs, see estimators) as parameters.
+    Scores all models on one in-memory copy of the test data (see the module docstring) and saves a json report
+    with metrics and bootstrap confidence intervals and a csv of metrics per threshold to the local folder of the
+    data, named after source_test and a hash of the models.
+    """
+
+    data = Parameter(default="heart.csv")
+    source_train = Parameter(default="train")
+    source_test = Parameter(default="test")
+    models = ModelSpecListParameter(
+        default=[
+            "sklearn.ensemble.RandomForestClassifier",
+            "sklearn.linear_model.LogisticRegression",
+        ]
+    )
+    n_bootstrap = IntParameter(default=1000)
+    alpha = FloatParameter(default=0.05)
+    seed = IntParameter(default=0)
+    workers = IntParameter(default=0, significant=False)  # 0: all cores
+
+    def cores(self):
+        return self.workers or os.cpu_count()
+
+    def requires(self):
+        return {
+            "models": [
+                Train(self.data, self.source_train, model) for model in self.models
+            ],
+            "test_data": BuildFeatures(self.data),
+        }
+
+    def output(self):
+        # Evaluations of other data files or lists of models run at the same time
+        path = data_output_path(
+            self.data,
+            "evaluation_" + self.source_test + "_" + models_digest(self.models),
+        )
+        return {
+            "report": LocalTarget(path + ".json"),
+            "thresholds": LocalTarget(path + "_thresholds.csv"),
+        }
+
+    def run(self):
+        features = FeatureSet(self.input()["test_data"].path)
+        y_test = features.target(self.source_test)
+        x_test = features.matrix(self.source_test)
+        names, scores = [], []
+        for model, target in zip(self.models, self.input()["models"]):
+            loaded_model = LazyModel(target.path)
+            with span("predict " + model.name, rows=len(x_test)):
+                # Columns in the order the model was fitted on, from the memory-mapped test matrix
+                x = features.matrix(self.source_test, loaded_model.feature_names)
+                compiled = loaded_model.compiled
+                if compiled is not None:
+                    proba = compiled.predict_proba(x)
+                else:
+                    frame = pd.DataFrame(x, columns=loaded_model.feature_names)
+                    proba = loaded_model.predict_proba(frame)
+            positive = list(loaded_model.classes_).index(1)
+            names.append(model.name)
+            scores.append(proba[:, positive])
+        with span("evaluate", rows=len(x_test)):
+            report, thresholds = evaluate(
+                names,
+                y_test == 1,
+                np.vstack(scores),
+                self.n_bootstrap,
+                self.alpha,
+                self.seed,
+                self.workers or None,
+            )
+        test_hash = data_hash(x_test, y_test)
+        for name, target in zip(names, self.input()["models"]):
+            get_registry().record(
+                name,
+                "evaluate",
+                report["models"][name]["roc_auc"],
+                data_hash=test_hash,
+                artifact_path=target.path,
+            )
+        self.output()["thresholds"].makedirs()
+        thresholds.to_csv(self.output()["thresholds"].path, index=False)
+        with self.output()["report"].open("w") as f:
+            json.dump(report, f, indent=2)
+        self.trigger_event(ROWS_PROCESSED, self, len(x_test))
+        self.show_report(report)
+
+    def show_report(self, report):
+        """Prints the main metrics of every model with their confidence intervals"""
+        print("***********************")
+        print("Evaluation on %d %s rows:" % (report["rows"], self.source_test))
+        for name, metrics in report["models"].items():
+            print(
+                name,
+                ", ".join(
+                    "%s %.3f %s"
+                    % (
+                        metric,
+                        metrics[metric],
+                        (
+                            "[%.3f, %.3f]" % tuple(metrics["intervals"][metric])
+                            if metric in metrics["intervals"]
+                            else ""
+                        ),
+                    )
+                    for metric in ("roc_auc", "pr_auc", "accuracy", "brier", "ece")
+                ),
+            )
+        print("***********************")
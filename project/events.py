@@ -0,0 +1,152 @@
+"""Publishes luigi task events to a Django Channels layer for the live pipeline dashboard.
+
+Task start, success and failure (with duration), rows processed and model scores
+are put on a bounded in-process queue and sent to the channel group by a daemon
+thread, so tasks never wait for the channel layer; when the queue is full, events
+are dropped and counted. Publishing is off unless a channel layer is configured:
+
+    [events]
+    backend=channels_redis.core.RedisChannelLayer
+    hosts=["redis://127.0.0.1:6379"]
+
+The Visualizer must use the same layer (REDIS_URL) to receive the events of a
+pipeline running in another process. channels.layers.InMemoryChannelLayer only
+reaches consumers of the same process and is meant for local testing.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from importlib import import_module
+from multiprocessing import util
+
+from luigi import Config, Event, IntParameter, ListParameter, Parameter, Task
+
+logger = logging.getLogger("luigi-interface")
+
+# Triggered by tasks with the number of rows they read and, optionally, wrote
+ROWS_PROCESSED = "event.final_project.rows_processed"
+
+
+class events(Config):
+    """Configuration of the pipeline event publisher"""
+
+    # Dotted path of a channel layer class; empty disables publishing
+    backend = Parameter(default="")
+    hosts = ListParameter(default=[])  # for layers that need them, like Redis
+    group = Parameter(default="pipeline")
+    capacity = IntParameter(default=10000)  # buffered events before dropping
+
+
+def import_layer(backend, hosts=()):
+    module, _, name = backend.rpartition(".")
+    layer_class = getattr(import_module(module), name)
+    return layer_class(hosts=list(hosts)) if hosts else layer_class()
+
+
+class EventPublisher:
+    """Sends events put by publish() to a channel group from a background thread"""
+
+    def __init__(self, layer, group="pipeline", capacity=10000):
+        self.layer = layer
+        self.group = group
+        self.queue = queue.Queue(capacity)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def publish(self, event):
+        """Buffers an event without waiting"""
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        while True:
+            event = self.queue.get()
+            try:
+                loop.run_until_complete(
+                    self.layer.group_send(
+                        self.group, {"type": "pipeline.event", "event": event}
+                    )
+                )
+            except Exception:
+                logger.exception("Could not publish pipeline event %s", event)
+            finally:
+                self.queue.task_done()
+
+    def flush(self, timeout=2.0):
+        """Waits at most timeout seconds until all buffered events are sent"""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+_publisher = None
+_publisher_pid = None
+_started = {}  # task id -> start time
+
+
+def get_publisher():
+    """Returns the publisher of this process, or None if publishing is off"""
+    global _publisher, _publisher_pid
+    config = events()
+    if not config.backend:
+        return None
+    # luigi runs tasks in forked worker processes, which do not inherit threads
+    if _publisher_pid != os.getpid():
+        _publisher = EventPublisher(
+            import_layer(config.backend, config.hosts), config.group, config.capacity
+        )
+        _publisher_pid = os.getpid()
+        atexit.register(_publisher.flush)
+        # Worker processes exit without atexit handlers, but run multiprocessing finalizers
+        util.Finalize(None, _publisher.flush, exitpriority=10)
+    return _publisher
+
+
+def publish(kind, **fields):
+    """Publishes an event of the given kind, e.g. publish("scores", stage="train", scores={...})"""
+    publisher = get_publisher()
+    if publisher is not None:
+        publisher.publish(dict(fields, kind=kind, time=time.time(), pid=os.getpid()))
+
+
+def _task_fields(task):
+    return {
+        "task_id": task.task_id,
+        "task_family": task.get_task_family(),
+        "params": task.to_str_params(only_significant=True),
+    }
+
+
+@Task.event_handler(Event.START)
+def on_start(task):
+    _started[task.task_id] = time.time()
+    publish("start", **_task_fields(task))
+
+
+@Task.event_handler(Event.SUCCESS)
+def on_success(task):
+    start = _started.pop(task.task_id, None)
+    duration = None if start is None else time.time() - start
+    publish("success", duration=duration, **_task_fields(task))
+
+
+@Task.event_handler(Event.FAILURE)
+def on_failure(task, exception):
+    start = _started.pop(task.task_id, None)
+    duration = None if start is None else time.time() - start
+    publish("failure", duration=duration, error=repr(exception), **_task_fields(task))
+
+
+@Task.event_handler(ROWS_PROCESSED)
+def on_rows_processed(task, rows, rows_out=None):
+    rows_out = None if rows_out is None else int(rows_out)
+    publish("rows", rows=int(rows), rows_out=rows_out, **_task_fields(task))
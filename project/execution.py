@@ -0,0 +1,261 @@
+"""Scheduling of the pipeline: resources, retries and a central luigi scheduler.
+
+`python -m final_project` runs its tasks on luigi's local scheduler. With
+--scheduler-url they are sent to a central scheduler (luigid) instead, and any number
+of such processes, on one host or several hosts sharing the data folder, work
+through the same task graph: every task runs once, in whichever worker gets it first.
+
+Tasks declare the cores they use (their n_jobs or worker processes) and the memory
+they reserve as luigi resources, so the scheduler never runs more of them at once
+than the capacity given in the [resources] section. Resources of a central scheduler
+are shared by all its workers: luigid and the workers read the same [resources]
+section, set to the total of all hosts. Without a [resources] section tasks declare
+nothing; the local scheduler of `python -m final_project` uses the cores and
+memory of the machine. The memory of a task family is set in [execution]
+memory_mb, else taken from the largest peak RSS profiling recorded for it:
+
+    [resources]
+    cpu=16
+    memory_mb=32000
+
+    [execution]
+    memory_mb={"Train": 4000}
+    retry_count=3
+    retry_delay=30
+    attempts=4
+    backoff_seconds=1
+
+The scheduler retries a failed task retry_count times, retry_delay seconds apart
+(luigid takes the delay from its own [scheduler] retry_delay, and retries only when it
+prunes its state: once a minute, or at every request with prune_on_get_work=true),
+and workers wait for the retries; missing external data (RawData) is checked again at
+every retry, so raw data uploaded by the same run is found, and given up after
+retry_count checks like a failed task. Runs of the tasks reading or writing S3 that
+fail with a transient S3 error are first repeated in the worker, up to attempts times
+with exponential backoff.
+"""
+
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from functools import wraps
+from tempfile import TemporaryDirectory
+
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+from luigi import Config, DictParameter, FloatParameter, IntParameter, Task
+from luigi.configuration import get_config
+
+from .profiling import profiling, read_records
+
+logger = logging.getLogger("luigi-interface")
+
+# Error codes of S3 requests that are worth retrying
+TRANSIENT_CODES = {
+    "InternalError",
+    "RequestTimeout",
+    "ServiceUnavailable",
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+    "500",
+    "503",
+}
+
+
+class execution(Config):
+    """Configuration of resources and retries"""
+
+    memory_mb = DictParameter(default={})  # task family -> MB reserved by its tasks
+    retry_count = IntParameter(default=3)  # failures after which a task is disabled
+    retry_delay = FloatParameter(default=30.0)  # seconds between scheduler retries
+    attempts = IntParameter(default=3)  # tries of a run failing with transient errors
+    backoff_seconds = FloatParameter(default=0.5)  # first backoff, doubled every try
+
+
+def capacity():
+    """Returns the resources configured in the [resources] section"""
+    return get_config().getintdict("resources")
+
+
+def machine_capacity():
+    """Returns the cores and the physical memory in MB of this machine"""
+    resources = {"cpu": os.cpu_count() or 1}
+    try:
+        pages = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        resources["memory_mb"] = pages // 1024**2
+    except (AttributeError, ValueError, OSError):
+        pass
+    return resources
+
+
+_peaks = {}  # tasks.jsonl path -> (size, {task family: peak RSS in MB})
+
+
+def recorded_peak_mb(task_family):
+    """Returns the largest peak RSS recorded by profiling for a task family, or None"""
+    path = os.path.join(profiling().path, "tasks.jsonl")
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    if _peaks.get(path, (None,))[0] != size:
+        peaks = {}
+        for record in read_records():
+            family, peak = record["task_family"], record.get("peak_rss_mb")
+            if peak is not None and peak > peaks.get(family, 0):
+                peaks[family] = peak
+        _peaks[path] = size, peaks
+    return _peaks[path][1].get(task_family)
+
+
+def task_resources(task_family, cores):
+    """Returns the luigi resources of a task using cores cores, capped at the configured capacity"""
+    available = capacity()
+    resources = {}
+    if "cpu" in available:
+        resources["cpu"] = max(1, min(cores, available["cpu"]))
+    if "memory_mb" in available:
+        memory = execution().memory_mb.get(task_family) or recorded_peak_mb(task_family)
+        if memory:
+            resources["memory_mb"] = max(1, min(int(memory), available["memory_mb"]))
+    return resources
+
+
+class ScheduledTask(Task):
+    """A task declaring the cores and memory it uses, retried by the scheduler when it fails"""
+
+    def cores(self):
+        """Returns the number of cores the run uses at most"""
+        return 1
+
+    @property
+    def resources(self):
+        return task_resources(self.get_task_family(), self.cores())
+
+    @property
+    def retry_count(self):
+        return execution().retry_count
+
+
+def is_transient(error):
+    """Tells whether an error of a storage call may go away when the call is repeated"""
+    if isinstance(error, (ConnectionError, HTTPClientError)):
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in TRANSIENT_CODES
+    return False
+
+
+def retry_transient(func):
+    """Decorator repeating a function (such as the run of a task) that fails with a transient storage error,
+    with exponential backoff and jitter"""
+
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        config = execution()
+        for attempt in range(1, config.attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= config.attempts or not is_transient(e):
+                    raise
+                delay = config.backoff_seconds * 2 ** (attempt - 1)
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning(
+                    "%s failed with %r, try %d of %d in %.1fs",
+                    func.__qualname__,
+                    e,
+                    attempt + 1,
+                    config.attempts,
+                    delay,
+                )
+                time.sleep(delay)
+
+    return wrapped
+
+
+def _set_default(section, option, value):
+    config = get_config()
+    if not config.has_section(section):
+        config.add_section(section)
+    if not config.has_option(section, option):
+        config.set(section, option, str(value))
+
+
+def configure(local_scheduler=True, resources=None):
+    """Fills in the scheduling options of the luigi config that are not set: the capacity (resources,
+    by default that of this machine for the local scheduler), the retry delay of the local scheduler
+    and workers waiting for retries, which check again whether missing external data appeared"""
+    if resources is None and local_scheduler and not capacity():
+        resources = machine_capacity()
+    for name, amount in (resources or {}).items():
+        _set_default("resources", name, amount)
+    if local_scheduler:
+        _set_default("scheduler", "retry_delay", execution().retry_delay)
+    if execution().retry_count:
+        _set_default("worker", "keep_alive", "true")
+        # Else a worker waits forever for raw data uploaded by a task of the same run
+        _set_default("worker", "retry_external_tasks", "true")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def central_scheduler(resources=None, retry_delay=None, port=None, timeout=30.0):
+    """Runs luigid on this machine while the block runs and yields its url.
+    resources is its capacity, which its workers should configure too (see configure).
+    """
+    port = port or free_port()
+    with TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "luigi.cfg")
+        with open(config_path, "w") as f:
+            f.write("[scheduler]\n")
+            f.write("retry_delay=%s\n" % (retry_delay or execution().retry_delay))
+            f.write("state_path=%s\n" % os.path.join(tmp, "state.pickle"))
+            # Failed tasks become pending again when the scheduler is pruned, by default once a minute
+            f.write("prune_on_get_work=true\n")
+            if resources:
+                f.write("[resources]\n")
+                for name, amount in resources.items():
+                    f.write("%s=%d\n" % (name, amount))
+        # The scheduler reads its options and capacity from the config file
+        env = dict(os.environ, LUIGI_CONFIG_PATH=config_path)
+        with open(os.path.join(tmp, "luigid.log"), "w") as log:
+            process = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-c",
+                    "from luigi.cmdline import luigid; luigid()",
+                    "--port",
+                    str(port),
+                    "--address",
+                    "127.0.0.1",
+                ],
+                env=env,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(
+                        "luigid exited with code %d" % process.returncode
+                    )
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError("luigid did not start in %ss" % timeout)
+                    time.sleep(0.1)
+            yield "http://127.0.0.1:%d" % port
+        finally:
+            process.terminate()
+            process.wait()
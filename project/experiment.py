@@ -0,0 +1,84 @@
+"""Experiments: the models, data and number of workers of a pipeline run, declared in YAML.
+
+    data: heart.csv             # a file name or a list of them
+    workers: 2                  # luigi worker processes
+    models:
+      - sklearn.ensemble.RandomForestClassifier
+      - estimator: sklearn.linear_model.LogisticRegression
+        params: {C: 0.5, max_iter: 1000}
+
+Every model is trained and tested on every data file, and all models are evaluated
+and reported together on it (see evaluation and report). Models become ModelSpecs (see estimators), so the
+tasks of an experiment have the same ids in every worker process. With zoo_tasks the
+models are first trained in parallel (see zoo).
+"""
+
+import yaml
+
+from .estimators import ModelSpec
+from .load_data import DownloadRawData, UploadRawData
+from .report import Report
+from .testperformance_model import TestModel
+from .zoo import TrainZoo
+
+# The experiment run when no experiment file is given
+DEFAULT_EXPERIMENT = {
+    "data": ["heart.csv"],
+    "workers": 1,
+    "models": [
+        "sklearn.ensemble.RandomForestClassifier",
+        "sklearn.linear_model.LogisticRegression",
+    ],
+}
+
+
+def parse_experiment(config):
+    """Checks an experiment mapping and returns it with a list of data files and a list of ModelSpecs"""
+    unknown = set(config) - set(DEFAULT_EXPERIMENT)
+    if unknown:
+        raise ValueError("Unknown experiment keys: %s" % sorted(unknown))
+    data = config.get("data", DEFAULT_EXPERIMENT["data"])
+    if isinstance(data, str):
+        data = [data]
+    workers = int(config.get("workers", DEFAULT_EXPERIMENT["workers"]))
+    if workers < 1:
+        raise ValueError("An experiment needs at least one worker")
+    models = [ModelSpec.of(model) for model in config.get("models") or []]
+    if not models:
+        raise ValueError("An experiment needs at least one model")
+    names = [model.name for model in models]
+    if len(set(names)) < len(names):
+        raise ValueError("Models are listed more than once: %s" % names)
+    return {"data": list(data), "workers": workers, "models": models}
+
+
+def load_experiment(path):
+    """Reads and checks the experiment file path"""
+    with open(path) as f:
+        return parse_experiment(yaml.safe_load(f) or {})
+
+
+def experiment_tasks(experiment, source_test="test"):
+    """Returns the tasks of an experiment: the raw data transfers, a TestModel per model and data file,
+    and a Report of all models (which requires their Evaluate) per data file"""
+    tasks = []
+    for data in experiment["data"]:
+        tasks += [UploadRawData(data), DownloadRawData(data)]
+        tasks += [
+            TestModel(data=data, model=model, source_test=source_test)
+            for model in experiment["models"]
+        ]
+        tasks.append(
+            Report(data=data, models=experiment["models"], source_test=source_test)
+        )
+    return tasks
+
+
+def zoo_tasks(experiment):
+    """Returns the tasks training all models of an experiment in a process pool: the raw data uploads and a
+    TrainZoo per data file. Built before the tasks of the experiment, the Train tasks find their models trained.
+    """
+    tasks = []
+    for data in experiment["data"]:
+        tasks += [UploadRawData(data), TrainZoo(data=data, models=experiment["models"])]
+    return tasks
@@ -0,0 +1,188 @@
+"""Feature store: the preprocessed features of a data set as versioned float32 matrices.
+
+BuildFeatures writes the preprocessed train and test parts of a data set once to a
+folder of the store. The folder is keyed by the salt of the task (see caching), which
+covers the fingerprint of the raw data and the code and version of the preprocessor,
+so every data and preprocessing version has its own folder:
+
+    data/features/<data>-<key>/
+        x.npy          float32 features, (rows, columns), Fortran order
+        y.npy          int8 labels
+        metadata.json  columns, row ranges of the splits and folds, versions
+
+The rows of every split are sorted by cross-validation fold and the splits follow each
+other, so a split or a fold is a contiguous range of rows; in Fortran order every
+column is contiguous too. FeatureSet opens the files memory-mapped and read-only:
+the rows of a split or fold are a view of the file and a column subset reads only the
+pages of its columns, so Train, TrainZoo, Tune, TestModel and Evaluate share the same
+features through the page cache, without parsing or preprocessing them again.
+"""
+
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+from luigi import IntParameter, LocalTarget, Parameter
+from sklearn.model_selection import StratifiedKFold
+
+from .caching import CachedTask, data_fingerprint, task_salt
+from .events import ROWS_PROCESSED
+from .load_data import RawData
+from .preprocess_data import PreProcessing
+from .preprocess_heart import PREPROCESSOR_VERSION, TARGET_COLUMN
+from .profiling import span
+
+SHARED_RELATIVE_PATH = "data"
+FEATURES_VERSION = 1  # Increase when the layout of the folder changes
+SPLITS = ("train", "test")
+
+
+def stratified_folds(y, n_splits, seed):
+    """Returns the stratified cross-validation fold number of every row"""
+    folds = np.empty(len(y), dtype=np.int8)
+    splitter = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed)
+    for fold, (_, validation) in enumerate(splitter.split(np.zeros(len(y)), y)):
+        folds[validation] = fold
+    return folds
+
+
+class FeatureSet:
+    """Read-only, memory-mapped features of a folder of the feature store"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "metadata.json")) as f:
+            self.metadata = json.load(f)
+        self.columns = self.metadata["columns"]
+        self._positions = {column: i for i, column in enumerate(self.columns)}
+        self.x = np.load(os.path.join(path, "x.npy"), mmap_mode="r")
+        self.y = np.load(os.path.join(path, "y.npy"), mmap_mode="r")
+
+    def rows(self, split, fold=None):
+        """Returns the slice of the rows of a split, or of one fold of it"""
+        start, stop = self.metadata["splits"][split]["rows"]
+        if fold is not None:
+            start, stop = self.metadata["splits"][split]["folds"][fold]
+        return slice(start, stop)
+
+    def folds(self, split):
+        """Returns the fold number of every row of a split"""
+        ranges = self.metadata["splits"][split]["folds"]
+        return np.repeat(
+            np.arange(len(ranges), dtype=np.int8),
+            [stop - start for start, stop in ranges],
+        )
+
+    def matrix(self, split, columns=None, fold=None):
+        """Returns the features of a split or fold as a float32 array; a view of the file unless
+        columns is a subset that is not a contiguous run of the stored columns"""
+        x = self.x[self.rows(split, fold)]
+        if columns is None:
+            return x
+        index = [self._positions[column] for column in columns]
+        if not index:
+            return x[:, :0]
+        if index == list(range(index[0], index[0] + len(index))):
+            return x[:, index[0] : index[0] + len(index)]
+        return x[:, index]
+
+    def target(self, split, fold=None):
+        """Returns the labels of a split or fold"""
+        return self.y[self.rows(split, fold)]
+
+    def frame(self, split, columns=None, fold=None):
+        """Returns the features of a split or fold as a DataFrame, for estimators recording feature names"""
+        return pd.DataFrame(
+            self.matrix(split, columns, fold),
+            columns=list(self.columns if columns is None else columns),
+            copy=False,
+        )
+
+
+def write_features(path, frames, n_splits=5, seed=42, **metadata):
+    """Writes the preprocessed data frames of the splits in frames (split name -> DataFrame) as a folder
+    of the feature store to path, replacing an older folder. Keyword arguments are added to the metadata.
+    Returns the number of rows."""
+    columns = [c for c in next(iter(frames.values())).columns if c != TARGET_COLUMN]
+    n_rows = sum(len(df) for df in frames.values())
+    tmp = path + "-tmp-%d" % os.getpid()
+    os.makedirs(tmp)
+    x = np.lib.format.open_memmap(
+        os.path.join(tmp, "x.npy"),
+        mode="w+",
+        dtype=np.float32,
+        shape=(n_rows, len(columns)),
+        fortran_order=True,
+    )
+    y = np.empty(n_rows, dtype=np.int8)
+    splits = {}
+    start = 0
+    for split, df in frames.items():
+        labels = df[TARGET_COLUMN].values
+        folds = stratified_folds(labels, n_splits, seed)
+        order = np.argsort(folds, kind="stable")
+        stop = start + len(df)
+        for i, column in enumerate(columns):
+            x[start:stop, i] = df[column].values[order]
+        y[start:stop] = labels[order]
+        bounds = start + np.searchsorted(folds[order], np.arange(n_splits + 1))
+        splits[split] = {
+            "rows": [start, stop],
+            "folds": [[int(a), int(b)] for a, b in zip(bounds, bounds[1:])],
+        }
+        start = stop
+    x.flush()
+    del x
+    np.save(os.path.join(tmp, "y.npy"), y)
+    metadata.update(
+        format_version=FEATURES_VERSION,
+        preprocessor_version=PREPROCESSOR_VERSION,
+        columns=columns,
+        dtype="float32",
+        n_splits=n_splits,
+        seed=seed,
+        splits=splits,
+        created=time.time(),
+    )
+    with open(os.path.join(tmp, "metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+    if os.path.isdir(path):  # left by a run whose manifest was evicted
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    return n_rows
+
+
+class BuildFeatures(CachedTask):
+    """Takes data, n_splits and seed (of the cross-validation folds) as parameters. Writes the preprocessed
+    train and test data to a folder of the feature store; open it with FeatureSet(output().path).
+    """
+
+    data = Parameter(default="heart.csv")
+    n_splits = IntParameter(default=5)
+    seed = IntParameter(default=42)
+
+    def requires(self):
+        return {split: PreProcessing(self.data, split) for split in SPLITS}
+
+    def output(self):
+        name = os.path.splitext(self.data)[0] + "-" + task_salt(self)[:16]
+        return LocalTarget(
+            os.path.join(os.path.abspath(SHARED_RELATIVE_PATH), "features", name)
+        )
+
+    def run(self):
+        frames = {split: self.input()[split].read() for split in SPLITS}
+        with span("write features", rows=sum(len(df) for df in frames.values())):
+            n_rows = write_features(
+                self.output().path,
+                frames,
+                self.n_splits,
+                self.seed,
+                data=self.data,
+                dataset=data_fingerprint(RawData(self.data).output()),
+                key=task_salt(self),
+            )
+        self.trigger_event(ROWS_PROCESSED, self, n_rows)
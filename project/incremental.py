@@ -0,0 +1,440 @@
+"""Incremental training on patient records appended as data partitions.
+
+New records arrive as CSV files with the columns of heart.csv, dropped into a
+partitions folder (append_partition writes the next one). Every update reads only
+the partitions that were not consumed yet and
+
+* adds them to running statistics of the continuous columns (count, mean,
+  variance, range and missing values of all rows consumed),
+* transforms them with the preprocessor of the last full rebuild, so that the model
+  always sees features on one scale,
+* scores the current model on them before training on them (a prequential score),
+* updates the model without a refit: estimators with partial_fit (for example
+  SGDClassifier with log_loss, an online logistic regression) take a step on the
+  new rows, forests with warm_start grow trees_per_update new trees on them, and
+  any other estimator is refitted on all rows. New trees need rows of every class:
+  partitions missing one are kept and grown on with the partitions that follow.
+
+The transform and the model are only rebuilt from all partitions, with a newly
+fitted preprocessor, when the data drifted from the data of the last rebuild: when
+the population stability index (PSI) of a continuous column, between the deciles of
+the rebuild rows and the last min_drift_rows or more new rows, exceeds psi_threshold. A partition
+that was modified after it was consumed also causes a rebuild:
+
+    [incremental]
+    psi_threshold=0.2
+    min_drift_rows=200
+    trees_per_update=10
+
+The model folder (see model_io) and a json state with the consumed partitions, the
+preprocessor and the statistics are kept next to each other.
+"""
+
+import glob
+import json
+import logging
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+from luigi import Config, FloatParameter, IntParameter, LocalTarget, Parameter
+from sklearn.metrics import accuracy_score
+
+from .estimators import ModelSpec, ModelSpecParameter
+from .execution import ScheduledTask
+from .model_io import load_model, save_model
+from .preprocess_heart import CONTINUOUS_COLUMNS, TARGET_COLUMN, HeartPreprocessor
+from .registry import get_registry
+from .transfer import file_sha256
+from .zoo import cores_needed
+
+logger = logging.getLogger("luigi-interface")
+
+SHARED_RELATIVE_PATH = "data"
+STATE_VERSION = 1
+# The logistic loss of SGDClassifier, named "log" before scikit-learn 1.1
+SKLEARN_VERSION = tuple(
+    int(part) for part in re.findall(r"\d+", sklearn.__version__)[:2]
+)
+LOG_LOSS = "log_loss" if SKLEARN_VERSION >= (1, 1) else "log"
+DEFAULT_MODEL = {
+    "estimator": "sklearn.linear_model.SGDClassifier",
+    "params": {"loss": LOG_LOSS, "random_state": 0},
+}
+
+
+class incremental(Config):
+    """Configuration of incremental training"""
+
+    psi_threshold = FloatParameter(default=0.2)  # PSI of a column causing a rebuild
+    # new rows compared to the rebuild rows at once
+    min_drift_rows = IntParameter(default=200)
+    trees_per_update = IntParameter(default=10)  # trees grown by warm started forests
+
+
+def list_partitions(folder):
+    """Returns the names of the partition files of folder, in the order they were appended"""
+    return sorted(
+        os.path.basename(path) for path in glob.glob(os.path.join(folder, "*.csv"))
+    )
+
+
+def append_partition(folder, df):
+    """Writes df as the next partition of folder and returns its path"""
+    os.makedirs(folder, exist_ok=True)
+    names = list_partitions(folder)
+    number = int(names[-1].split("-")[1].split(".")[0]) + 1 if names else 0
+    path = os.path.join(folder, "part-%06d.csv" % number)
+    tmp = path + ".tmp-%d" % os.getpid()  # not a partition until renamed
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def population_stability_index(expected, actual, eps=1e-4):
+    """Returns the PSI between two histograms with the same bins"""
+    expected = np.maximum(np.asarray(expected, dtype=np.float64), 0)
+    actual = np.maximum(np.asarray(actual, dtype=np.float64), 0)
+    p = np.clip(expected / max(expected.sum(), 1), eps, None)
+    q = np.clip(actual / max(actual.sum(), 1), eps, None)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def _histogram(values, edges):
+    return np.bincount(
+        np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1
+    )
+
+
+def _merge_moments(stats, values):
+    """Adds the non-missing values to the count, mean, M2, range and missing count of stats (Chan et al.)"""
+    missing = np.isnan(values)
+    values = values[~missing]
+    stats["missing"] += int(missing.sum())
+    if not len(values):
+        return
+    n, mean = len(values), float(values.mean())
+    delta = mean - stats["mean"]
+    total = stats["n"] + n
+    stats["m2"] += (
+        float(((values - mean) ** 2).sum()) + delta**2 * stats["n"] * n / total
+    )
+    stats["mean"] += delta * n / total
+    stats["n"] = total
+    stats["min"] = min(stats["min"], float(values.min()))
+    stats["max"] = max(stats["max"], float(values.max()))
+
+
+def _partition_info(path):
+    return {
+        "size": os.path.getsize(path),
+        "mtime": os.path.getmtime(path),
+        "sha256": file_sha256(path),
+    }
+
+
+def _changed(path, info):
+    """Tells whether a consumed partition was modified since; hashed only if its size or time changed"""
+    if not os.path.exists(path):
+        return True
+    if (
+        os.path.getsize(path) == info["size"]
+        and os.path.getmtime(path) == info["mtime"]
+    ):
+        return False
+    return file_sha256(path) != info["sha256"]
+
+
+def _read_partitions(folder, names):
+    frames = [pd.read_csv(os.path.join(folder, name)) for name in names]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def _features(preprocessor, df):
+    df = preprocessor.transform(df, remove_outliers=True)
+    return df[preprocessor.feature_columns], df[TARGET_COLUMN]
+
+
+class IncrementalModel:
+    """A model and its incremental training state, kept in the folder path and the json file path + ".json" """
+
+    def __init__(self, path, spec):
+        self.path = path
+        self.spec = ModelSpec.of(spec)
+        self.state = None
+        self.clf = None
+
+    @property
+    def state_path(self):
+        return self.path + ".json"
+
+    def _read_state(self):
+        """Returns the state, or None if there is none or it was made for another model"""
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (
+            state.get("version") != STATE_VERSION
+            or ModelSpec.of(state["model"]) != self.spec
+            or not os.path.isdir(self.path)
+        ):
+            return None
+        return state
+
+    def load(self):
+        """Reads the state and model; returns False if there are none"""
+        self.state = self._read_state()
+        if self.state is None:
+            return False
+        # Not memory-mapped: the arrays of the model are updated in place
+        self.clf = load_model(self.path, mmap=False)
+        return True
+
+    def is_current(self, folder):
+        """Tells whether all partitions of folder were consumed, judging by their names and sizes"""
+        state = self.state or self._read_state()
+        if state is None:
+            return False
+        partitions = state["partitions"]
+        names = list_partitions(folder)
+        return set(names) == set(partitions) and all(
+            os.path.getsize(os.path.join(folder, name)) == partitions[name]["size"]
+            for name in names
+        )
+
+    def update(self, folder, rebuild=False):
+        """Consumes the new partitions of folder; rebuilds from all partitions if rebuild is set, there is
+        no model yet, a consumed partition changed or the data drifted. Returns a summary of the update.
+        """
+        start = time.perf_counter()
+        config = incremental()
+        names = list_partitions(folder)
+        if not names:
+            raise ValueError("No partitions in " + folder)
+        reason = "requested" if rebuild else None
+        if reason is None and self.state is None and not self.load():
+            reason = "no model"
+        if reason is None:
+            consumed = self.state["partitions"]
+            if any(
+                _changed(os.path.join(folder, name), info)
+                for name, info in consumed.items()
+            ):
+                reason = "partition changed"
+        summary = {"new_rows": 0, "score": None, "psi": {}}
+        if reason is None:
+            new = [name for name in names if name not in consumed]
+            for name in new:
+                consumed[name] = _partition_info(os.path.join(folder, name))
+            df = _read_partitions(folder, new)
+            if len(df):
+                summary["new_rows"] = len(df)
+                summary["psi"] = self._update_statistics(df, config)
+                drifted = [
+                    column
+                    for column, psi in summary["psi"].items()
+                    if psi > config.psi_threshold
+                ]
+                if drifted:
+                    reason = "drift in " + ", ".join(drifted)
+                summary["score"] = self._update_model(
+                    folder, new, df, config, train=not drifted
+                )
+        if reason is not None:
+            self._rebuild(folder, names)
+        self._save(summary["score"])
+        summary.update(
+            rows=self.state["rows"],
+            rebuilt=reason is not None,
+            reason=reason,
+            seconds=time.perf_counter() - start,
+        )
+        return summary
+
+    def _update_statistics(self, df, config):
+        """Adds new rows to the running statistics and the drift histograms. Once min_drift_rows rows were added
+        since the last comparison, returns the PSI of every column between these rows and the reference.
+        """
+        state = self.state
+        medians = state["preprocessor"]["medians"]
+        raw = df[CONTINUOUS_COLUMNS].values.astype(np.float64)
+        filled = df[CONTINUOUS_COLUMNS].fillna(medians).values
+        state["rows"] += len(df)
+        state["pending_rows"] += len(df)
+        compare = state["pending_rows"] >= config.min_drift_rows
+        psi = {}
+        for i, column in enumerate(CONTINUOUS_COLUMNS):
+            _merge_moments(state["statistics"][column], raw[:, i])
+            reference = state["reference"][column]
+            counts = np.add(
+                reference["pending"], _histogram(filled[:, i], reference["edges"])
+            )
+            if compare:
+                psi[column] = population_stability_index(reference["counts"], counts)
+                counts[:] = 0
+            reference["pending"] = counts.tolist()
+        if compare:
+            state["pending_rows"] = 0
+        return psi
+
+    def _update_model(self, folder, new, df, config, train=True):
+        """Scores the model on the rows df of the new partitions, then trains it on them if train is set;
+        returns the score"""
+        preprocessor = HeartPreprocessor.from_dict(self.state["preprocessor"])
+        x, y = _features(preprocessor, df)
+        if not len(x):
+            return None
+        score = accuracy_score(y, self.clf.predict(x))
+        if train:
+            self._train(folder, new, preprocessor, x, y, config)
+        return score
+
+    def _train(self, folder, new, preprocessor, x, y, config):
+        clf, params = self.clf, self.clf.get_params()
+        if hasattr(clf, "partial_fit"):
+            clf.partial_fit(x, y)
+        elif "warm_start" in params and "n_estimators" in params:
+            # New trees are grown on the new rows only, which need all classes: the rows of
+            # partitions missing one are kept until later partitions complete them
+            untrained = self.state.get("untrained", [])
+            if untrained:
+                kept_x, kept_y = _features(
+                    preprocessor, _read_partitions(folder, untrained)
+                )
+                x, y = pd.concat([kept_x, x]), pd.concat([kept_y, y])
+            if set(np.unique(y)) == set(clf.classes_.tolist()):
+                clf.set_params(
+                    warm_start=True,
+                    n_estimators=clf.n_estimators + config.trees_per_update,
+                )
+                clf.fit(x, y)
+                self.state["untrained"] = []
+            else:
+                self.state["untrained"] = untrained + list(new)
+                logger.warning(
+                    "%s: %d rows miss a class, no trees grown until later partitions add it: %s",
+                    self.path,
+                    len(y),
+                    ", ".join(self.state["untrained"]),
+                )
+        else:
+            df = _read_partitions(folder, sorted(self.state["partitions"]))
+            self._fit(preprocessor, df)
+
+    def _fit(self, preprocessor, df):
+        """Fits a new model on the rows of df"""
+        x, y = _features(preprocessor, df)
+        self.clf = self.spec.estimator(**self.spec.params)
+        self.clf.fit(x, y)
+
+    def _rebuild(self, folder, names):
+        """Fits the preprocessor, the drift reference and the model on all partitions"""
+        self.state = {
+            "version": STATE_VERSION,
+            "model": self.spec.to_json(),
+            "partitions": {
+                name: _partition_info(os.path.join(folder, name)) for name in names
+            },
+            "rows": 0,
+            "pending_rows": 0,
+            "untrained": [],  # partitions the model was not trained on yet
+            "rebuilds": (self.state or {}).get("rebuilds", 0) + 1,
+            "statistics": {
+                column: {
+                    "n": 0,
+                    "mean": 0.0,
+                    "m2": 0.0,
+                    "min": float("inf"),
+                    "max": float("-inf"),
+                    "missing": 0,
+                }
+                for column in CONTINUOUS_COLUMNS
+            },
+        }
+        df = _read_partitions(folder, names)
+        self.state["rows"] = len(df)
+        preprocessor = HeartPreprocessor.fit(df)
+        self.state["preprocessor"] = preprocessor.to_dict()
+        raw = df[CONTINUOUS_COLUMNS].values.astype(np.float64)
+        filled = df[CONTINUOUS_COLUMNS].fillna(preprocessor.medians).values
+        reference = {}
+        for i, column in enumerate(CONTINUOUS_COLUMNS):
+            _merge_moments(self.state["statistics"][column], raw[:, i])
+            edges = np.unique(np.quantile(filled[:, i], np.linspace(0.1, 0.9, 9)))
+            reference[column] = {
+                "edges": edges.tolist(),
+                "counts": _histogram(filled[:, i], edges).tolist(),
+                "pending": [0] * (len(edges) + 1),
+            }
+        self.state["reference"] = reference
+        self._fit(preprocessor, df)
+
+    def _save(self, score=None):
+        """Writes the model folder, then the state that refers to it"""
+        preprocessor = HeartPreprocessor.from_dict(self.state["preprocessor"])
+        save_model(
+            self.clf,
+            self.path,
+            preprocessor.feature_columns,
+            scores={} if score is None else {"prequential": score},
+        )
+        tmp = self.state_path + ".tmp-%d" % os.getpid()
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_path)
+
+
+class IncrementalTrain(ScheduledTask):
+    """Trains a model (a model spec, see estimators; by default an online logistic regression) on the partitions
+    folder, consuming only the partitions appended since its last run (see the module docstring).
+    The task is complete while no partition was appended, so running it again after new data arrives updates the model.
+    """
+
+    partitions = Parameter(default=os.path.join(SHARED_RELATIVE_PATH, "partitions"))
+    model = ModelSpecParameter(default=json.dumps(DEFAULT_MODEL))
+
+    def cores(self):
+        return cores_needed(self.model.params, os.cpu_count())
+
+    def output(self):
+        path = os.path.join(
+            os.path.abspath(SHARED_RELATIVE_PATH),
+            self.model.name + "_incremental_model",
+        )
+        return LocalTarget(path)
+
+    def complete(self):
+        return IncrementalModel(self.output().path, self.model).is_current(
+            self.partitions
+        )
+
+    def run(self):
+        model = IncrementalModel(self.output().path, self.model)
+        summary = model.update(self.partitions)
+        name = self.model.name + "_incremental"
+        if summary["score"] is not None:
+            get_registry().record(
+                name,
+                "train",
+                summary["score"],
+                params=model.clf.get_params(),
+                seconds=summary["seconds"],
+                artifact_path=self.output().path,
+            )
+        print("####################")
+        print(
+            "%s: %d new rows, %d rows in total, %s in %.2fs"
+            % (
+                name,
+                summary["new_rows"],
+                summary["rows"],
+                "rebuilt (%s)" % summary["reason"] if summary["rebuilt"] else "updated",
+                summary["seconds"],
+            )
+        )
+        print("####################")
@@ -0,0 +1,165 @@
+"""Fast inference for the estimators the pipeline trains.
+
+scikit-learn validates its input, converts DataFrames and, for forests, dispatches
+every tree through joblib on each predict call; at a few rows per call this costs
+far more than the prediction. compile_model turns a fitted estimator into plain
+NumPy arrays that predict from a 2D array (or one 1D row) of features in the order
+the model was fitted on:
+
+* RandomForestClassifier: the nodes of all trees are concatenated into contiguous
+  arrays and all rows descend all trees at once, one level per step, until every
+  row has reached a leaf of every tree; large batches use scikit-learn's compiled
+  per-tree traversal without its input validation. Rows are
+  compared as float32 against float64 thresholds and the normalized leaf values are
+  summed tree by tree, like scikit-learn does, so probabilities are identical.
+* LogisticRegression: one dot product with the coefficients and the logistic function.
+
+Inputs must not contain missing values; the preprocessing fills them.
+"""
+
+import numpy as np
+from scipy.special import expit
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+LARGE_BATCH = 128  # rows from which forests are applied tree by tree
+
+
+def _as_rows(x, dtype):
+    x = np.asarray(x, dtype=dtype)
+    if x.ndim == 1:
+        x = x[np.newaxis, :]
+    if np.isnan(x).any():
+        raise ValueError("Input contains NaN")
+    return x
+
+
+class CompiledLogistic:
+    """Binary logistic regression as a coefficient vector and an intercept"""
+
+    def __init__(self, coef, intercept, classes):
+        self.coef = np.asarray(coef, dtype=np.float64)  # shape (n_features, 1)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self.classes = np.asarray(classes)
+
+    @classmethod
+    def from_estimator(cls, clf):
+        if len(clf.classes_) != 2:
+            raise TypeError("Only binary logistic regression can be compiled")
+        return cls(clf.coef_.T, clf.intercept_, clf.classes_)
+
+    def decision_function(self, x):
+        return (_as_rows(x, np.float64) @ self.coef + self.intercept).ravel()
+
+    def predict_proba(self, x):
+        """Returns the probabilities of both classes of every row, shape (n_rows, 2)"""
+        probability = expit(self.decision_function(x))
+        return np.column_stack([1 - probability, probability])
+
+    def predict(self, x):
+        return self.classes[(self.decision_function(x) > 0).astype(np.intp)]
+
+
+class CompiledForest:
+    """The trees of a random forest as contiguous node arrays.
+
+    Node i has its children at children[2 * i] (left) and children[2 * i + 1] (right),
+    and leaf_proba[i] holds the normalized class probabilities used when i is a leaf.
+    Batches of at least LARGE_BATCH rows are routed through the trees one tree at a
+    time by scikit-learn's compiled Tree.apply instead, which is faster at that size.
+    """
+
+    def __init__(
+        self,
+        roots,
+        feature,
+        threshold,
+        children,
+        is_leaf,
+        leaf_proba,
+        classes,
+        trees=(),
+    ):
+        self.roots = roots  # index of the root node of every tree
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.is_leaf = is_leaf
+        self.leaf_proba = leaf_proba
+        self.classes = np.asarray(classes)
+        self.trees = list(trees)
+
+    @classmethod
+    def from_estimator(cls, clf):
+        roots, features, thresholds, children, leaves, probas = [], [], [], [], [], []
+        offset = 0
+        for estimator in clf.estimators_:
+            tree = estimator.tree_
+            leaf = tree.children_left == -1
+            roots.append(offset)
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            pairs = np.column_stack([tree.children_left, tree.children_right])
+            children.append(np.where(leaf[:, np.newaxis], 0, pairs + offset).ravel())
+            leaves.append(leaf)
+            # Normalized like DecisionTreeClassifier.predict_proba
+            value = tree.value[:, 0, :]
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            probas.append(value / normalizer)
+            offset += tree.node_count
+        return cls(
+            np.array(roots, dtype=np.intp),
+            np.concatenate(features).astype(np.intp),
+            np.concatenate(thresholds),
+            np.concatenate(children).astype(np.intp),
+            np.concatenate(leaves),
+            np.concatenate(probas),
+            clf.classes_,
+            [estimator.tree_ for estimator in clf.estimators_],
+        )
+
+    def apply(self, x):
+        """Returns the leaf node of every row in every tree, shape (n_rows, n_trees)"""
+        x = np.ascontiguousarray(_as_rows(x, np.float32))
+        if len(x) >= LARGE_BATCH and self.trees:
+            return np.column_stack(
+                [tree.apply(x) + root for tree, root in zip(self.trees, self.roots)]
+            )
+        n_rows, n_features = x.shape
+        n_trees = len(self.roots)
+        values = x.ravel()
+        # One position per (row, tree) pair; positions still at inner nodes are stepped down together
+        nodes = np.tile(self.roots, n_rows)
+        offsets = np.repeat(np.arange(n_rows) * n_features, n_trees)
+        active = np.arange(n_rows * n_trees)
+        while active.size:
+            current = nodes[active]
+            feature_values = values[offsets[active] + self.feature[current]]
+            go_right = feature_values > self.threshold[current]
+            current = self.children[2 * current + go_right]
+            nodes[active] = current
+            active = active[~self.is_leaf[current]]
+        return nodes.reshape(n_rows, n_trees)
+
+    def predict_proba(self, x):
+        """Returns the class probabilities of every row, shape (n_rows, n_classes)"""
+        leaves = self.apply(x)
+        proba = np.zeros((len(leaves), self.leaf_proba.shape[1]))
+        # Summed in tree order, like RandomForestClassifier.predict_proba
+        for tree in range(leaves.shape[1]):
+            proba += self.leaf_proba[leaves[:, tree]]
+        proba /= leaves.shape[1]
+        return proba
+
+    def predict(self, x):
+        return self.classes[np.argmax(self.predict_proba(x), axis=1)]
+
+
+def compile_model(model):
+    """Returns the compiled form of a fitted RandomForestClassifier or LogisticRegression"""
+    if isinstance(model, RandomForestClassifier):
+        return CompiledForest.from_estimator(model)
+    if isinstance(model, LogisticRegression):
+        return CompiledLogistic.from_estimator(model)
+    raise TypeError("Cannot compile " + type(model).__name__)
@@ -1,37 +1,70 @@
 import os
 
+import numpy as np
 import pandas as pd
-from luigi import ExternalTask, LocalTarget, Parameter, Task, format
-from luigi.contrib.s3 import S3Target
-from sklearn.model_selection import StratifiedShuffleSplit
+from luigi import (
+    BoolParameter,
+    ExternalTask,
+    FloatParameter,
+    IntParameter,
+    LocalTarget,
+    Parameter,
+    format,
+)
+
+from . import artifacts
+from .artifacts import HEART_SCHEMA, frame_target
+from .caching import CachedTask
+from .events import ROWS_PROCESSED
+from .execution import ScheduledTask, execution, retry_transient
+from .profiling import span
+from .storage import content_sha256, download, external_path, file_target, upload
+from .transfer import file_sha256, show_stats
 
-EXTERNAL_DATA_ROOT = "s3://csci-e29-2020fa-final-project"  # Root S3 path, as a constant
 SHARED_RELATIVE_PATH = "data"  # shared local and external relative path
 
 
-class UploadRawData(Task):
-    """Uploads local data to amazon s3 bucket"""
+def data_name(data):
+    """Returns the name of the data file data without extension, which keys the outputs made from it"""
+    return os.path.splitext(os.path.basename(data))[0]
+
+
+def data_output_path(data, *parts):
+    """Returns the local path of parts in the folder of the outputs made from the data file data,
+    so the outputs of different data files do not overwrite each other"""
+    return os.path.join(os.path.abspath(SHARED_RELATIVE_PATH), data_name(data), *parts)
+
+
+class UploadRawData(CachedTask):
+    """Uploads local data to the external storage (amazon s3 bucket by default).
+    Salted with the sha256 of the local data (see caching), so changed local data is uploaded again.
+    The local data is the reference: an external copy with another content is replaced too."""
 
     data = Parameter(default="heart.csv")  # Filename of the data file as a parameter
 
+    def requires(self):
+        return LocalRawData(self.data)
+
     def output(self):
-        """Returns S3Target"""
-        s3_data_target_path = os.path.join(
-            EXTERNAL_DATA_ROOT, SHARED_RELATIVE_PATH, self.data
+        """Returns the target in the external storage"""
+        return file_target(external_path(SHARED_RELATIVE_PATH, self.data))
+
+    def complete(self):
+        # Else the tasks salted with the local data would read other data
+        return super().complete() and content_sha256(self.output()) == file_sha256(
+            self.input().path
         )
-        return S3Target(s3_data_target_path, format=format.Nop)
 
+    @retry_transient
     def run(self):
-        """ Writes local data to external target"""
-        local_data_path = os.path.join(os.path.abspath(SHARED_RELATIVE_PATH), self.data)
-
-        with self.output().open("w") as o:
-            with open(local_data_path, "rb") as i:
-                o.write(i.read())
+        """ Streams local data to external target (to S3 as a multipart upload)"""
+        output = self.output()
+        stats = upload(self.input().path, output)
+        show_stats("Uploaded " + output.path, stats)
 
 
-class DownloadRawData(Task):
-    """Downloads amazon s3 bucket data to local"""
+class DownloadRawData(ScheduledTask):
+    """Downloads data of the external storage to local"""
 
     """In this project local data is needed for bokeh visualization"""
 
@@ -41,53 +74,143 @@ class DownloadRawData(Task):
         return RawData(self.data)
 
     def output(self):
-        """Returns S3Target"""
+        """Returns LocalTarget"""
         local_target_path = os.path.join(SHARED_RELATIVE_PATH, self.data)
         return LocalTarget(local_target_path, format=format.Nop)
 
+    @retry_transient
     def run(self):
-        """ Writes external target to local data"""
-        with self.output().open("w") as o:
-            with self.input().open("r") as i:
-                o.write(i.read())
+        """ Streams external target to local data (S3 objects with parallel ranged downloads to the object cache)"""
+        source = self.input()
+        stats = download(source, self.output().path)
+        show_stats("Downloaded " + source.path, stats)
 
 
 class RawData(ExternalTask):
-    """ Returns S3 Target object for location of raw data"""
+    """ Returns the target of the raw data in the external storage"""
 
-    data = Parameter(default="heart.csv")  # Filename of the data under the root s3 path
+    data = Parameter(default="heart.csv")  # Filename of the data under the external root
+
+    @property
+    def retry_count(self):
+        # Missing data is checked again at every scheduler retry, as UploadRawData of the same run may
+        # still make it, but not forever: once disabled, the tasks needing it stop waiting for it
+        return execution().retry_count
 
     def output(self):
-        # return the S3Target of the raw data
-        path = os.path.join(EXTERNAL_DATA_ROOT, SHARED_RELATIVE_PATH, self.data)
-        return S3Target(path, format=format.Nop)
+        # return the target of the raw data
+        return file_target(external_path(SHARED_RELATIVE_PATH, self.data))
+
 
+class LocalRawData(RawData):
+    """ Returns the target of the raw data in the local data folder, uploaded by UploadRawData"""
 
-class TrainTestSplit(Task):
-    """ Splits raw data as train and test, then returns train or test data depending on the train_or_test parameter.
-    if train_or_test=train, it returns train data; if train_or_test=test, it returns test data as csv file
+    def output(self):
+        return LocalTarget(
+            os.path.join(os.path.abspath(SHARED_RELATIVE_PATH), self.data),
+            format=format.Nop,
+        )
+
+
+def stratified_test_mask(y, test_size=0.2, seed=42):
+    """Returns a boolean mask selecting a stratified test set from the labels y.
+
+    The number of test rows, ceil(test_size * len(y)), is shared between the classes by
+    the largest remainder method and each class draws its rows from one RandomState,
+    so the same labels and seed always give the same split.
+    """
+    y = np.asarray(y)
+    classes, y_indices, counts = np.unique(y, return_inverse=True, return_counts=True)
+    n_test = int(np.ceil(test_size * len(y)))
+    exact = counts * n_test / len(y)
+    class_test = np.floor(exact).astype(int)
+    remainder = np.argsort(-(exact - class_test), kind="stable")
+    class_test[remainder[: n_test - class_test.sum()]] += 1
+
+    rng = np.random.RandomState(seed)
+    mask = np.zeros(len(y), dtype=bool)
+    for i in range(len(classes)):
+        members = np.flatnonzero(y_indices == i)
+        mask[members[rng.permutation(len(members))[: class_test[i]]]] = True
+    return mask
+
+
+def write_split(chunks, test_mask, train_writer, test_writer):
+    """Writes consecutive DataFrame chunks to the train and test artifact writers according to test_mask"""
+    offset = 0
+    for chunk in chunks:
+        chunk_mask = test_mask[offset : offset + len(chunk)]
+        train_writer.write(chunk[~chunk_mask])
+        test_writer.write(chunk[chunk_mask])
+        offset += len(chunk)
+    train_writer.close()
+    test_writer.close()
+
+
+class TrainTestSplit(CachedTask):
+    """ Splits raw data as stratified train and test sets in a single run and writes both.
+    Output is a dict with "train" and "test" data frame targets in the configured artifact format,
+    in the external folder named after the data file.
+    With out_of_core=True the raw data is streamed in chunks: one pass reads only the target column
+    to draw the split, a second pass writes the rows. Both modes give the same split for the same seed.
+    When the data file is in the local data folder, it is uploaded first and its content salts the split.
     """
 
     data = Parameter(default="heart.csv")  # Filename of the data file as a parameter
+    seed = IntParameter(default=42)  # Random seed of the split
+    test_size = FloatParameter(default=0.2)  # Fraction of rows in the test set
+
+    # Execution details that do not change the output
+    out_of_core = BoolParameter(default=False, significant=False)
+    chunksize = IntParameter(default=100000, significant=False)
 
-    train_or_test = Parameter(default="train")  # Parameter to get train or test data
+    salt_modules = (artifacts,)
 
     def requires(self):
+        # Else the split, checked before the upload runs, would not see changes of the local data
+        if LocalRawData(self.data).complete():
+            return UploadRawData(self.data)
         return RawData(self.data)
 
     def output(self):
-        path = os.path.join(
-            EXTERNAL_DATA_ROOT, SHARED_RELATIVE_PATH, self.train_or_test + ".csv"
-        )
-        return S3Target(path)
-
+        return {
+            train_or_test: frame_target(
+                external_path(
+                    SHARED_RELATIVE_PATH, data_name(self.data), train_or_test
+                ),
+                HEART_SCHEMA,
+            )
+            for train_or_test in ("train", "test")
+        }
+
+    @retry_transient
     def run(self):
-        df = pd.read_csv(self.input().open("r"))
-        sss = StratifiedShuffleSplit(n_splits=1, test_size=0.2, random_state=42)
-        for train_index, test_index in sss.split(df, df["target"]):
-            strat_train_set = df.loc[train_index]
-            strat_test_set = df.loc[test_index]
-        if self.train_or_test == "train":
-            strat_train_set.to_csv(self.output().path, index=False)
-        if self.train_or_test == "test":
-            strat_test_set.to_csv(self.output().path, index=False)
+        if self.out_of_core:
+            with self.input().open("r") as f:
+                y = np.concatenate(
+                    [
+                        chunk["target"].values
+                        for chunk in pd.read_csv(
+                            f, usecols=["target"], chunksize=self.chunksize
+                        )
+                    ]
+                )
+        else:
+            with self.input().open("r") as f:
+                df = pd.read_csv(f)
+            y = df["target"].values
+        test_mask = stratified_test_mask(y, self.test_size, self.seed)
+
+        output = self.output()
+        with span("write split", rows=len(test_mask)):
+            with output["train"].open("w") as train_file:
+                with output["test"].open("w") as test_file:
+                    train_writer = output["train"].writer(train_file)
+                    test_writer = output["test"].writer(test_file)
+                    if self.out_of_core:
+                        with self.input().open("r") as f:
+                            chunks = pd.read_csv(f, chunksize=self.chunksize)
+                            write_split(chunks, test_mask, train_writer, test_writer)
+                    else:
+                        write_split([df], test_mask, train_writer, test_writer)
+        self.trigger_event(ROWS_PROCESSED, self, len(test_mask), len(test_mask))
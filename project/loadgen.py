@@ -0,0 +1,116 @@
+"""Local load generator for the prediction service.
+
+Keeps `concurrency` HTTP/1.1 keep-alive connections busy with prediction requests
+and reports the latency percentiles and the request rate:
+
+    pipenv run python -m final_project.loadgen --url http://127.0.0.1:8000/predict
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+# A typical raw record of heart.csv
+SAMPLE_RECORD = {
+    "age": 63,
+    "sex": 1,
+    "cp": 3,
+    "trestbps": 145,
+    "chol": 233,
+    "fbs": 1,
+    "restecg": 0,
+    "thalach": 150,
+    "exang": 0,
+    "oldpeak": 2.3,
+    "slope": 0,
+    "ca": 0,
+    "thal": 1,
+}
+
+
+async def _request(reader, writer, host, path, body):
+    writer.write(
+        (
+            "POST %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\n"
+            "Content-Length: %d\r\n\r\n" % (path, host, len(body))
+        ).encode()
+        + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def _client(url, body, requests, latencies, errors):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        for _ in range(requests):
+            start = time.perf_counter()
+            status = await _request(reader, writer, parts.netloc, parts.path, body)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_load(url, concurrency=32, requests=100, batch_size=1):
+    """Sends concurrency * requests requests and returns latency and throughput statistics"""
+    if batch_size == 1:
+        payload = SAMPLE_RECORD
+    else:
+        payload = [SAMPLE_RECORD] * batch_size
+    body = json.dumps(payload).encode()
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[_client(url, body, requests, latencies, errors) for _ in range(concurrency)]
+    )
+    seconds = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": seconds,
+        "requests_per_second": len(latencies) / seconds,
+        "rows_per_second": len(latencies) * batch_size / seconds,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000/predict")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=100, help="per connection")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="records per request (use /predict/batch)",
+    )
+    args = parser.parse_args()
+    stats = asyncio.run(
+        run_load(args.url, args.concurrency, args.requests, args.batch_size)
+    )
+    for name, value in stats.items():
+        print("%-20s %12.2f" % (name, value))
+
+
+if __name__ == "__main__":
+    main()
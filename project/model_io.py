@@ -0,0 +1,123 @@
+"""Model artifacts: a folder with the fitted estimator and a json manifest.
+
+model.joblib holds the estimator with its numpy arrays stored as raw buffers, so
+load_model can memory-map them (coefficients, forest leaf values, ...) instead of
+copying them, or compressed with zlib when disk space matters more than load time.
+manifest.json records the estimator class, the feature order, the preprocessor
+version, scores and the sha256 of model.joblib. The manifest is checked before the
+estimator is unpickled: a model file that was modified or fitted with another
+preprocessor version is refused. LazyModel reads only the manifest and loads the
+estimator on first use.
+
+The folder is written next to its final path and renamed into place, so a model
+folder is either complete or missing.
+"""
+
+import json
+import os
+import shutil
+import time
+
+import joblib
+import sklearn
+
+from .inference import compile_model
+from .preprocess_heart import PREPROCESSOR_VERSION
+from .transfer import file_sha256
+
+MODEL_FILE = "model.joblib"
+MANIFEST_FILE = "manifest.json"
+MODEL_FORMAT_VERSION = 1
+
+
+def save_model(model, path, feature_names, scores=None, compress=0):
+    """Writes the model and its manifest to the folder path, replacing an older model"""
+    tmp = path + "-tmp-%d" % os.getpid()
+    os.makedirs(tmp)
+    model_path = os.path.join(tmp, MODEL_FILE)
+    joblib.dump(model, model_path, compress=compress)
+    manifest = {
+        "format_version": MODEL_FORMAT_VERSION,
+        "estimator": type(model).__module__ + "." + type(model).__name__,
+        "feature_names": list(feature_names),
+        "preprocessor_version": PREPROCESSOR_VERSION,
+        "scores": scores or {},
+        "compressed": bool(compress),
+        "sha256": file_sha256(model_path),
+        "sklearn_version": sklearn.__version__,
+        "created": time.time(),
+    }
+    with open(os.path.join(tmp, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+
+
+def read_model_manifest(path):
+    """Returns the manifest of the model folder path, checking that this code can load the model"""
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest["format_version"] != MODEL_FORMAT_VERSION:
+        raise ValueError("Unsupported model format version in " + path)
+    if manifest["preprocessor_version"] != PREPROCESSOR_VERSION:
+        raise ValueError(
+            "%s was fitted on data of preprocessor version %s, not %s"
+            % (path, manifest["preprocessor_version"], PREPROCESSOR_VERSION)
+        )
+    return manifest
+
+
+def load_model(path, mmap=True, verify=True):
+    """Loads the estimator of the model folder path.
+    With mmap, uncompressed arrays are memory-mapped read-only; with verify, the file is checked against the manifest sha256 first.
+    """
+    manifest = read_model_manifest(path)
+    model_path = os.path.join(path, MODEL_FILE)
+    if verify and file_sha256(model_path) != manifest["sha256"]:
+        raise ValueError(model_path + " does not match its manifest")
+    mmap_mode = "r" if mmap and not manifest["compressed"] else None
+    return joblib.load(model_path, mmap_mode=mmap_mode)
+
+
+class LazyModel:
+    """A model folder whose manifest is read at once and whose estimator is loaded on first use.
+    Attributes of the estimator, like predict_proba, are available on the LazyModel."""
+
+    def __init__(self, path, mmap=True, verify=True):
+        self.path = path
+        self.manifest = read_model_manifest(path)
+        self.mmap = mmap
+        self.verify = verify
+        self._model = None
+        self._compiled = None
+
+    @property
+    def feature_names(self):
+        return self.manifest["feature_names"]
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = load_model(self.path, self.mmap, self.verify)
+        return self._model
+
+    @property
+    def compiled(self):
+        """The estimator compiled for fast inference (see inference), or None if it cannot be compiled"""
+        if self._compiled is None:
+            try:
+                self._compiled = compile_model(self.model)
+            except TypeError:
+                self._compiled = False
+        return self._compiled or None
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the LazyModel itself
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.model, name)
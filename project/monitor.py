@@ -0,0 +1,46 @@
+import resource
+import sys
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of the current process in megabytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":  # bytes on macOS, kilobytes on Linux
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def reset_peak_rss():
+    """Resets the peak resident set size reported by window_peak_rss_mb where the OS allows it (Linux).
+    Returns False if the peak cannot be reset."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def window_peak_rss_mb():
+    """Returns the peak resident set size since the last reset_peak_rss in megabytes,
+    or the peak of the whole process where it cannot be reset"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def io_bytes():
+    """Returns the bytes read and written by the current process so far.
+    On Linux these count all read and write calls (files, pipes and sockets); elsewhere 512-byte blocks of file I/O."""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(":") for line in f)
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_inblock * 512, usage.ru_oublock * 512
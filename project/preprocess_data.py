@@ -1,34 +1,83 @@
-import os
+from luigi import BoolParameter, IntParameter, LocalTarget, Parameter
 
-import pandas as pd
-from luigi import LocalTarget, Parameter, Task
+from . import artifacts, preprocess_heart
+from .artifacts import frame_target, preprocessed_schema
+from .caching import CachedTask
+from .events import ROWS_PROCESSED
+from .execution import retry_transient
+from .load_data import TrainTestSplit, data_output_path
+from .preprocess_heart import PREPROCESSOR_VERSION, HeartPreprocessor
+from .profiling import span
 
-from .load_data import TrainTestSplit
-from .preprocess_heart import preprocess
 
-SHARED_RELATIVE_PATH = "data"
+class FitPreprocessor(CachedTask):
+    """Learns the preprocessing statistics from the train part of the data given by data parameter.
+    The fitted preprocessor is saved as a versioned json file to the local folder of the data.
+    With streaming=True the train data is read in chunks of chunksize rows and medians and quartiles
+    are approximated by quantile sketches, so memory does not grow with the number of rows.
+    """
+
+    data = Parameter(default="heart.csv")
+    streaming = BoolParameter(default=False)
+    chunksize = IntParameter(default=100000, significant=False)
+
+    salt_modules = (preprocess_heart,)
 
+    def requires(self):
+        return TrainTestSplit(self.data)
 
-class PreProcessing(Task):
-    """  Preprocesses given data. Data is given by data parameter.
+    def output(self):
+        path = data_output_path(
+            self.data, "preprocessor_v" + str(PREPROCESSOR_VERSION) + ".json"
+        )
+        return LocalTarget(path)
+
+    @retry_transient
+    def run(self):
+        train = self.input()["train"]
+        if self.streaming:
+            preprocessor = HeartPreprocessor.fit_chunks(
+                lambda: train.read_chunks(self.chunksize)
+            )
+        else:
+            preprocessor = HeartPreprocessor.fit(train.read())
+        with self.output().open("w") as f:
+            preprocessor.save(f)
+
+
+class PreProcessing(CachedTask):
+    """Preprocesses given data. Data is given by data parameter.
     train_or_test parameter determines which part (train or test) of the data will be preprocessed.
-    Preprocessed data will be saved to local data folder.
+    Both parts are transformed with the preprocessor fitted on train data; outliers are removed from train data only.
+    Preprocessed data will be saved to local data folder in the configured artifact format.
     """
 
     data = Parameter(default="heart.csv")
     train_or_test = Parameter(default="train")
 
+    salt_modules = (artifacts, preprocess_heart)
+
     def requires(self):
-        return TrainTestSplit(self.data, self.train_or_test)
+        return {
+            "split": TrainTestSplit(self.data),
+            "preprocessor": FitPreprocessor(self.data),
+        }
 
     def output(self):
-        path = os.path.join(
-            os.path.abspath(SHARED_RELATIVE_PATH),
-            "preprocessed_" + self.train_or_test + ".csv",
+        return frame_target(
+            data_output_path(self.data, "preprocessed_" + self.train_or_test)
         )
-        return LocalTarget(path)
 
+    @retry_transient
     def run(self):
-        df = pd.read_csv(self.input().path)
-        df_preprocessed = preprocess(df, self.train_or_test)
-        df_preprocessed.to_csv(self.output().path, index=False)
+        with self.input()["preprocessor"].open("r") as f:
+            preprocessor = HeartPreprocessor.load(f)
+        df = self.input()["split"][self.train_or_test].read()
+        with span("transform", rows=len(df)):
+            df_preprocessed = preprocessor.transform(
+                df, remove_outliers=self.train_or_test == "train"
+            )
+        self.output().write(
+            df_preprocessed, preprocessed_schema(df_preprocessed.columns)
+        )
+        self.trigger_event(ROWS_PROCESSED, self, len(df), len(df_preprocessed))
@@ -1,7 +1,9 @@
+import json
+
 import numpy as np
-from sklearn.feature_selection import chi2
-from sklearn.preprocessing import MinMaxScaler
-from statsmodels.stats.outliers_influence import variance_inflation_factor
+
+from .artifacts import FEATURE_COLUMNS
+from .stats import DEFAULT_K, KLLSketch, chi2_from_sums, variance_inflation_factors
 
 """Explanation of variables for heart.csv dataset:
 1. age: Age in years
@@ -25,83 +27,233 @@ continuous_columns = ['age', 'trestbps', 'chol', 'thalach', 'oldpeak']
 """
 
 
-def preprocess(df, train_or_test):
-    """ Preprocesses heart.csv data"""
-
-    df.loc[
-        ~df["ca"].isin([0, 1, 2, 3]), "ca"
-    ] = (
-        np.NaN
-    )  # ca should range from 0-3. df['ca'].unique() shows ad addtional value 4. Change value 4 to NaN
-    df.loc[
-        ~df["thal"].isin([1, 2, 3]), "thal"
-    ] = (
-        np.NaN
-    )  # thal should range from 1-3. df['thal'].unique() shows an additional value 0. Change 0 to NaN
-
-    df = df.fillna(
-        df.median(skipna=True, numeric_only=True)
-    )  # df.isnull().sum() shows some missing values, change them to median
-
-    # remove outliers from train
-    continuous_columns = ["age", "trestbps", "chol", "thalach", "oldpeak"]
-    if train_or_test == "train":
-        quantile_25 = df[continuous_columns].quantile(0.25)
-        quantile_75 = df[continuous_columns].quantile(0.75)
-        inter_quantile = quantile_75 - quantile_25
-        outlier_cutoff = inter_quantile * 1.5
-        lower, upper = quantile_25 - outlier_cutoff, quantile_75 + outlier_cutoff
-
-        df = df[
-            ~((df[continuous_columns] < lower) | (df[continuous_columns] > upper)).any(
-                axis=1
+PREPROCESSOR_VERSION = 1  # Increase when the fitted statistics or the transform change
+
+TARGET_COLUMN = "target"
+CONTINUOUS_COLUMNS = ["age", "trestbps", "chol", "thalach", "oldpeak"]
+BINARY_AND_CATEGORICAL_COLUMNS = [
+    "cp",
+    "restecg",
+    "slope",
+    "ca",
+    "thal",
+    "sex",
+    "fbs",
+    "exang",
+]
+# ca should range from 0-3 but df['ca'].unique() shows an additional value 4,
+# thal should range from 1-3 but df['thal'].unique() shows an additional value 0. Other values become NaN
+VALID_VALUES = {"ca": [0, 1, 2, 3], "thal": [1, 2, 3]}
+
+
+class HeartPreprocessor:
+    """Preprocesses heart.csv data.
+    All statistics (medians, IQR outlier bounds, scaling ranges, chi2 and VIF column selections) are learned once by fit
+    on training data and saved as a versioned json artifact. transform applies them to any other data without recomputing.
+    """
+
+    def __init__(self, medians, lower, upper, scale_min, scale_max, columns):
+        self.medians = medians  # column -> median used to fill missing values
+        self.lower = np.asarray(lower)  # outlier bounds of the continuous columns
+        self.upper = np.asarray(upper)
+        self.scale_min = np.asarray(
+            scale_min
+        )  # min-max scaling of the continuous columns
+        self.scale_max = np.asarray(scale_max)
+        self.columns = columns  # output columns, in order
+
+    @classmethod
+    def fit(cls, df):
+        """Learns preprocessing statistics from training data"""
+        df = _mask_invalid(df)
+        # df.isnull().sum() shows some missing values, change them to median
+        medians = df.drop(columns=[TARGET_COLUMN]).median(
+            skipna=True, numeric_only=True
+        )
+        df = df.fillna(medians)
+
+        quantile_25 = df[CONTINUOUS_COLUMNS].quantile(0.25).values
+        quantile_75 = df[CONTINUOUS_COLUMNS].quantile(0.75).values
+        lower, upper = _outlier_bounds(quantile_25, quantile_75)
+
+        selection = _SelectionStats(list(df.columns))
+        selection.update(df[_inliers(df, lower, upper)])
+        return selection.preprocessor(cls, medians.to_dict(), lower, upper)
+
+    @classmethod
+    def fit_chunks(cls, chunks, k=DEFAULT_K):
+        """Learns preprocessing statistics from training data too large for memory in two passes.
+        chunks is a function returning a new iterator of DataFrame chunks on every call.
+        Medians and quartiles come from KLL sketches of size k, everything else is exact.
+        """
+        sketches, missing, columns = {}, {}, None
+        for chunk in chunks():
+            chunk = _mask_invalid(chunk)
+            if columns is None:
+                columns = list(chunk.columns)
+                features = [column for column in columns if column != TARGET_COLUMN]
+                sketches = {column: KLLSketch(k) for column in features}
+                missing = dict.fromkeys(features, 0)
+            for column, sketch in sketches.items():
+                values = chunk[column].values
+                sketch.update(values)
+                missing[column] += int(np.isnan(values).sum())
+        medians = {
+            column: float(sketch.quantile(0.5)) for column, sketch in sketches.items()
+        }
+
+        # Missing values are filled with the median before the quartiles are taken
+        quartiles = []
+        for column in CONTINUOUS_COLUMNS:
+            sketches[column].update([medians[column]], weight=missing[column])
+            quartiles.append(sketches[column].quantile([0.25, 0.75]))
+        quantile_25, quantile_75 = np.array(quartiles).T
+        lower, upper = _outlier_bounds(quantile_25, quantile_75)
+
+        selection = _SelectionStats(columns)
+        for chunk in chunks():
+            chunk = _mask_invalid(chunk).fillna(medians)
+            selection.update(chunk[_inliers(chunk, lower, upper)])
+        return selection.preprocessor(cls, medians, lower, upper)
+
+    def transform(self, df, remove_outliers=False):
+        """Applies the fitted preprocessing to df. Outliers are removed only if remove_outliers is set (training data).
+        The target column is optional, so raw patient records without labels can be transformed.
+        """
+        df = _mask_invalid(df).fillna(self.medians)
+        if remove_outliers:
+            df = df[_inliers(df, self.lower, self.upper)]
+        df[CONTINUOUS_COLUMNS] = _scale(
+            df[CONTINUOUS_COLUMNS].values, self.scale_min, self.scale_max
+        )
+        return df[[column for column in self.columns if column in df.columns]]
+
+    def transform_values(self, values, columns):
+        """Applies the fitted preprocessing, without outlier removal, to a float array of raw records with the
+        FEATURE_COLUMNS of heart.csv (one row may be 1D). Returns an array of the given output columns.
+        Same result as transform, without building data frames, which dominates the time for a few rows.
+        """
+        values = np.array(values, dtype=np.float64, ndmin=2)
+        for column, valid in VALID_VALUES.items():
+            i = FEATURE_COLUMNS.index(column)
+            values[~np.isin(values[:, i], valid), i] = np.nan
+        for i, column in enumerate(FEATURE_COLUMNS):
+            missing = np.isnan(values[:, i])
+            if column in self.medians and missing.any():
+                values[missing, i] = self.medians[column]
+        continuous = [FEATURE_COLUMNS.index(column) for column in CONTINUOUS_COLUMNS]
+        values[:, continuous] = _scale(
+            values[:, continuous], self.scale_min, self.scale_max
+        )
+        return values[:, [FEATURE_COLUMNS.index(column) for column in columns]]
+
+    @property
+    def feature_columns(self):
+        return [column for column in self.columns if column != TARGET_COLUMN]
+
+    def to_dict(self):
+        return {
+            "version": PREPROCESSOR_VERSION,
+            "medians": self.medians,
+            "lower": self.lower.tolist(),
+            "upper": self.upper.tolist(),
+            "scale_min": self.scale_min.tolist(),
+            "scale_max": self.scale_max.tolist(),
+            "columns": self.columns,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        if state.get("version") != PREPROCESSOR_VERSION:
+            raise ValueError(
+                "Preprocessor version %s does not match %s"
+                % (state.get("version"), PREPROCESSOR_VERSION)
             )
-        ]
-
-    # Scale continuous variables
-    scaler = MinMaxScaler()
-    df[continuous_columns] = scaler.fit_transform(df[continuous_columns])
-
-    # Correlations between categorical variables and label
-    if train_or_test == "train":
-        binary_and_categorical_columns = [
-            "cp",
-            "restecg",
-            "slope",
-            "ca",
-            "thal",
-            "sex",
-            "fbs",
-            "exang",
-        ]
-
-        chi2_scores, p_values = chi2(df[binary_and_categorical_columns], df["target"])
-        # drop the columns which has p values higher than 0.05. Columns with higher p values are independent of label
-        names_independent_categorical_columns = np.array(
-            binary_and_categorical_columns
-        )[p_values > 0.05]
-
-    if train_or_test == "test":
-        names_independent_categorical_columns = [
-            "restecg",
-            "fbs",
-        ]  # the results obtained from training (needed to change if a different training data supplied)
-    df = df.drop(names_independent_categorical_columns, axis=1, errors="ignore")
-
-    # Correlations between continuous features
-    if train_or_test == "train":
-        ck = np.array(df[continuous_columns])
-        vif = [variance_inflation_factor(ck, i) for i in range(ck.shape[1])]
-        names_correlated_continuous_columns = np.array(continuous_columns)[
-            np.array(vif) > 5
-        ]
-
-    if train_or_test == "test":
-        names_correlated_continuous_columns = [
-            "age",
-            "trestbps",
-            "chol",
-        ]  # the results obtained from training (needed to change if a different training data supplied)
-
-    df = df.drop(names_correlated_continuous_columns[:-1], axis=1)
+        state = dict(state)
+        del state["version"]
+        return cls(**state)
+
+    def save(self, f):
+        """Writes the fitted preprocessor as json to an open text file"""
+        json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, f):
+        """Reads a fitted preprocessor from an open text file"""
+        return cls.from_dict(json.load(f))
+
+
+class _SelectionStats:
+    """Accumulates, chunk by chunk, the scaling ranges and the chi2 and VIF column selections of inlier rows"""
+
+    def __init__(self, columns):
+        self.columns = columns
+        k = len(CONTINUOUS_COLUMNS)
+        self.n = 0
+        self.scale_min = np.full(k, np.inf)
+        self.scale_max = np.full(k, -np.inf)
+        self.sums = np.zeros(k)
+        self.gram = np.zeros((k, k))
+        self.class_sums = {}  # class -> sums of the categorical columns
+        self.class_counts = {}
+
+    def update(self, df):
+        if not len(df):
+            return
+        continuous = df[CONTINUOUS_COLUMNS].values.astype(np.float64)
+        self.n += len(continuous)
+        self.scale_min = np.minimum(self.scale_min, continuous.min(axis=0))
+        self.scale_max = np.maximum(self.scale_max, continuous.max(axis=0))
+        self.sums += continuous.sum(axis=0)
+        self.gram += continuous.T @ continuous
+
+        categorical = df[BINARY_AND_CATEGORICAL_COLUMNS].values.astype(np.float64)
+        classes, y = np.unique(df[TARGET_COLUMN].values, return_inverse=True)
+        sums = np.zeros((len(classes), categorical.shape[1]))
+        np.add.at(sums, y, categorical)
+        counts = np.bincount(y, minlength=len(classes))
+        for i, label in enumerate(classes.tolist()):
+            self.class_sums[label] = self.class_sums.get(label, 0) + sums[i]
+            self.class_counts[label] = self.class_counts.get(label, 0) + counts[i]
+
+    def preprocessor(self, cls, medians, lower, upper):
+        # Correlations between categorical variables and label.
+        # Columns with p values higher than 0.05 are independent of label and dropped
+        labels = sorted(self.class_counts)
+        chi2_scores, p_values = chi2_from_sums(
+            [self.class_sums[label] for label in labels],
+            [self.class_counts[label] for label in labels],
+        )
+        dropped = list(np.array(BINARY_AND_CATEGORICAL_COLUMNS)[p_values > 0.05])
+
+        # Correlations between continuous features. All but the last correlated column are dropped.
+        # VIFs of all columns come from one inverse of the correlation matrix, which is unchanged by the scaling
+        vif = variance_inflation_factors(self.gram, self.sums, self.n)
+        dropped += list(np.array(CONTINUOUS_COLUMNS)[vif > 5][:-1])
+
+        columns = [column for column in self.columns if column not in dropped]
+        return cls(medians, lower, upper, self.scale_min, self.scale_max, columns)
+
+
+def _outlier_bounds(quantile_25, quantile_75):
+    outlier_cutoff = (quantile_75 - quantile_25) * 1.5
+    return quantile_25 - outlier_cutoff, quantile_75 + outlier_cutoff
+
+
+def _mask_invalid(df):
+    df = df.copy()
+    for column, valid in VALID_VALUES.items():
+        df[column] = df[column].where(df[column].isin(valid))
     return df
+
+
+def _inliers(df, lower, upper):
+    continuous = df[CONTINUOUS_COLUMNS].values
+    return ~((continuous < lower) | (continuous > upper)).any(axis=1)
+
+
+def _scale(values, scale_min, scale_max):
+    # Same as MinMaxScaler, which leaves constant columns unscaled
+    data_range = scale_max - scale_min
+    data_range[data_range == 0.0] = 1.0
+    return (values - scale_min) / data_range
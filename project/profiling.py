@@ -0,0 +1,236 @@
+"""Per-task timing and resource instrumentation of the pipeline.
+
+For every luigi task run, handlers of the START, SUCCESS and FAILURE events record
+wall time, CPU time, peak RSS, rows in and out (from the ROWS_PROCESSED event) and
+bytes read and written, plus spans such as model fits recorded by the register
+decorators. Each record is appended as a json line to tasks.jsonl in the profile
+folder, which works across luigi worker processes. Optionally every task is also
+profiled with cProfile (<task id>.prof) or pyinstrument (<task id>.html):
+
+    [profiling]
+    path=data/profile
+    profiler=cprofile
+
+write_chrome_trace exports records to the Chrome trace format (chrome://tracing,
+https://ui.perfetto.dev) and summary_table formats them for the terminal.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from luigi import ChoiceParameter, Config, Event, Parameter, Task
+
+from .events import ROWS_PROCESSED
+from .monitor import io_bytes, reset_peak_rss, window_peak_rss_mb
+
+logger = logging.getLogger("luigi-interface")
+
+SHARED_RELATIVE_PATH = "data"
+
+
+class profiling(Config):
+    """Configuration of the task instrumentation"""
+
+    path = Parameter(default=os.path.join(SHARED_RELATIVE_PATH, "profile"))
+    profiler = ChoiceParameter(
+        choices=["none", "cprofile", "pyinstrument"], default="none"
+    )
+
+
+_running = {}  # task id -> (record, start counters, profiler)
+_current = threading.local()  # task id of the task running in this thread
+
+
+def _start_profiler(name):
+    if name == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    if name == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("pyinstrument is not installed; tasks are not profiled")
+            return None
+        profiler = Profiler()
+        profiler.start()
+        return profiler
+    return None
+
+
+def _stop_profiler(profiler, path):
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        profiler.dump_stats(path + ".prof")
+    elif profiler is not None:
+        profiler.stop()
+        with open(path + ".html", "w") as f:
+            f.write(profiler.output_html())
+
+
+@Task.event_handler(Event.START)
+def start_task(task):
+    reset_peak_rss()
+    record = {
+        "task_id": task.task_id,
+        "task_family": task.get_task_family(),
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "start": time.time(),
+        "rows_in": None,
+        "rows_out": None,
+        "spans": [],
+    }
+    counters = (time.perf_counter(), time.process_time(), io_bytes())
+    _running[task.task_id] = (record, counters, _start_profiler(profiling().profiler))
+    _current.task_id = task.task_id
+
+
+def _finish_task(task, status):
+    if task.task_id not in _running:
+        return
+    record, (wall, cpu, (read, written)), profiler = _running.pop(task.task_id)
+    _current.task_id = None
+    now_read, now_written = io_bytes()
+    record.update(
+        status=status,
+        wall_seconds=time.perf_counter() - wall,
+        cpu_seconds=time.process_time() - cpu,
+        peak_rss_mb=window_peak_rss_mb(),
+        bytes_read=now_read - read,
+        bytes_written=now_written - written,
+    )
+    directory = profiling().path
+    os.makedirs(directory, exist_ok=True)
+    _stop_profiler(profiler, os.path.join(directory, task.task_id))
+    # One short append per record, so the lines of concurrent workers do not interleave
+    with open(os.path.join(directory, "tasks.jsonl"), "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+
+@Task.event_handler(Event.SUCCESS)
+def finish_task(task):
+    _finish_task(task, "success")
+
+
+@Task.event_handler(Event.FAILURE)
+def fail_task(task, exception):
+    _finish_task(task, "failure")
+
+
+@Task.event_handler(ROWS_PROCESSED)
+def count_rows(task, rows_in, rows_out=None):
+    if task.task_id in _running:
+        record = _running[task.task_id][0]
+        record["rows_in"] = int(rows_in)
+        record["rows_out"] = None if rows_out is None else int(rows_out)
+
+
+@contextmanager
+def span(name, **args):
+    """Records the wall time of a block as a span of the task running in this thread"""
+    start, wall = time.time(), time.perf_counter()
+    try:
+        yield
+    finally:
+        task_id = getattr(_current, "task_id", None)
+        if task_id in _running:
+            _running[task_id][0]["spans"].append(
+                dict(
+                    name=name,
+                    start=start,
+                    wall_seconds=time.perf_counter() - wall,
+                    args=args,
+                )
+            )
+
+
+def read_records(path=None, since=0):
+    """Returns the task records written to the profile folder after the given time"""
+    path = os.path.join(path or profiling().path, "tasks.jsonl")
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [record for record in records if record["start"] >= since]
+
+
+def write_chrome_trace(records, path):
+    """Writes task records and their spans as complete events of the Chrome trace format"""
+    trace_events = []
+    for record in records:
+        args = {
+            key: record[key]
+            for key in (
+                "task_id",
+                "status",
+                "cpu_seconds",
+                "peak_rss_mb",
+                "rows_in",
+                "rows_out",
+                "bytes_read",
+                "bytes_written",
+            )
+        }
+        trace_events.append(
+            dict(
+                name=record["task_family"],
+                cat="task",
+                ph="X",
+                ts=record["start"] * 1e6,
+                dur=record["wall_seconds"] * 1e6,
+                pid=record["pid"],
+                tid=record["tid"],
+                args=args,
+            )
+        )
+        for task_span in record["spans"]:
+            trace_events.append(
+                dict(
+                    name=task_span["name"],
+                    cat="span",
+                    ph="X",
+                    ts=task_span["start"] * 1e6,
+                    dur=task_span["wall_seconds"] * 1e6,
+                    pid=record["pid"],
+                    tid=record["tid"],
+                    args=task_span["args"],
+                )
+            )
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+
+def summary_table(records):
+    """Formats one line per task record: wall and CPU time, peak RSS, rows and bytes"""
+    header = "%-40s %8s %8s %10s %10s %10s %10s %10s" % (
+        "task",
+        "wall s",
+        "cpu s",
+        "peak MB",
+        "rows in",
+        "rows out",
+        "MB read",
+        "MB written",
+    )
+    lines = [header, "-" * len(header)]
+    for record in sorted(records, key=lambda record: record["start"]):
+        lines.append(
+            "%-40s %8.2f %8.2f %10.1f %10s %10s %10.1f %10.1f"
+            % (
+                record["task_id"][:40],
+                record["wall_seconds"],
+                record["cpu_seconds"],
+                record["peak_rss_mb"],
+                "" if record["rows_in"] is None else record["rows_in"],
+                "" if record["rows_out"] is None else record["rows_out"],
+                record["bytes_read"] / 1024 ** 2,
+                record["bytes_written"] / 1024 ** 2,
+            )
+        )
+    return "\n".join(lines)
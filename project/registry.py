@@ -0,0 +1,160 @@
+"""Persistent registry of training and test runs shared by all worker processes.
+
+Runs are stored in a SQLite database in WAL mode: readers never block writers, and
+every write is a single short transaction, so many parallel luigi workers can record
+runs without the lock becoming a bottleneck. The location is configurable:
+
+    [registry]
+    path=data/registry.sqlite3
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from luigi import Config, Parameter
+
+SHARED_RELATIVE_PATH = "data"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    score REAL,
+    params TEXT,
+    data_hash TEXT,
+    seconds REAL,
+    artifact_path TEXT,
+    pid INTEGER,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS runs_model_stage ON runs (model, stage, id);
+"""
+
+
+class registry(Config):
+    """Configuration of the run registry"""
+
+    path = Parameter(default=os.path.join(SHARED_RELATIVE_PATH, "registry.sqlite3"))
+
+
+def data_hash(*arrays):
+    """Returns a sha1 of the content of DataFrames, Series or arrays"""
+    digest = hashlib.sha1()
+    for array in arrays:
+        if isinstance(array, (pd.DataFrame, pd.Series)):
+            digest.update(
+                pd.util.hash_pandas_object(array, index=False).values.tobytes()
+            )
+        else:
+            digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def _json_params(params):
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+class RunRegistry:
+    """Records model runs (model, stage, score, params, data hash, timing, artifact) in a SQLite database"""
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per process and thread; sqlite connections must not be shared across forks
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _write(self, sql, args):
+        for attempt in range(10):
+            try:
+                return self._connection().execute(sql, args)
+            except sqlite3.OperationalError as e:
+                # busy_timeout already waited; back off a little more before giving up
+                if "locked" not in str(e) or attempt == 9:
+                    raise
+                time.sleep(0.01 * 2**attempt)
+
+    def record(
+        self,
+        model,
+        stage,
+        score,
+        params=None,
+        data_hash=None,
+        seconds=None,
+        artifact_path=None,
+    ):
+        """Records one run and returns its id"""
+        cursor = self._write(
+            "INSERT INTO runs (model, stage, score, params, data_hash, seconds, artifact_path, pid, created)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                model,
+                stage,
+                None if score is None else float(score),
+                None if params is None else _json_params(params),
+                data_hash,
+                seconds,
+                artifact_path,
+                os.getpid(),
+                time.time(),
+            ),
+        )
+        return cursor.lastrowid
+
+    def set_artifact(self, model, stage, artifact_path):
+        """Sets the artifact path of the latest run of model and stage recorded by this process"""
+        self._write(
+            "UPDATE runs SET artifact_path = ? WHERE id ="
+            " (SELECT max(id) FROM runs WHERE model = ? AND stage = ? AND pid = ?)",
+            (artifact_path, model, stage, os.getpid()),
+        )
+
+    def runs(self, stage=None):
+        """Returns all runs, optionally of one stage, as a DataFrame"""
+        sql, args = "SELECT * FROM runs", ()
+        if stage is not None:
+            sql, args = sql + " WHERE stage = ?", (stage,)
+        return pd.read_sql_query(sql + " ORDER BY id", self._connection(), params=args)
+
+    def latest_scores(self, stage):
+        """Returns {model: score} of the latest run of every model in a stage"""
+        rows = self._connection().execute(
+            "SELECT model, score FROM runs WHERE id IN"
+            " (SELECT max(id) FROM runs WHERE stage = ? GROUP BY model) ORDER BY model",
+            (stage,),
+        )
+        return dict(rows.fetchall())
+
+
+_registries = {}
+
+
+def get_registry():
+    """Returns the registry at the configured path"""
+    path = os.path.abspath(registry().path)
+    if path not in _registries:
+        _registries[path] = RunRegistry(path)
+    return _registries[path]
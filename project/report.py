@@ -0,0 +1,289 @@
+"""The report of a pipeline run: charts of the test scores of all models, made once after all of them were evaluated.
+
+Report builds a chart spec, plain json with the data of every chart:
+
+    {"digest": "...", "charts": [{"title": ..., "kind": "bar", "x": [model names],
+     "y": [scores], "intervals": [[low, high], ...] or null, "xlabel": ..., "ylabel": ...}]}
+
+The spec is the output of the task and is published to the Visualizer, which draws it
+in the browser. The png (plotting_<source_test>_<hash of the models>.png) is rendered from the spec by
+matplotlib with the headless Agg backend in a background process (python -m
+final_project.report spec png), so the worker goes on with other tasks meanwhile.
+The digest of the spec is written next to the png, and the png is only rendered again
+when the digest changes.
+
+Renders are tracked on disk, as luigi workers run tasks in forked processes that end
+before their renders: <png>.render records the process and the digest being rendered,
+a failed render writes its error to <png>.error, and wait_for_renders, called by
+`python -m final_project` at the end of a run, waits for them and reports failures.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+import traceback
+
+from luigi import BoolParameter, LocalTarget, Parameter
+
+from .caching import CachedTask
+from .estimators import ModelSpecListParameter, models_digest
+from .evaluation import Evaluate
+from .events import publish
+from .load_data import data_output_path
+from .testperformance_model import TestModel
+
+logger = logging.getLogger("luigi-interface")
+
+SHARED_RELATIVE_PATH = "data"
+RENDER_VERSION = 1  # Increase when render_png draws the same spec differently
+# Render records of the pngs of all reports
+RENDER_PATTERN = os.path.join(SHARED_RELATIVE_PATH, "*", "*.png.render")
+
+_renders = {}  # pid -> background render process started by this process
+
+
+def spec_digest(charts):
+    """Returns the sha256 of the charts of a spec and RENDER_VERSION"""
+    content = json.dumps([RENDER_VERSION, charts], sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def rendered_digest(png_path):
+    """Returns the digest of the spec the png was rendered from, or None"""
+    try:
+        with open(png_path + ".digest") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def render_png(spec, png_path):
+    """Draws the charts of a spec side by side into png_path, then records the digest of the spec"""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    charts = spec["charts"]
+    fig, axes = plt.subplots(
+        1, len(charts), figsize=(5 * len(charts), 4), squeeze=False
+    )
+    for ax, chart in zip(axes[0], charts):
+        errors = None
+        if chart.get("intervals"):
+            errors = [
+                [y - low for y, (low, _) in zip(chart["y"], chart["intervals"])],
+                [high - y for y, (_, high) in zip(chart["y"], chart["intervals"])],
+            ]
+        ax.bar(chart["x"], chart["y"], yerr=errors, capsize=4)
+        ax.set_title(chart["title"])
+        ax.set_xlabel(chart["xlabel"])
+        ax.set_ylabel(chart["ylabel"])
+        ax.tick_params(axis="x", labelrotation=90)
+    tmp = png_path + "-tmp-%d.png" % os.getpid()
+    fig.savefig(tmp, bbox_inches="tight", dpi=100)
+    plt.close(fig)
+    os.replace(tmp, png_path)
+    with open(png_path + ".digest", "w") as f:
+        f.write(spec["digest"])
+
+
+def render_in_background(spec_path, png_path):
+    """Starts rendering the png of the spec saved at spec_path in a new process, records it in
+    png_path + ".render" and returns the process"""
+    with open(spec_path) as f:
+        digest = json.load(f)["digest"]
+    if os.path.exists(png_path + ".error"):
+        os.remove(png_path + ".error")
+    # A new interpreter, free of the state of the worker; it finds this package where the worker found it
+    env = dict(
+        os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path)
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", __name__, spec_path, png_path], env=env
+    )
+    _renders[process.pid] = process
+    record = {
+        "pid": process.pid,
+        "host": socket.gethostname(),
+        "started": time.time(),
+        "digest": digest,
+    }
+    tmp = png_path + ".render-tmp-%d" % os.getpid()
+    with open(tmp, "w") as f:
+        json.dump(record, f)
+    os.replace(tmp, png_path + ".render")
+    return process
+
+
+def _is_running(record):
+    """Tells whether the process of a render record may still be running"""
+    process = _renders.get(record["pid"])
+    if process is not None:
+        return process.poll() is None
+    if record["host"] != socket.gethostname():
+        return True  # only its png or error tell
+    try:
+        os.kill(record["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def render_status(png_path, record):
+    """Returns "rendered", "failed" or "running" for the render of png_path recorded in record"""
+    if rendered_digest(png_path) == record["digest"]:
+        return "rendered"
+    if os.path.exists(png_path + ".error") or not _is_running(record):
+        return "failed"
+    return "running"
+
+
+def wait_for_renders(timeout=None, since=None, pattern=RENDER_PATTERN):
+    """Waits for the background renders recorded by the files matching pattern, in any process, that
+    started after since (a time.time(), default: all). Logs the failed ones; returns True if all succeeded.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        failed, running = [], []
+        for path in glob.glob(pattern):
+            try:
+                with open(path) as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue  # replaced meanwhile
+            if since is not None and record["started"] < since:
+                continue
+            png_path = path[: -len(".render")]
+            status = render_status(png_path, record)
+            if status == "failed":
+                failed.append(png_path)
+            elif status == "running":
+                running.append(png_path)
+        if not running:
+            break
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+        time.sleep(0.1)
+    for pid, process in list(_renders.items()):
+        if process.poll() is not None:
+            del _renders[pid]
+    for png_path in failed:
+        try:
+            with open(png_path + ".error") as f:
+                error = f.read()
+        except OSError:
+            error = "the render process exited without rendering it"
+        logger.error("Rendering %s failed: %s", png_path, error)
+    return not failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Renders the png of a report spec")
+    parser.add_argument("spec")
+    parser.add_argument("png")
+    args = parser.parse_args(argv)
+    try:
+        with open(args.spec) as f:
+            render_png(json.load(f), args.png)
+    except Exception:
+        with open(args.png + ".error", "w") as f:
+            f.write(traceback.format_exc())
+        raise
+
+
+class Report(CachedTask):
+    """Takes data, source_train, source_test and models (a list of model specs) as parameters. Runs after the TestModel
+    and Evaluate tasks of all models and saves a chart spec of their test accuracy and ROC-AUC as json to the local folder
+    of the data, named after source_test and a hash of the models like the output of Evaluate.
+    With png=True (default) the charts are also rendered to a png in the background (see the module docstring).
+    """
+
+    data = Parameter(default="heart.csv")
+    source_train = Parameter(default="train")
+    source_test = Parameter(default="test")
+    models = ModelSpecListParameter(
+        default=[
+            "sklearn.ensemble.RandomForestClassifier",
+            "sklearn.linear_model.LogisticRegression",
+        ]
+    )
+    png = BoolParameter(default=True, significant=False)
+
+    def requires(self):
+        return {
+            "tests": [
+                TestModel(self.data, self.source_train, model, self.source_test)
+                for model in self.models
+            ],
+            "evaluation": Evaluate(
+                self.data, self.source_train, self.source_test, self.models
+            ),
+        }
+
+    def output(self):
+        # Reports of other data files or lists of models run at the same time
+        name = "report_" + self.source_test + "_" + models_digest(self.models)
+        return LocalTarget(data_output_path(self.data, name + ".json"))
+
+    @property
+    def png_path(self):
+        name = "plotting_" + self.source_test + "_" + models_digest(self.models)
+        return data_output_path(self.data, name + ".png")
+
+    def charts(self):
+        """Returns the charts of the report from the outputs of the required tasks"""
+        scores = []
+        for target in self.input()["tests"]:
+            with target.open("r") as f:
+                scores.append(json.load(f))
+        with self.input()["evaluation"]["report"].open("r") as f:
+            evaluation = json.load(f)["models"]
+        names = [score["model"] for score in scores]
+        intervals = [evaluation[name]["intervals"].get("roc_auc") for name in names]
+        return [
+            {
+                "title": "Model scores on Test data set",
+                "kind": "bar",
+                "x": names,
+                "y": [score["score"] for score in scores],
+                "intervals": None,
+                "xlabel": "Model Names",
+                "ylabel": "Model scores",
+            },
+            {
+                "title": "ROC-AUC on Test data set",
+                "kind": "bar",
+                "x": names,
+                "y": [evaluation[name]["roc_auc"] for name in names],
+                # None if evaluated without bootstrap
+                "intervals": intervals if all(intervals) else None,
+                "xlabel": "Model Names",
+                "ylabel": "ROC-AUC",
+            },
+        ]
+
+    def run(self):
+        charts = self.charts()
+        spec = {"digest": spec_digest(charts), "charts": charts}
+        with self.output().open("w") as f:
+            json.dump(spec, f)
+        if self.png and (
+            not os.path.exists(self.png_path)
+            or rendered_digest(self.png_path) != spec["digest"]
+        ):
+            render_in_background(self.output().path, self.png_path)
+        publish("report", stage=self.source_test, spec=spec)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""Online prediction service for the trained models.
+
+An ASGI application which loads the trained models and the fitted preprocessor of a
+data file once at startup and scores raw patient records sent as json:
+
+    PREDICTION_DATA_DIR=data/heart pipenv run uvicorn final_project.serving:application
+
+    GET  /models          names of the loaded models
+    POST /predict         one record, e.g. {"age": 63, "sex": 1, ...}
+    POST /predict/batch   a list of records
+
+Rows of concurrent requests are grouped by a MicroBatcher into a single vectorized
+transform and predict_proba call per model. Records are preprocessed as arrays and
+random forests and logistic regressions are scored by their compiled form (see
+inference), so no data frame is built on the way.
+"""
+
+import asyncio
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .artifacts import FEATURE_COLUMNS
+from .model_io import MANIFEST_FILE, LazyModel
+from .preprocess_heart import PREPROCESSOR_VERSION, HeartPreprocessor
+
+SHARED_RELATIVE_PATH = "data"
+DATA_DIR = os.path.join(SHARED_RELATIVE_PATH, "heart")  # outputs made from heart.csv
+
+MAX_BATCH_SIZE = 512  # rows scored in one call
+MAX_WAIT_SECONDS = 0.002  # how long the first request of a batch waits for others
+
+
+class MicroBatcher:
+    """Groups the rows of concurrent submit calls into one call of predict.
+
+    predict takes a DataFrame or an array of rows and returns a dict of per-row arrays; every caller gets
+    back the slices belonging to its own rows. A batch is closed when it holds
+    max_batch_size rows or max_wait seconds after its first request arrived. If predict
+    fails for a batch, its requests are scored one by one, so only the failing ones get the error.
+    """
+
+    def __init__(
+        self, predict, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT_SECONDS
+    ):
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = None
+        self.worker = None
+
+    async def submit(self, rows):
+        """Scores a DataFrame or an array of rows together with the rows of concurrent calls"""
+        loop = asyncio.get_running_loop()
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.worker = loop.create_task(self.run())
+        future = loop.create_future()
+        await self.queue.put((rows, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            # The model runs in a thread so that the event loop keeps accepting requests
+            try:
+                results = await loop.run_in_executor(
+                    None, self.predict, _concat([rows for rows, _ in batch])
+                )
+            except Exception:
+                # Score every request on its own, so one bad request fails alone
+                for rows, future in batch:
+                    try:
+                        result = await loop.run_in_executor(None, self.predict, rows)
+                    except Exception as e:
+                        _resolve(future, exception=e)
+                    else:
+                        _resolve(future, result)
+                continue
+            offset = 0
+            for rows, future in batch:
+                _resolve(
+                    future,
+                    {
+                        name: values[offset : offset + len(rows)]
+                        for name, values in results.items()
+                    },
+                )
+                offset += len(rows)
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+
+
+def _resolve(future, result=None, exception=None):
+    """Sets the result or exception of a request, unless it was cancelled (its client went away)"""
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+def _concat(parts):
+    if len(parts) == 1:
+        return parts[0]
+    if isinstance(parts[0], pd.DataFrame):
+        return pd.concat(parts, ignore_index=True)
+    return np.concatenate(parts)
+
+
+def load_models(data_dir):
+    """Returns every trained model folder (*_model) of the data folder as a LazyModel"""
+    models = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, "*_model", MANIFEST_FILE))):
+        path = os.path.dirname(path)
+        models[os.path.basename(path)[: -len("_model")]] = LazyModel(path)
+    return models
+
+
+def load_preprocessor(data_dir):
+    path = os.path.join(
+        data_dir, "preprocessor_v" + str(PREPROCESSOR_VERSION) + ".json"
+    )
+    with open(path) as f:
+        return HeartPreprocessor.load(f)
+
+
+class PredictionApp:
+    """ASGI application serving predictions of all models in data_dir"""
+
+    def __init__(
+        self,
+        data_dir=DATA_DIR,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_wait=MAX_WAIT_SECONDS,
+    ):
+        self.data_dir = data_dir
+        self.models = None
+        self.preprocessor = None
+        self.batcher = MicroBatcher(self.predict, max_batch_size, max_wait)
+
+    def load(self):
+        """Loads models and preprocessor; called once at startup.
+        The estimators are memory-mapped, so server processes share their arrays through the page cache.
+        """
+        self.preprocessor = load_preprocessor(self.data_dir)
+        self.models = load_models(self.data_dir)
+        for model in self.models.values():
+            model.compiled  # load and compile now rather than on the first request
+
+    def predict(self, rows):
+        """Returns probability of the positive class of each model for an array of raw records"""
+        probabilities = {}
+        for name, model in self.models.items():
+            x = self.preprocessor.transform_values(rows, model.feature_names)
+            if model.compiled is not None:
+                probabilities[name] = model.compiled.predict_proba(x)[:, 1]
+            else:
+                x = pd.DataFrame(x, columns=model.feature_names)
+                probabilities[name] = model.predict_proba(x)[:, 1]
+        return probabilities
+
+    async def score(self, records):
+        """Returns the predictions of every model for a non-empty list of records (dicts of raw values)"""
+        if not isinstance(records, list) or not records:
+            raise ValueError("expected a non-empty list of records")
+        if not all(isinstance(record, dict) for record in records):
+            raise ValueError("every record must be a json object")
+        rows = np.array(
+            [[record.get(column) for column in FEATURE_COLUMNS] for record in records],
+            dtype=np.float64,
+        )
+        probabilities = await self.batcher.submit(rows)
+        return [
+            {
+                name: {
+                    "probability": float(values[i]),
+                    "label": int(values[i] > 0.5),
+                }
+                for name, values in probabilities.items()
+            }
+            for i in range(len(rows))
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if self.models is None:
+            self.load()
+
+        method, path = scope["method"], scope["path"].rstrip("/")
+        try:
+            if method == "GET" and path == "/models":
+                await respond(send, 200, sorted(self.models))
+            elif method == "POST" and path == "/predict":
+                record = json.loads(await read_body(receive))
+                await respond(send, 200, (await self.score([record]))[0])
+            elif method == "POST" and path == "/predict/batch":
+                records = json.loads(await read_body(receive))
+                await respond(send, 200, await self.score(records))
+            else:
+                await respond(send, 404, {"error": "not found"})
+        except (ValueError, TypeError) as e:
+            await respond(send, 400, {"error": str(e)})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.load()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.batcher.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def respond(send, status, payload):
+    body = json.dumps(payload).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+application = PredictionApp(os.environ.get("PREDICTION_DATA_DIR", DATA_DIR))
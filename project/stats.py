@@ -0,0 +1,137 @@
+"""Mergeable statistics for fitting preprocessing on data that does not fit in memory.
+
+KLLSketch keeps an approximate quantile summary of a stream in O(k) memory. chi2 and
+VIF are computed from per-class sums and the Gram matrix X^T X, both of which can be
+accumulated chunk by chunk.
+"""
+
+import numpy as np
+from scipy import stats
+
+DEFAULT_K = 1000  # sketch size: memory is about 3k floats, rank error about 1/k
+
+
+class KLLSketch:
+    """KLL quantile sketch (Karnin, Lang and Liberty, 2016).
+
+    Items live in levels; an item of level h stands for 2**h stream items. When a
+    level overflows it is sorted and every other item, starting at a random offset,
+    is promoted to the next level. Each such compaction moves any rank by at most
+    2**h, so rank_error() is a guaranteed bound on the normalized rank error of
+    quantile(). While fewer than k items were inserted, quantiles are exact and equal
+    to the linear interpolation of pandas.
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=0):
+        self.k = k
+        self.rng = np.random.RandomState(seed)
+        self.levels = [np.empty(0)]
+        self.weighted = []  # (values, weight) pairs, kept exactly
+        self.n = 0
+        self.error = 0  # sum of the weights of all compactions
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values, weight=1):
+        """Adds the non-missing values, each counted weight times"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values) or not weight:
+            return
+        self.n += len(values) * weight
+        if weight != 1:
+            # Few heavy items (e.g. imputed values) are kept aside instead of compacted
+            self.weighted.append((values, weight))
+            return
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        """Adds the items summarized by another sketch"""
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.weighted += other.weighted
+        self.n += other.n
+        self.error += other.error
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                even = len(items) - len(items) % 2
+                promoted = items[self.rng.randint(2) : even : 2]
+                self.levels[level] = items[even:]
+                self.levels[level + 1] = np.concatenate(
+                    [self.levels[level + 1], promoted]
+                )
+                self.error += 2**level
+            level += 1
+
+    def rank_error(self):
+        """Upper bound of the rank error of quantile() as a fraction of n"""
+        return self.error / self.n if self.n else 0.0
+
+    def quantile(self, q):
+        """Returns the approximate q quantile (scalar or array), interpolated like pandas"""
+        if not self.n:
+            return np.nan
+        values = self.levels + [values for values, _ in self.weighted]
+        weights = [np.full(len(items), 2**h) for h, items in enumerate(self.levels)]
+        weights += [np.full(len(values), weight) for values, weight in self.weighted]
+        values, weights = np.concatenate(values), np.concatenate(weights)
+        order = np.argsort(values, kind="stable")
+        values, ranks = values[order], np.cumsum(weights[order])
+
+        position = np.asarray(q, dtype=np.float64) * (self.n - 1)
+        below = np.floor(position)
+
+        def at(rank):
+            return values[
+                np.minimum(np.searchsorted(ranks, rank, side="right"), len(values) - 1)
+            ]
+
+        low, high = at(below), at(below + 1)
+        return low + (position - below) * (high - low)
+
+
+def chi2_from_sums(class_sums, class_counts):
+    """chi2 statistics and p values of non-negative features against the class, as sklearn.feature_selection.chi2.
+
+    class_sums[c, j] is the sum of feature j over the rows of class c and class_counts[c] the number of rows of class c.
+    """
+    class_sums = np.asarray(class_sums, dtype=np.float64)
+    class_counts = np.asarray(class_counts, dtype=np.float64)
+    expected = np.outer(class_counts / class_counts.sum(), class_sums.sum(axis=0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        chi2 = ((class_sums - expected) ** 2 / expected).sum(axis=0)
+    return chi2, stats.chi2.sf(chi2, len(class_counts) - 1)
+
+
+def variance_inflation_factors(gram, sums=None, n=None):
+    """VIF of every column from the Gram matrix X^T X with a single matrix inverse.
+
+    With the column sums and row count n the columns are centered and the VIFs are
+    the diagonal of the inverse correlation matrix, as statsmodels'
+    variance_inflation_factor with its default standardization. Without sums the
+    auxiliary regressions have no intercept: VIF_i = G_ii * inv(G)_ii.
+    """
+    gram = np.asarray(gram, dtype=np.float64)
+    if sums is not None:
+        gram = gram - np.outer(sums, sums) / n
+        scale = np.sqrt(np.diag(gram))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gram = gram / np.outer(scale, scale)
+    try:
+        inverse = np.linalg.inv(gram)
+    except np.linalg.LinAlgError:  # perfectly collinear columns
+        return np.full(len(gram), np.inf)
+    return np.diag(gram) * np.diag(inverse)
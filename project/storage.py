@@ -0,0 +1,284 @@
+"""Storage of the external data: an S3 bucket, a local folder or memory.
+
+The raw data and the train/test split live under an external root. Its backend is
+chosen in luigi.cfg; a local folder or memory make runs and tests possible offline:
+
+    [storage]
+    backend=local
+    root=data/external
+    max_connections=10
+    read_cache=true
+    cache_max_bytes=1073741824
+    prefetch_workers=4
+
+Without a root the backend uses its entry of DEFAULT_ROOTS. file_target (and
+artifacts.frame_target) make the target of a path according to its scheme: s3://
+paths give S3 targets, memory:// paths give luigi MockTargets, which the worker
+processes of a run share, and other paths give local targets.
+
+S3 targets use one pooled client per thread, so the session, credentials and up to
+max_connections open connections are reused by all of them. They are read through a
+cache of local copies keyed by the ETag of the object (the objects folder of the
+stage cache), so repeated runs do not download the same data again. When a
+ScheduledTask starts, its S3 inputs are fetched into that cache concurrently in
+background threads while the run begins.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError
+from luigi import (
+    BoolParameter,
+    ChoiceParameter,
+    Config,
+    Event,
+    IntParameter,
+    LocalTarget,
+    Parameter,
+    format,
+)
+from luigi.contrib.s3 import S3Client, S3Target
+from luigi.format import FileWrapper
+from luigi.mock import MockTarget
+from luigi.task import flatten
+
+from .caching import cache
+from .execution import ScheduledTask
+from .transfer import (
+    CHECKSUM_METADATA_KEY,
+    READ_SIZE,
+    download_file,
+    file_sha256,
+    make_stats,
+    split_s3_path,
+    upload_file,
+)
+
+SHARED_RELATIVE_PATH = "data"
+DEFAULT_ROOTS = {
+    "s3": "s3://csci-e29-2020fa-final-project",
+    "local": os.path.join(SHARED_RELATIVE_PATH, "external"),
+    "memory": "memory://csci-e29-2020fa-final-project",
+}
+
+
+class storage(Config):
+    """Configuration of the external storage"""
+
+    backend = ChoiceParameter(choices=list(DEFAULT_ROOTS), default="s3")
+    root = Parameter(default="")  # empty for the default root of the backend
+    max_connections = IntParameter(default=10)  # open connections of a pooled client
+    read_cache = BoolParameter(default=True)  # read S3 objects through local copies
+    cache_max_bytes = IntParameter(default=1024**3)  # size limit of the local copies
+    prefetch_workers = IntParameter(default=4)  # S3 inputs fetched at once
+
+
+def external_root():
+    """Returns the root of the external data in the configured backend"""
+    config = storage()
+    return config.root or DEFAULT_ROOTS[config.backend]
+
+
+def external_path(*parts):
+    """Returns the path of the external data at the relative path parts"""
+    return os.path.join(external_root(), *parts)
+
+
+_pool = threading.local()  # the S3Client of each thread
+_lock = threading.Lock()
+_prefetcher = None
+_inflight = {}  # S3 path -> future of its local copy
+
+
+def s3_client():
+    """Returns the S3Client of the calling thread, made at its first call.
+
+    boto3 resources must not be shared between threads, so every thread has its own
+    client; the targets made in the thread share it.
+    """
+    client = getattr(_pool, "client", None)
+    if client is None:
+        config = BotoConfig(max_pool_connections=storage().max_connections)
+        client = _pool.client = S3Client(config=config)
+    return client
+
+
+def reset_clients():
+    """Drops the pooled clients and the prefetches of this process, e.g. after the credentials changed"""
+    global _pool, _lock, _prefetcher, _inflight
+    _pool = threading.local()
+    _lock = threading.Lock()
+    _prefetcher = None
+    _inflight = {}
+
+
+# Connections and threads of the parent are not usable in forked luigi workers
+os.register_at_fork(after_in_child=reset_clients)
+
+
+class CachedS3Target(S3Target):
+    """S3 object read through the local object cache, using the pooled client of the thread"""
+
+    def __init__(self, path, format=None, client=None, **kwargs):
+        super().__init__(path, format=format, client=client or s3_client(), **kwargs)
+
+    def open(self, mode="r"):
+        if mode != "r" or not storage().read_cache:
+            return super().open(mode)
+        f = io.BufferedReader(io.FileIO(local_copy(self), "r"))
+        return self.format.pipe_reader(FileWrapper(f))
+
+
+def file_target(path, format=format.Nop):
+    """Returns the target of the file at path in the backend given by its scheme"""
+    if path.startswith("s3://"):
+        return CachedS3Target(path, format=format)
+    if path.startswith("memory://"):
+        return MockTarget(path, format=format)
+    return LocalTarget(path, format=format)
+
+
+def _object_folder():
+    return os.path.join(cache().path, "objects")
+
+
+def _fetch(client, s3_path):
+    """Returns the path of the local copy of the current version of an S3 object, downloading it if needed"""
+    bucket, key = split_s3_path(s3_path)
+    etag = client.head_object(Bucket=bucket, Key=key)["ETag"].strip('"')
+    folder = os.path.join(
+        _object_folder(), hashlib.sha256(s3_path.encode()).hexdigest()[:32]
+    )
+    name = etag + os.path.splitext(key)[1]
+    path = os.path.join(folder, name)
+    if os.path.exists(path):
+        os.utime(path)  # last use, for eviction
+        return path
+    tmp = path + ".tmp-%d-%d" % (os.getpid(), threading.get_ident())
+    download_file(client, s3_path, tmp)
+    os.replace(tmp, path)
+    for other in os.listdir(folder):  # copies of older versions
+        if other != name and ".tmp-" not in other:
+            try:
+                os.remove(os.path.join(folder, other))
+            except OSError:
+                pass
+    evict_objects()
+    return path
+
+
+def local_copy(target):
+    """Returns the path of an up-to-date local copy of an S3 target, waiting for its prefetch if one is running"""
+    with _lock:
+        future = _inflight.pop(target.path, None)
+    if future is not None:
+        try:
+            path = future.result()
+            if os.path.exists(path):
+                return path
+        except Exception:
+            pass  # fetched again below, raising the error in the reading task
+    return _fetch(target.fs.s3.meta.client, target.path)
+
+
+def prefetch(targets):
+    """Starts fetching the S3 targets among targets into the object cache in background threads.
+    Returns the futures of their local paths."""
+    global _prefetcher
+    futures = []
+    for target in targets:
+        if not isinstance(target, S3Target):
+            continue
+        # boto3 clients, unlike resources, are thread safe
+        client = target.fs.s3.meta.client
+        with _lock:
+            if _prefetcher is None:
+                _prefetcher = ThreadPoolExecutor(
+                    storage().prefetch_workers, thread_name_prefix="prefetch"
+                )
+            future = _inflight.get(target.path)
+            if future is None or future.done():
+                future = _prefetcher.submit(_fetch, client, target.path)
+                _inflight[target.path] = future
+        futures.append(future)
+    return futures
+
+
+@ScheduledTask.event_handler(Event.START)
+def prefetch_inputs(task):
+    """Starts fetching the S3 inputs of a task about to run"""
+    if storage().read_cache:
+        prefetch(flatten(task.input()))
+
+
+def evict_objects(max_bytes=None):
+    """Removes the least recently used local copies of S3 objects until they take at most max_bytes.
+    Returns the number of bytes freed."""
+    max_bytes = storage().cache_max_bytes if max_bytes is None else max_bytes
+    copies = []
+    for root, _, names in os.walk(_object_folder()):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:  # removed by another process
+                continue
+            copies.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in copies)
+    freed = 0
+    for _, size, path in sorted(copies):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        freed += size
+    return freed
+
+
+def upload(local_path, target):
+    """Copies a local file to a target of any backend and returns TransferStats"""
+    if isinstance(target, S3Target):
+        return upload_file(target.fs.s3.meta.client, local_path, target.path)
+    start = time.perf_counter()
+    with open(local_path, "rb") as source, target.open("w") as f:
+        shutil.copyfileobj(source, f, READ_SIZE)
+    return make_stats(os.path.getsize(local_path), start)
+
+
+def download(target, local_path):
+    """Copies a target of any backend to a local file and returns TransferStats.
+    S3 objects are copied from the object cache, or downloaded directly without it."""
+    if isinstance(target, S3Target) and not storage().read_cache:
+        return download_file(target.fs.s3.meta.client, target.path, local_path)
+    start = time.perf_counter()
+    local = LocalTarget(local_path, format=format.Nop)
+    with target.open("r") as source, local.open("w") as f:
+        shutil.copyfileobj(source, f, READ_SIZE)
+    return make_stats(os.path.getsize(local_path), start)
+
+
+def content_sha256(target):
+    """Returns the sha256 of the content of a target of any backend, or None if it does not exist.
+    S3 objects give the sha256 recorded in their metadata by upload_file, None if they have none."""
+    if isinstance(target, S3Target):
+        bucket, key = split_s3_path(target.path)
+        try:
+            head = target.fs.s3.meta.client.head_object(Bucket=bucket, Key=key)
+        except ClientError:
+            return None
+        return head.get("Metadata", {}).get(CHECKSUM_METADATA_KEY)
+    if not target.exists():
+        return None
+    if isinstance(target, MockTarget):
+        return hashlib.sha256(target.fs.get_data(target.path)).hexdigest()
+    return file_sha256(target.path)
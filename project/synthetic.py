@@ -0,0 +1,108 @@
+"""Generates synthetic heart disease data with the schema of heart.csv at any scale.
+
+Rows are drawn from class-conditional distributions that approximate the UCI heart
+disease data: the target is drawn first, then every feature independently given the
+target, so that the preprocessing (chi2 and VIF selection, outlier removal) and the
+models behave as on the real data. The invalid codes of the real data (ca=4, thal=0)
+are kept. Data is produced in chunks, so 10^8 rows can be written in bounded memory:
+
+    python -m final_project.synthetic --rows 100000000 data/heart_100m.csv
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as csv
+
+from .artifacts import FEATURE_COLUMNS, TARGET_COLUMN
+
+TARGET_RATE = 0.54  # share of rows with heart disease
+
+# column -> (mean, standard deviation) for target 0 and 1, clipped to (min, max), decimals
+CONTINUOUS = {
+    "age": (((56.6, 7.9), (52.5, 9.6)), (29, 77), 0),
+    "trestbps": (((134.4, 18.7), (129.3, 16.2)), (94, 200), 0),
+    "chol": (((251.1, 49.5), (242.2, 53.6)), (126, 564), 0),
+    "thalach": (((139.1, 22.6), (158.5, 19.2)), (71, 202), 0),
+    "oldpeak": (((1.59, 1.30), (0.58, 0.78)), (0, 6.2), 1),
+}
+
+# column -> probabilities of the codes 0, 1, ... for target 0 and 1
+CATEGORICAL = {
+    "sex": ((0.17, 0.83), (0.44, 0.56)),
+    "cp": ((0.75, 0.07, 0.13, 0.05), (0.24, 0.25, 0.42, 0.09)),
+    "fbs": ((0.84, 0.16), (0.86, 0.14)),
+    "restecg": ((0.57, 0.41, 0.02), (0.41, 0.58, 0.01)),
+    "exang": ((0.45, 0.55), (0.86, 0.14)),
+    "slope": ((0.09, 0.65, 0.26), (0.05, 0.22, 0.73)),
+    "ca": ((0.33, 0.32, 0.22, 0.12, 0.01), (0.79, 0.13, 0.04, 0.02, 0.02)),
+    "thal": ((0.01, 0.09, 0.26, 0.64), (0.01, 0.04, 0.79, 0.16)),
+}
+
+
+def _draw_codes(rng, probabilities, target):
+    """Draws a code per row from the probabilities of the row's class"""
+    cumulative = np.cumsum(probabilities, axis=1)
+    cumulative[:, -1] = 1.0
+    uniform = rng.random(len(target))
+    codes = np.empty(len(target), dtype=np.int64)
+    for label in (0, 1):
+        rows = target == label
+        codes[rows] = np.searchsorted(cumulative[label], uniform[rows], side="right")
+    return codes
+
+
+def generate_chunks(rows, seed=0, chunksize=1000000):
+    """Yields DataFrames with the columns of heart.csv and rows rows in total.
+    The data only depends on rows, seed and chunksize."""
+    for index, start in enumerate(range(0, rows, chunksize)):
+        n = min(chunksize, rows - start)
+        rng = np.random.default_rng([seed, index])
+        target = (rng.random(n) < TARGET_RATE).astype(np.int64)
+        columns = {}
+        for column, (params, (low, high), decimals) in CONTINUOUS.items():
+            mean, std = np.array(params)[target].T
+            values = np.clip(rng.normal(mean, std), low, high)
+            columns[column] = np.round(values, decimals)
+        for column, probabilities in CATEGORICAL.items():
+            codes = _draw_codes(rng, np.array(probabilities), target)
+            columns[column] = codes.astype(np.float64)
+        df = pd.DataFrame(columns)[FEATURE_COLUMNS]
+        df[TARGET_COLUMN] = target
+        yield df
+
+
+def generate(rows, seed=0):
+    """Returns rows rows of synthetic heart data in one DataFrame"""
+    return pd.concat(list(generate_chunks(rows, seed)), ignore_index=True)
+
+
+def write_csv(path, rows, seed=0, chunksize=1000000):
+    """Writes rows rows of synthetic heart data to a csv file, one chunk at a time"""
+    # Integer valued columns are written as integers, like in heart.csv
+    integers = {
+        column: np.int64
+        for column in FEATURE_COLUMNS
+        if column in CATEGORICAL or CONTINUOUS[column][2] == 0
+    }
+    options = csv.WriteOptions(include_header=False)
+    with open(path, "wb") as f:
+        f.write((",".join(FEATURE_COLUMNS + [TARGET_COLUMN]) + "\n").encode())
+        for chunk in generate_chunks(rows, seed, chunksize):
+            table = pa.Table.from_pandas(chunk.astype(integers), preserve_index=False)
+            csv.write_csv(table, f, options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    write_csv(args.path, args.rows, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,243 @@
 """Tests for final project package"""
+import asyncio
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO, StringIO
+from multiprocessing import Process
+from tempfile import TemporaryDirectory
+from threading import Thread
 from unittest import TestCase
+from unittest.mock import patch
 
-from luigi import LocalTarget, build
+import boto3
+import numpy as np
+import pandas as pd
+from botocore.exceptions import EndpointConnectionError
+from luigi import ExternalTask, LocalTarget, Parameter, Task, build
+from luigi.configuration import get_config
 from luigi.contrib.s3 import S3Target
+from luigi.task_register import Register
+from moto import mock_aws
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_selection import chi2
 from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import (
+    average_precision_score,
+    brier_score_loss,
+    confusion_matrix,
+    roc_auc_score,
+)
+from statsmodels.stats.outliers_influence import variance_inflation_factor
 
-from final_project.load_data import (DownloadRawData, RawData, TrainTestSplit,
-                                     UploadRawData)
-from final_project.preprocess_data import PreProcessing
+from final_project.artifacts import (
+    FEATURE_COLUMNS,
+    HEART_SCHEMA,
+    CsvWriter,
+    LocalFrameTarget,
+    S3FrameTarget,
+    frame_target,
+)
+from final_project.batch_predict import (
+    BatchPredict,
+    ScoringData,
+    batch_predict,
+    score_frame,
+)
+from final_project.caching import (
+    CachedTask,
+    evict,
+    read_manifest,
+    task_salt,
+    write_manifest,
+)
+from final_project.estimators import ModelSpec
+from final_project.evaluation import Evaluate, bootstrap, calibration, evaluate
+from final_project.events import ROWS_PROCESSED, EventPublisher, get_publisher
+from final_project.execution import (
+    ScheduledTask,
+    central_scheduler,
+    configure,
+    retry_transient,
+)
+from final_project.experiment import (
+    DEFAULT_EXPERIMENT,
+    experiment_tasks,
+    load_experiment,
+    parse_experiment,
+    zoo_tasks,
+)
+from final_project.features import BuildFeatures, FeatureSet, stratified_folds
+from final_project.incremental import (
+    IncrementalModel,
+    IncrementalTrain,
+    append_partition,
+    list_partitions,
+    population_stability_index,
+)
+from final_project.inference import LARGE_BATCH, compile_model
+from final_project.load_data import (
+    DownloadRawData,
+    RawData,
+    TrainTestSplit,
+    UploadRawData,
+    stratified_test_mask,
+    write_split,
+)
+from final_project.model_io import (
+    LazyModel,
+    load_model,
+    read_model_manifest,
+    save_model,
+)
+from final_project.preprocess_data import FitPreprocessor, PreProcessing
+from final_project.preprocess_heart import HeartPreprocessor
+from final_project.profiling import (
+    read_records,
+    span,
+    summary_table,
+    write_chrome_trace,
+)
+from final_project.registry import RunRegistry, data_hash
+from final_project.report import (
+    Report,
+    render_in_background,
+    rendered_digest,
+    spec_digest,
+    wait_for_renders,
+)
+from final_project.serving import MicroBatcher, PredictionApp
+from final_project.stats import KLLSketch, chi2_from_sums, variance_inflation_factors
+from final_project.storage import (
+    CachedS3Target,
+    evict_objects,
+    file_target,
+    local_copy,
+    prefetch,
+    reset_clients,
+    s3_client,
+)
+from final_project.synthetic import generate, generate_chunks, write_csv
 from final_project.testperformance_model import TestModel, model_performance
 from final_project.train import Train, fit_model
+from final_project.transfer import download_file, upload_file
+from final_project.tune import sample_candidates, successive_halving
+from final_project.zoo import TrainZoo, cores_needed, train_zoo, zoo_model_name
+from Visualizer.Visualizer.histograms import (
+    BASE_BINS,
+    ColumnarDataset,
+    DatasetCache,
+    build_columnar,
+)
+
+
+class CacheSource(ExternalTask):
+    path = Parameter()
+
+    def output(self):
+        return LocalTarget(self.path)
+
+
+class CacheStage(CachedTask):
+    path = Parameter()
+    runs = []
+
+    def requires(self):
+        return CacheSource(self.path)
+
+    def output(self):
+        return LocalTarget(self.path + ".upper")
+
+    def run(self):
+        CacheStage.runs.append(self.path)
+        with self.input().open("r") as source, self.output().open("w") as f:
+            f.write(source.read().upper())
+
+
+class SlowClassifier(LogisticRegression):
+    """LogisticRegression taking a minute to fit"""
+
+    def fit(self, x, y):
+        time.sleep(60)
+        return super().fit(x, y)
+
+
+class RecordingLayer:
+    """Channel layer keeping the messages sent to groups"""
+
+    messages = []
+
+    def __init__(self, delay=0):
+        self.delay = delay
+
+    async def group_send(self, group, message):
+        await asyncio.sleep(self.delay)
+        RecordingLayer.messages.append((group, message))
+
+
+class EventStage(Task):
+    path = Parameter()
+
+    def output(self):
+        return LocalTarget(self.path)
+
+    def run(self):
+        with self.output().open("w") as f:
+            f.write("done")
+        self.trigger_event(ROWS_PROCESSED, self, 42)
+
+
+class ScheduledStage(ScheduledTask):
+    path = Parameter()
+    flaky = Parameter(default="")  # marker file; the first run fails while it does not exist
+
+    def output(self):
+        return LocalTarget(self.path)
+
+    def run(self):
+        if self.flaky and not os.path.exists(self.flaky):
+            open(self.flaky, "w").close()
+            raise RuntimeError("First run fails")
+        with self.output().open("w") as f:
+            f.write(str(os.getpid()))
+
+
+def build_on_scheduler(url, paths, flaky):
+    configure(local_scheduler=False, resources={"cpu": 2})
+    tasks = [ScheduledStage(path, flaky if i == 0 else "") for i, path in enumerate(paths)]
+    build(tasks, scheduler_url=url)
+    return all(task.complete() for task in tasks)
+
+
+@contextmanager
+def local_storage():
+    """Keeps the external data in a temporary folder holding synthetic heart data"""
+    with TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, "data"))
+        generate(300, seed=0).to_csv(os.path.join(root, "data", "heart.csv"), index=False)
+        get_config().set("storage", "backend", "local")
+        get_config().set("storage", "root", root)
+        Register.clear_instance_cache()  # salts of the other storage
+        try:
+            yield root
+        finally:
+            get_config().remove_section("storage")
+            Register.clear_instance_cache()
+
+
+class ProfileStage(Task):
+    path = Parameter()
+
+    def output(self):
+        return LocalTarget(self.path)
+
+    def run(self):
+        with span("write", rows=1000):
+            with self.output().open("w") as f:
+                f.write("x" * 100000)
+        self.trigger_event(ROWS_PROCESSED, self, 1000, 900)
 
 
 class UploadRawDataTests(TestCase):
@@ -21,13 +248,101 @@ class UploadRawDataTests(TestCase):
         )
 
     def test_output_return(self):
-        self.assertEqual(UploadRawData().output().__class__, S3Target)
+        self.assertIsInstance(UploadRawData().output(), S3Target)
 
     def test_params(self):
         self.assertEqual(len(UploadRawData().get_params()), 1)
 
     def test_run_method(self):
-        self.assertTrue(UploadRawData().output().exists())
+        with local_storage():
+            build([DownloadRawData()], local_scheduler=True)  # the local data to upload
+            os.remove(UploadRawData().output().path)
+            build([UploadRawData()], local_scheduler=True)
+            self.assertTrue(UploadRawData().output().exists())
+
+    def test_changed_data(self):
+        # A changed local file is uploaded again and split again in the same run
+        path = os.path.join("data", "changed.csv")
+        with local_storage() as root:
+            try:
+                for rows in (300, 250):
+                    generate(rows, seed=0).to_csv(path, index=False)
+                    Register.clear_instance_cache()  # a new run
+                    self.assertTrue(build([TrainTestSplit("changed.csv")], local_scheduler=True))
+                    split = TrainTestSplit("changed.csv").output()
+                    self.assertEqual(len(split["train"].read()) + len(split["test"].read()), rows)
+                # An external copy changed elsewhere is replaced by the local data salting the split
+                generate(100, seed=0).to_csv(os.path.join(root, "data", "changed.csv"), index=False)
+                Register.clear_instance_cache()
+                self.assertFalse(UploadRawData("changed.csv").complete())
+                self.assertTrue(build([UploadRawData("changed.csv")], local_scheduler=True))
+                self.assertEqual(len(pd.read_csv(UploadRawData("changed.csv").output().path)), 250)
+            finally:
+                os.remove(path)
+
+
+@mock_aws
+class TransferTests(TestCase):
+    chunk_size = 5 * 1024 * 1024  # smallest part size S3 accepts
+
+    def setUp(self):
+        self.client = boto3.client("s3", region_name="us-east-1")
+        self.client.create_bucket(Bucket="transfer-tests")
+        self.tmp = TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, "source.csv")
+        with open(self.source, "wb") as f:
+            f.write(os.urandom(2 * self.chunk_size + 123))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_round_trip(self):
+        stats = upload_file(
+            self.client, self.source, "s3://transfer-tests/data.csv", self.chunk_size
+        )
+        self.assertEqual(stats.nbytes, os.path.getsize(self.source))
+        self.assertGreater(stats.peak_rss_mb, 0)
+
+        target = os.path.join(self.tmp.name, "out", "data.csv")
+        download_file(
+            self.client, "s3://transfer-tests/data.csv", target, self.chunk_size
+        )
+        self.assertEqual(self.read(target), self.read(self.source))
+        self.assertFalse(os.path.exists(target + ".part"))
+
+    def test_resume_download(self):
+        upload_file(self.client, self.source, "s3://transfer-tests/data.csv")
+        target = os.path.join(self.tmp.name, "data.csv")
+        client = self.client
+        calls = []
+
+        class FlakyClient:
+            def __getattr__(self, name):
+                return getattr(client, name)
+
+            def get_object(self, **kwargs):
+                calls.append(kwargs["Range"])
+                if len(calls) == 2:
+                    raise IOError("connection reset")
+                return client.get_object(**kwargs)
+
+        with self.assertRaises(IOError):
+            download_file(
+                FlakyClient(),
+                "s3://transfer-tests/data.csv",
+                target,
+                self.chunk_size,
+                1,
+            )
+        download_file(
+            FlakyClient(), "s3://transfer-tests/data.csv", target, self.chunk_size, 1
+        )
+        self.assertEqual(self.read(target), self.read(self.source))
+        self.assertEqual(len(calls), 4)  # the first range is not fetched twice
 
 
 class DownloadRawDataTests(TestCase):
@@ -41,7 +356,8 @@ class DownloadRawDataTests(TestCase):
         self.assertEqual(len(DownloadRawData().get_params()), 1)
 
     def test_run_method(self):
-        build([DownloadRawData()], local_scheduler=True)
+        with local_storage():
+            build([DownloadRawData()], local_scheduler=True)
         self.assertTrue(DownloadRawData().output().exists())
 
 
@@ -52,55 +368,222 @@ class RawDataTests(TestCase):
         )
 
     def test_output_return(self):
-        self.assertEqual(RawData().output().__class__, S3Target)
+        self.assertIsInstance(RawData().output(), S3Target)
 
     def test_params(self):
         self.assertEqual(len(RawData().get_params()), 1)
 
     def test_run_method(self):
-        self.assertTrue(RawData().output().exists())
+        with local_storage():
+            self.assertTrue(RawData().output().exists())
 
 
 class TrainTestSplitTests(TestCase):
     def test_output_path(self):
         self.assertEqual(
-            TrainTestSplit().output().path,
-            "s3://csci-e29-2020fa-final-project/data/train.csv",
+            TrainTestSplit().output()["train"].path,
+            "s3://csci-e29-2020fa-final-project/data/heart/train.parquet",
         )
         self.assertEqual(
-            TrainTestSplit(train_or_test="test").output().path,
-            "s3://csci-e29-2020fa-final-project/data/test.csv",
+            TrainTestSplit().output()["test"].path,
+            "s3://csci-e29-2020fa-final-project/data/heart/test.parquet",
         )
 
     def test_output_return(self):
-        self.assertEqual(TrainTestSplit().output().__class__, S3Target)
+        self.assertEqual(TrainTestSplit().output()["train"].__class__, S3FrameTarget)
 
     def test_run_method(self):
-        self.assertTrue(TrainTestSplit(train_or_test="test").output().exists())
-        self.assertTrue(TrainTestSplit().output().exists())
+        with local_storage():
+            build([TrainTestSplit()], local_scheduler=True)
+            self.assertTrue(TrainTestSplit().output()["test"].exists())
+            self.assertTrue(TrainTestSplit().output()["train"].exists())
 
     def test_params(self):
-        self.assertEqual(len(TrainTestSplit().get_params()), 2)
+        self.assertEqual(len(TrainTestSplit().get_params()), 5)
 
     def test_requires(self):
-        self.assertEqual(TrainTestSplit().requires(), RawData())
+        self.assertEqual(TrainTestSplit("missing.csv").requires(), RawData("missing.csv"))
+        with local_storage():
+            build([DownloadRawData()], local_scheduler=True)
+            self.assertEqual(TrainTestSplit().requires(), UploadRawData())
+
+    def test_stratified_test_mask(self):
+        y = np.array([0] * 40 + [1] * 60)
+        mask = stratified_test_mask(y, test_size=0.2, seed=1)
+        self.assertEqual(mask.sum(), 20)
+        self.assertEqual(y[mask].sum(), 12)
+        np.testing.assert_array_equal(mask, stratified_test_mask(y, 0.2, seed=1))
+        self.assertFalse(np.array_equal(mask, stratified_test_mask(y, 0.2, seed=2)))
+
+    def test_write_split_chunked(self):
+        df = pd.DataFrame({"age": range(50), "target": [0, 1] * 25})
+        mask = stratified_test_mask(df["target"], 0.2, seed=42)
+        outputs = []
+        for chunks in ([df], [df[i : i + 7] for i in range(0, len(df), 7)]):
+            train_file, test_file = BytesIO(), BytesIO()
+            write_split(chunks, mask, CsvWriter(train_file), CsvWriter(test_file))
+            outputs.append((train_file.getvalue(), test_file.getvalue()))
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(len(pd.read_csv(BytesIO(outputs[0][1]))), 10)
+
+
+@mock_aws
+class StorageTests(TestCase):
+    path = "s3://storage-tests/data/heart.csv"
+
+    def setUp(self):
+        reset_clients()  # clients with the credentials of the mock
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="storage-tests")
+        self.tmp = TemporaryDirectory()
+        get_config().set("cache", "path", os.path.join(self.tmp.name, "cache"))
+
+    def tearDown(self):
+        get_config().remove_option("cache", "path")
+        self.tmp.cleanup()
+
+    def write(self, path, data):
+        with file_target(path).open("w") as f:
+            f.write(data)
+
+    def test_targets(self):
+        self.assertIsInstance(file_target(self.path), CachedS3Target)
+        self.assertIs(file_target(self.path).fs, file_target(self.path).fs)
+        self.assertIsInstance(file_target("data/heart.csv"), LocalTarget)
+        self.write("memory://storage-tests/a.csv", b"a,b")
+        with file_target("memory://storage-tests/a.csv").open("r") as f:
+            self.assertEqual(f.read(), b"a,b")
+
+    def test_client_per_thread(self):
+        clients = []
+        for _ in range(2):
+            thread = Thread(target=lambda: clients.append(s3_client()))
+            thread.start()
+            thread.join()
+        self.assertIs(s3_client(), s3_client())
+        self.assertIsNot(clients[0], clients[1])
+
+    def test_read_through_cache(self):
+        self.write(self.path, b"version 1")
+        with patch("final_project.storage.download_file", wraps=download_file) as download:
+            for _ in range(2):
+                with file_target(self.path).open("r") as f:
+                    self.assertEqual(f.read(), b"version 1")
+            self.assertEqual(download.call_count, 1)
+            self.write(self.path, b"version 2")
+            with file_target(self.path).open("r") as f:
+                self.assertEqual(f.read(), b"version 2")
+            self.assertEqual(download.call_count, 2)
+        # the copy of version 1 was replaced
+        self.assertEqual(len(os.listdir(os.path.dirname(local_copy(file_target(self.path))))), 1)
+        self.assertEqual(evict_objects(0), len(b"version 2"))
+
+    def test_prefetch(self):
+        paths = ["s3://storage-tests/data/%d.csv" % i for i in range(3)]
+        for path in paths:
+            self.write(path, path.encode())
+        futures = prefetch([file_target(path) for path in paths] + [LocalTarget("data/heart.csv")])
+        self.assertEqual(len(futures), 3)
+        for path, future in zip(paths, futures):
+            with open(future.result(), "rb") as f:
+                self.assertEqual(f.read(), path.encode())
+            self.assertEqual(local_copy(file_target(path)), future.result())
+
+    def test_memory_backend(self):
+        get_config().set("storage", "backend", "memory")
+        try:
+            Register.clear_instance_cache()
+            # Data that is not in the local data folder, which would be uploaded over it
+            self.write(RawData("memory.csv").output().path, generate(100, seed=0).to_csv(index=False).encode())
+            self.assertTrue(build([TrainTestSplit("memory.csv")], local_scheduler=True))
+            self.assertEqual(len(TrainTestSplit("memory.csv").output()["test"].read()), 20)
+        finally:
+            get_config().remove_section("storage")
+            Register.clear_instance_cache()
+
+
+class FeatureStoreTests(TestCase):
+    def test_layout(self):
+        with local_storage():
+            self.assertTrue(build([BuildFeatures()], local_scheduler=True))
+            features = FeatureSet(BuildFeatures().output().path)
+            test = PreProcessing(train_or_test="test").output().read()
+        self.assertEqual(features.x.dtype, np.float32)
+        self.assertTrue(features.x.flags.f_contiguous)
+        self.assertEqual(features.columns, [column for column in test.columns if column != "target"])
+        # Rows of a split sorted by fold, every fold one range of rows
+        order = np.argsort(stratified_folds(test["target"].values, 5, 42), kind="stable")
+        np.testing.assert_array_equal(features.target("test"), test["target"].values[order])
+        np.testing.assert_allclose(features.frame("test"), test[features.columns].values[order], rtol=1e-6)
+        self.assertEqual(features.rows("test").stop, len(features.y))
+        self.assertEqual(sum(len(features.target("train", fold)) for fold in range(5)), features.rows("train").stop)
+        np.testing.assert_array_equal(np.bincount(features.folds("train")), [len(features.target("train", f)) for f in range(5)])
+
+    def test_views(self):
+        with local_storage():
+            build([BuildFeatures()], local_scheduler=True)
+            features = FeatureSet(BuildFeatures().output().path)
+        self.assertTrue(np.shares_memory(features.matrix("train", fold=2), features.x))
+        self.assertTrue(np.shares_memory(features.matrix("test", features.columns[2:5]), features.x))
+        subset = [features.columns[4], features.columns[0]]
+        np.testing.assert_array_equal(features.matrix("test", subset), features.frame("test")[subset].values)
+        self.assertEqual(features.matrix("test", []).shape, (len(features.target("test")), 0))
+        self.assertEqual(features.frame("test", []).shape, (len(features.target("test")), 0))
+
+    def test_versions(self):
+        with local_storage() as root:
+            paths = []
+            for seed in (0, 1):  # external data that is not in the local data folder
+                generate(300, seed=seed).to_csv(os.path.join(root, "data", "versions.csv"), index=False)
+                Register.clear_instance_cache()
+                paths.append(BuildFeatures("versions.csv").output().path)
+        self.assertNotEqual(paths[0], paths[1])
+        self.assertEqual(os.path.dirname(paths[0]), os.path.dirname(paths[1]))
+
+
+class ArtifactTests(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.df = pd.DataFrame(
+            {column: np.arange(5, dtype=float) for column in HEART_SCHEMA.names}
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        for frame_format in ("parquet", "arrow", "csv"):
+            target = frame_target(
+                os.path.join(self.tmp.name, "heart"), HEART_SCHEMA, frame_format
+            )
+            target.write(self.df)
+            self.assertTrue(target.path.endswith("." + frame_format))
+            df = target.read()
+            self.assertEqual(df["target"].dtype, np.int64)
+            pd.testing.assert_frame_equal(df, self.df.astype({"target": np.int64}))
+            self.assertEqual(list(target.read(["chol", "age"]).columns), ["chol", "age"])
+
+    def test_schema_is_enforced(self):
+        target = frame_target(os.path.join(self.tmp.name, "heart"), HEART_SCHEMA)
+        with self.assertRaises(KeyError):
+            target.write(self.df.drop(columns=["age"]))
+        self.assertFalse(target.exists())
 
 
 class TrainTests(TestCase):
     def test_output_path(self):
         self.assertEqual(
             Train().output().path,
-            os.path.join(os.getcwd(), "data/RandomForestClassifier_parameters.pkl"),
+            os.path.join(os.getcwd(), "data/heart/RandomForestClassifier_model"),
         )
 
     def test_output_return(self):
         self.assertEqual(Train().output().__class__, LocalTarget)
 
     def test_params(self):
-        self.assertEqual(len(Train().get_params()), 3)
+        self.assertEqual(len(Train().get_params()), 4)
 
     def test_requires(self):
-        self.assertEqual(Train().requires(), PreProcessing())
+        self.assertEqual(Train().requires(), BuildFeatures())
 
     def test_fit_model(self):
         clf, model_name, training_score = fit_model(
@@ -110,31 +593,1054 @@ class TrainTests(TestCase):
         self.assertEqual(model_name, "LogisticRegression")
 
     def test_run(self):
-        build([Train()], local_scheduler=True)
-        self.assertTrue(os.path.isfile(Train().output().path))
+        with local_storage():
+            build([Train()], local_scheduler=True)
+        self.assertTrue(os.path.isdir(Train().output().path))  # the model folder
 
 
 class PreProcessingTests(TestCase):
     def test_requires(self):
-        self.assertEqual(PreProcessing().requires(), TrainTestSplit())
+        self.assertEqual(
+            PreProcessing().requires(),
+            {"split": TrainTestSplit(), "preprocessor": FitPreprocessor()},
+        )
 
     def test_params(self):
         self.assertEqual(len(PreProcessing().get_params()), 2)
 
     def test_output_return(self):
-        self.assertEqual(PreProcessing().output().__class__, LocalTarget)
+        self.assertEqual(PreProcessing().output().__class__, LocalFrameTarget)
 
     def test_output_path(self):
         self.assertEqual(
             PreProcessing().output().path,
-            os.path.join(os.getcwd(), "data/preprocessed_train.csv"),
+            os.path.join(os.getcwd(), "data/heart/preprocessed_train.parquet"),
         )
 
     def test_run(self):
-        build([PreProcessing()], local_scheduler=True)
+        with local_storage():
+            build([PreProcessing()], local_scheduler=True)
         self.assertTrue(os.path.isfile(PreProcessing().output().path))
 
 
+class HeartPreprocessorTests(TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.train = pd.DataFrame(
+            {column: rng.randint(0, 4, 200).astype(float) for column in HEART_SCHEMA.names}
+        )
+        for column in ("age", "trestbps", "chol", "thalach", "oldpeak"):
+            self.train[column] = rng.normal(100, 10, 200)
+        self.train["target"] = (self.train["ca"] >= 2).astype(int)
+        self.train.loc[0, "chol"] = 1000  # outlier
+        self.train.loc[1, "ca"] = 4  # invalid value
+
+    def test_transform_reuses_training_statistics(self):
+        preprocessor = HeartPreprocessor.fit(self.train)
+        train = preprocessor.transform(self.train, remove_outliers=True)
+        self.assertNotIn(0, train.index)
+        self.assertEqual(train["ca"][1], preprocessor.medians["ca"])
+
+        test = preprocessor.transform(self.train.iloc[100:110])
+        self.assertEqual(list(test.columns), preprocessor.columns)
+        np.testing.assert_array_equal(test.values, train.loc[100:109].values)
+
+        features = preprocessor.transform(self.train.drop(columns=["target"]))
+        self.assertEqual(list(features.columns), preprocessor.feature_columns)
+
+    def test_save_and_load(self):
+        preprocessor = HeartPreprocessor.fit(self.train)
+        f = StringIO()
+        preprocessor.save(f)
+        f.seek(0)
+        loaded = HeartPreprocessor.load(f)
+        pd.testing.assert_frame_equal(
+            loaded.transform(self.train), preprocessor.transform(self.train)
+        )
+
+        state = preprocessor.to_dict()
+        state["version"] = 0
+        with self.assertRaises(ValueError):
+            HeartPreprocessor.from_dict(state)
+
+
+class StatsTests(TestCase):
+    def test_sketch_exact_below_k(self):
+        values = np.random.RandomState(0).normal(size=500)
+        sketch = KLLSketch(k=1000)
+        sketch.update(values[:200])
+        sketch.update(np.append(values[200:], np.nan))
+        self.assertEqual(sketch.rank_error(), 0)
+        np.testing.assert_allclose(
+            sketch.quantile([0.25, 0.5, 0.75]),
+            pd.Series(values).quantile([0.25, 0.5, 0.75]).values,
+        )
+
+    def test_sketch_rank_error_bound(self):
+        values = np.random.RandomState(0).lognormal(size=200000)
+        sketch, other = KLLSketch(k=200), KLLSketch(k=200, seed=1)
+        for chunk in np.array_split(values[:100000], 10):
+            sketch.update(chunk)
+        other.update(values[100000:])
+        sketch.merge(other)
+        self.assertEqual(sketch.n, len(values))
+        self.assertLess(sketch.rank_error(), 0.05)
+        q = np.array([0.01, 0.25, 0.5, 0.75, 0.99])
+        ranks = np.searchsorted(np.sort(values), sketch.quantile(q)) / len(values)
+        self.assertLessEqual(np.abs(ranks - q).max(), sketch.rank_error())
+
+    def test_weighted_update(self):
+        sketch = KLLSketch()
+        sketch.update([1.0, 2.0, 3.0])
+        sketch.update([10.0], weight=3)
+        self.assertEqual(sketch.quantile(0.5), pd.Series([1, 2, 3, 10, 10, 10]).median())
+
+    def test_vif_and_chi2(self):
+        rng = np.random.RandomState(0)
+        x = rng.normal(100, 10, (300, 4))
+        x[:, 3] = x[:, 0] + x[:, 1] + rng.normal(0, 1, 300)
+        np.testing.assert_allclose(
+            variance_inflation_factors(x.T @ x, x.sum(axis=0), len(x)),
+            [variance_inflation_factor(x, i) for i in range(4)],
+        )
+
+        counts = rng.randint(0, 4, (300, 3)).astype(float)
+        y = rng.randint(0, 2, 300)
+        _, p_values = chi2_from_sums(
+            [counts[y == 0].sum(axis=0), counts[y == 1].sum(axis=0)],
+            [(y == 0).sum(), (y == 1).sum()],
+        )
+        np.testing.assert_allclose(p_values, chi2(counts, y)[1])
+
+    def test_fit_chunks_matches_fit(self):
+        rng = np.random.RandomState(0)
+        df = pd.DataFrame(
+            {column: rng.randint(0, 4, 400).astype(float) for column in HEART_SCHEMA.names}
+        )
+        for column in ("age", "trestbps", "chol", "thalach", "oldpeak"):
+            df[column] = rng.normal(100, 10, 400)
+        df["target"] = (df["ca"] >= 2).astype(int)
+        df.loc[:9, "chol"] = np.nan
+        with TemporaryDirectory() as tmp:
+            target = frame_target(os.path.join(tmp, "train"), HEART_SCHEMA, "parquet")
+            target.write(df)
+            streamed = HeartPreprocessor.fit_chunks(lambda: target.read_chunks(64))
+        exact = HeartPreprocessor.fit(df)
+        self.assertEqual(streamed.columns, exact.columns)
+        self.assertEqual(streamed.medians, exact.medians)
+        np.testing.assert_allclose(streamed.lower, exact.lower)
+        np.testing.assert_allclose(streamed.scale_max, exact.scale_max)
+
+
+class PredictionAppTests(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        rng = np.random.RandomState(0)
+        df = pd.DataFrame(
+            {column: rng.randint(0, 4, 100).astype(float) for column in HEART_SCHEMA.names}
+        )
+        df["target"] = (df["cp"] >= 2).astype(int)
+        preprocessor = HeartPreprocessor.fit(df)
+        with open(os.path.join(self.tmp.name, "preprocessor_v1.json"), "w") as f:
+            preprocessor.save(f)
+        train = preprocessor.transform(df)
+        clf = LogisticRegression().fit(
+            train[preprocessor.feature_columns], train["target"]
+        )
+        save_model(
+            clf,
+            os.path.join(self.tmp.name, "LogisticRegression_model"),
+            preprocessor.feature_columns,
+        )
+        self.record = df.drop(columns=["target"]).iloc[0].to_dict()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def call(self, app, method, path, payload=None):
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": json.dumps(payload).encode()}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": method, "path": path}
+        asyncio.run(app(scope, receive, send))
+        return messages[0]["status"], json.loads(messages[1]["body"])
+
+    def test_predict(self):
+        app = PredictionApp(self.tmp.name)
+        self.assertEqual(
+            self.call(app, "GET", "/models"), (200, ["LogisticRegression"])
+        )
+        status, prediction = self.call(app, "POST", "/predict", self.record)
+        self.assertEqual(status, 200)
+        self.assertTrue(0 <= prediction["LogisticRegression"]["probability"] <= 1)
+
+        status, predictions = self.call(
+            app, "POST", "/predict/batch", [self.record] * 3
+        )
+        self.assertEqual(len(predictions), 3)
+        self.assertEqual(predictions[0], prediction)
+        self.assertEqual(self.call(app, "POST", "/predict", {"age": "x"})[0], 400)
+        self.assertEqual(self.call(app, "POST", "/predict", [self.record])[0], 400)
+        self.assertEqual(self.call(app, "POST", "/predict/batch", self.record)[0], 400)
+        self.assertEqual(self.call(app, "POST", "/predict/batch", [])[0], 400)
+        self.assertEqual(self.call(app, "POST", "/predict/batch", [self.record, 1])[0], 400)
+
+    def test_micro_batching(self):
+        calls = []
+
+        def predict(rows):
+            calls.append(len(rows))
+            return {"model": rows["age"].values}
+
+        async def submit_all(batcher):
+            rows = [pd.DataFrame({"age": [i, i]}) for i in range(10)]
+            results = await asyncio.gather(*[batcher.submit(r) for r in rows])
+            await batcher.close()
+            return results
+
+        results = asyncio.run(submit_all(MicroBatcher(predict, max_wait=0.05)))
+        self.assertEqual(calls, [20])
+        self.assertEqual(list(results[3]["model"]), [3, 3])
+
+    def test_micro_batching_failures(self):
+        def predict(rows):
+            if (rows["age"] < 0).any():
+                raise ValueError("negative age")
+            return {"model": rows["age"].values}
+
+        async def submit_all(batcher):
+            cancelled = asyncio.ensure_future(batcher.submit(pd.DataFrame({"age": [9]})))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            rows = [pd.DataFrame({"age": [i]}) for i in (1, -1, 2)]
+            results = await asyncio.gather(
+                *[batcher.submit(r) for r in rows], return_exceptions=True
+            )
+            await batcher.close()
+            return results
+
+        results = asyncio.run(submit_all(MicroBatcher(predict, max_wait=0.05)))
+        self.assertEqual(list(results[0]["model"]), [1])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(list(results[2]["model"]), [2])
+
+
+class ZooTests(TestCase):
+    def test_cores_needed(self):
+        self.assertEqual(cores_needed({}, 8), 1)
+        self.assertEqual(cores_needed({"n_jobs": -1}, 8), 8)
+        self.assertEqual(cores_needed({"n_jobs": -2}, 8), 7)
+        self.assertEqual(cores_needed({"n_jobs": 16}, 8), 8)
+
+    def test_train_zoo(self):
+        x = pd.DataFrame({"a": [2, 3, 4, -1, -2, -3], "b": [1, 1, 1, 0, 0, 0]})
+        y = pd.Series([1, 1, 1, 0, 0, 0])
+        models = [
+            ("sklearn.linear_model.LogisticRegression", {}),
+            ("sklearn.ensemble.RandomForestClassifier", {"n_estimators": 5, "n_jobs": -1}),
+        ]
+        with TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, "lr"), os.path.join(tmp, "rf")]
+            results = train_zoo(models, x, y, paths, max_cores=2)
+            clf = load_model(paths[1])
+        self.assertEqual(
+            sorted(results), ["LogisticRegression", zoo_model_name(*models[1])]
+        )
+        self.assertEqual(results["LogisticRegression"][0], 1.0)
+        self.assertEqual(list(clf.feature_names_in_), ["a", "b"])
+        self.assertEqual(clf.n_jobs, 2)  # the cores reserved for it
+        self.assertEqual(list(clf.predict(x)), list(y))
+
+    def test_task(self):
+        # The models of the zoo are the outputs of Train tasks, which are then complete and do not fit them again
+        zoo = TrainZoo(models=[LogisticRegression])
+        self.assertEqual([train.output().path for train in zoo.trainings()],
+                         [zoo.output()["LogisticRegression"].path])
+        with local_storage():
+            self.assertTrue(build([TrainZoo(models=[LogisticRegression])], local_scheduler=True))
+            self.assertTrue(Train(model=LogisticRegression).complete())
+        experiment = parse_experiment({"data": ["heart.csv", "other.csv"], "models": [LogisticRegression]})
+        zoos = [task for task in zoo_tasks(experiment) if isinstance(task, TrainZoo)]
+        self.assertEqual([(task.data, task.models) for task in zoos],
+                         [(data, (ModelSpec.of(LogisticRegression),)) for data in ("heart.csv", "other.csv")])
+
+
+class TuneTests(TestCase):
+    def test_sample_candidates(self):
+        space = {"C": [0.1, 1.0, 10.0], "solver": ["lbfgs", "liblinear"]}
+        candidates = sample_candidates(space, 4, seed=0)
+        self.assertEqual(len(candidates), 4)
+        self.assertEqual(len({json.dumps(c, sort_keys=True) for c in candidates}), 4)
+        self.assertEqual(candidates, sample_candidates(space, 4, seed=0))
+        self.assertEqual(len(sample_candidates(space, 10, seed=0)), 6)
+
+    def test_successive_halving(self):
+        rng = np.random.RandomState(0)
+        x = rng.normal(size=(300, 3))
+        y = (x[:, 0] > 0).astype(int)
+        candidates = [
+            {"C": c} for c in (0.0001, 0.001, 0.01, 0.1, 0.5, 1.0, 10.0, 100.0, 1000.0)
+        ]
+        folds = stratified_folds(y, 3, 0)
+        best, trials = successive_halving(
+            "sklearn.linear_model.LogisticRegression", candidates, x, y, folds, eta=3
+        )
+        self.assertEqual(list(trials.groupby("rung").size()), [9, 3, 1])
+        self.assertEqual(
+            list(trials.groupby("rung")["resource"].first()), [50, 150, 300]
+        )
+        self.assertGreaterEqual(best["C"], 0.01)
+        self.assertTrue((trials["seconds"] > 0).all())
+
+    def test_time_budget(self):
+        x = np.arange(100).reshape(-1, 1)
+        y = np.arange(100) % 2
+        start = time.perf_counter()
+        with self.assertRaises(RuntimeError):
+            successive_halving(
+                "final_project.test_final_project.SlowClassifier",
+                [{"C": 1.0}, {"C": 10.0}],
+                x,
+                y,
+                y,
+                max_seconds=1,
+            )
+        self.assertLess(time.perf_counter() - start, 30)  # the running trials were killed
+
+
+def record_runs(path, model, n_runs):
+    registry = RunRegistry(path)
+    for i in range(n_runs):
+        registry.record(model, "train", i / n_runs, params={"run": i})
+    return n_runs
+
+
+class RegistryTests(TestCase):
+    def test_record_and_query(self):
+        with TemporaryDirectory() as tmp:
+            registry = RunRegistry(os.path.join(tmp, "registry.sqlite3"))
+            registry.record("A", "train", 0.5, params={"C": 1.0}, seconds=0.1)
+            registry.record("A", "train", 0.75, data_hash=data_hash([1, 2]))
+            registry.record("A", "test", 0.25)
+            registry.set_artifact("A", "train", "A_parameters.pkl")
+            self.assertEqual(registry.latest_scores("train"), {"A": 0.75})
+            runs = registry.runs("train")
+            self.assertEqual(list(runs["score"]), [0.5, 0.75])
+            self.assertEqual(json.loads(runs["params"][0]), {"C": 1.0})
+            self.assertEqual(list(runs["artifact_path"].isna()), [True, False])
+
+    def test_data_hash(self):
+        df = pd.DataFrame({"a": [1.0, 2.0]})
+        self.assertEqual(data_hash(df, df["a"]), data_hash(df.copy(), df["a"]))
+        self.assertNotEqual(data_hash(df), data_hash(df * 2))
+
+    def test_concurrent_writers(self):
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "registry.sqlite3")
+            with ProcessPoolExecutor(max_workers=4) as pool:
+                written = pool.map(
+                    record_runs, [path] * 8, ["M%d" % i for i in range(8)], [25] * 8
+                )
+                self.assertEqual(sum(written), 200)
+            runs = RunRegistry(path).runs()
+            self.assertEqual(len(runs), 200)
+            self.assertEqual(runs["id"].nunique(), 200)
+            self.assertEqual(len(RunRegistry(path).latest_scores("train")), 8)
+
+
+class CacheTests(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        get_config().set("cache", "path", os.path.join(self.tmp.name, "cache"))
+        CacheStage.runs.clear()
+
+    def tearDown(self):
+        get_config().remove_option("cache", "path")
+        self.tmp.cleanup()
+
+    def build(self, path, text):
+        with open(path, "w") as f:
+            f.write(text)
+        Register.clear_instance_cache()  # a new run sees the new data
+        self.assertTrue(build([CacheStage(path)], local_scheduler=True))
+        with open(path + ".upper") as f:
+            return f.read()
+
+    def test_rerun_only_on_change(self):
+        path = os.path.join(self.tmp.name, "data.txt")
+        self.assertEqual(self.build(path, "a"), "A")
+        self.assertEqual(self.build(path, "a"), "A")
+        self.assertEqual(len(CacheStage.runs), 1)
+        self.assertEqual(self.build(path, "b"), "B")
+        self.assertEqual(len(CacheStage.runs), 2)
+
+    def test_data_made_in_the_same_run(self):
+        # The salt taken while scheduling, before the data exists, is not recorded by the run
+        path = os.path.join(self.tmp.name, "data.txt")
+        Register.clear_instance_cache()
+        stage = CacheStage(path)
+        missing = task_salt(stage)  # as the output of BuildFeatures while scheduling
+        with open(path, "w") as f:
+            f.write("a")
+        self.assertTrue(build([stage], local_scheduler=True))
+        self.assertNotEqual(task_salt(stage), missing)
+        self.assertEqual(self.build(path, "a"), "A")
+        self.assertEqual(len(CacheStage.runs), 1)
+
+    def test_evict_least_recently_used(self):
+        manifests = os.path.join(self.tmp.name, "cache", "manifests")
+        for name, last_used in (("old", 1), ("new", 2)):
+            output = os.path.join(self.tmp.name, name + ".bin")
+            with open(output, "wb") as f:
+                f.write(b"x" * 100)
+            write_manifest(
+                os.path.join(manifests, name + ".json"),
+                {"salt": "", "outputs": [output], "last_used": last_used},
+            )
+        self.assertEqual(evict(150), 100)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "old.bin")))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, "new.bin")))
+        self.assertIsNone(read_manifest(os.path.join(manifests, "old.json")))
+        self.assertEqual(evict(150), 0)
+
+    def test_evict_folder(self):
+        output = os.path.join(self.tmp.name, "model")
+        os.makedirs(output)
+        for name in ("a", "b"):
+            with open(os.path.join(output, name), "wb") as f:
+                f.write(b"x" * 100)
+        write_manifest(
+            os.path.join(self.tmp.name, "cache", "manifests", "model.json"),
+            {"salt": "", "outputs": [output], "last_used": 1},
+        )
+        self.assertEqual(evict(100), 200)
+        self.assertFalse(os.path.exists(output))
+
+
+class EventTests(TestCase):
+    def setUp(self):
+        RecordingLayer.messages.clear()
+
+    def test_publish_does_not_wait(self):
+        publisher = EventPublisher(RecordingLayer(delay=0.05), "publish-test")
+        start = time.perf_counter()
+        for i in range(10):
+            publisher.publish({"kind": "rows", "rows": i})
+        self.assertLess(time.perf_counter() - start, 0.05)
+        publisher.flush(timeout=5)
+        messages = [
+            message for group, message in RecordingLayer.messages if group == "publish-test"
+        ]
+        self.assertEqual([message["event"]["rows"] for message in messages], list(range(10)))
+        self.assertEqual(messages[0]["type"], "pipeline.event")
+
+    def test_drop_when_full(self):
+        publisher = EventPublisher(RecordingLayer(delay=0.2), "drop-test", capacity=1)
+        for i in range(5):
+            publisher.publish({"kind": "rows", "rows": i})
+        self.assertGreaterEqual(publisher.dropped, 3)
+
+    def test_task_events(self):
+        get_config().set("events", "backend", __name__ + ".RecordingLayer")
+        try:
+            with TemporaryDirectory() as tmp:
+                build([EventStage(os.path.join(tmp, "out"))], local_scheduler=True)
+            get_publisher().flush(timeout=5)
+        finally:
+            get_config().remove_option("events", "backend")
+        events = [
+            message["event"]
+            for group, message in RecordingLayer.messages
+            if message["event"].get("task_family") == "EventStage"
+        ]
+        self.assertEqual([event["kind"] for event in events], ["start", "rows", "success"])
+        self.assertEqual(events[1]["rows"], 42)
+        self.assertGreaterEqual(events[2]["duration"], 0)
+        self.assertIsNone(get_publisher())
+
+
+class HistogramTests(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        rng = np.random.RandomState(0)
+        self.df = pd.DataFrame(
+            {"a": rng.normal(size=1000), "b": rng.uniform(-3, 7, size=1000), "c": np.full(1000, 2.0)}
+        )
+        self.df.loc[::10, "a"] = np.nan
+        self.csv = os.path.join(self.tmp.name, "heart.csv")
+        self.df.to_csv(self.csv, index=False)
+        self.df = pd.read_csv(self.csv)  # values as parsed, which may differ in the last digit
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def dataset(self):
+        path = os.path.join(self.tmp.name, "columnar")
+        build_columnar(self.csv, path, chunksize=300)
+        return ColumnarDataset(path)
+
+    def test_histogram(self):
+        dataset = self.dataset()
+        with patch("Visualizer.Visualizer.histograms.ROWS_PER_BLOCK", 128):
+            for column in ("a", "b", "c"):
+                values = self.df[column].dropna()
+                counts, edges = dataset.histogram(column, bins=50)
+                expected, expected_edges = np.histogram(values, bins=50, range=dataset.ranges[column])
+                np.testing.assert_array_equal(counts, expected)
+                np.testing.assert_allclose(edges, expected_edges)
+        self.assertEqual(dataset.histogram("a", bins=BASE_BINS)[0].sum(), 900)  # without missing values
+        with self.assertRaises(ValueError):
+            dataset.histogram("a", bins=48)
+
+    def test_filtered_histogram(self):
+        dataset = self.dataset()
+        edges = dataset.edges("b")
+        # A filter selects the whole base bins holding its bounds
+        low, high = (edges[100] + edges[101]) / 2, (edges[900] + edges[901]) / 2
+        inside = (self.df["b"] >= edges[100]) & (self.df["b"] < edges[901])
+        with patch("Visualizer.Visualizer.histograms.ROWS_PER_BLOCK", 128):
+            counts, _ = dataset.histogram("a", bins=25, filters={"b": (low, high)})
+            counts2d, _, _ = dataset.histogram2d("a", "b", bins=25, filters={"b": (low, high)})
+        values = self.df["a"][inside].dropna()
+        np.testing.assert_array_equal(counts, np.histogram(values, bins=25, range=dataset.ranges["a"])[0])
+        np.testing.assert_array_equal(counts2d.sum(axis=1), counts)
+        # The filtered histogram is not cached as the full one
+        self.assertEqual(dataset.histogram("a", bins=25)[0].sum(), 900)
+
+    def test_histogram2d(self):
+        dataset = self.dataset()
+        rows = self.df.dropna()
+        counts, x_edges, y_edges = dataset.histogram2d("a", "b", bins=50)
+        expected, expected_x, expected_y = np.histogram2d(
+            rows["a"], rows["b"], bins=50, range=[dataset.ranges["a"], dataset.ranges["b"]]
+        )
+        np.testing.assert_array_equal(counts, expected)
+        np.testing.assert_allclose(x_edges, expected_x)
+        np.testing.assert_allclose(y_edges, expected_y)
+
+    def test_dataset_cache(self):
+        cache = DatasetCache(os.path.join(self.tmp.name, "cache"), max_datasets=1)
+        dataset = cache.get(self.csv)
+        self.assertIs(cache.get(self.csv), dataset)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # A new version of the file replaces the copy of the old one
+        self.df.head(500).to_csv(self.csv, index=False)
+        changed = cache.get(self.csv)
+        self.assertIsNot(changed, dataset)
+        self.assertEqual(changed.histogram("b", bins=50)[0].sum(), 500)
+        self.assertEqual(len(os.listdir(cache.cache_dir)), 1)
+
+        # Least recently used datasets are dropped beyond max_datasets
+        other = os.path.join(self.tmp.name, "other.csv")
+        self.df.to_csv(other, index=False)
+        cache.get(other)
+        cache.get(self.csv)
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+
+class SyntheticTests(TestCase):
+    def test_schema_and_determinism(self):
+        df = generate(5000, seed=1)
+        self.assertEqual(list(df.columns), HEART_SCHEMA.names)
+        self.assertEqual(len(df), 5000)
+        pd.testing.assert_frame_equal(df, generate(5000, seed=1))
+        self.assertFalse(df.equals(generate(5000, seed=2)))
+        self.assertAlmostEqual(df["target"].mean(), 0.54, delta=0.03)
+        self.assertTrue(df["ca"].isin([0, 1, 2, 3, 4]).all())
+        self.assertTrue(df["oldpeak"].between(0, 6.2).all())
+
+    def test_chunks(self):
+        chunks = list(generate_chunks(2500, chunksize=1000))
+        self.assertEqual([len(chunk) for chunk in chunks], [1000, 1000, 500])
+
+    def test_write_csv_and_preprocess(self):
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "heart.csv")
+            write_csv(path, 2500, chunksize=1000)
+            df = pd.read_csv(path)
+        pd.testing.assert_frame_equal(
+            df.astype(float), pd.concat(generate_chunks(2500, chunksize=1000)).reset_index(drop=True).astype(float)
+        )
+        preprocessor = HeartPreprocessor.fit(df)
+        self.assertIn("thalach", preprocessor.columns)
+
+
+class BatchPredictTests(TestCase):
+    def test_output_path(self):
+        self.assertEqual(
+            BatchPredict(path="/tmp/new_patients.csv").output().path,
+            os.path.join(os.getcwd(), "data/heart/predictions/RandomForestClassifier_new_patients"),
+        )
+
+    def test_scoring_data_format(self):
+        self.assertEqual(ScoringData("records.parquet").output().frame_format, "parquet")
+        with self.assertRaises(ValueError):
+            ScoringData("records.json").output()
+
+    def test_batch_predict(self):
+        train = generate(2000, seed=1)
+        records = generate(2500, seed=2).drop(columns=["target"])
+        preprocessor = HeartPreprocessor.fit(train)
+        x = preprocessor.transform(train)
+        model = LogisticRegression().fit(x[preprocessor.feature_columns], x["target"])
+        with TemporaryDirectory() as tmp:
+            preprocessor_path = os.path.join(tmp, "preprocessor.json")
+            with open(preprocessor_path, "w") as f:
+                preprocessor.save(f)
+            model_path = os.path.join(tmp, "model")
+            save_model(model, model_path, preprocessor.feature_columns)
+            records_path = os.path.join(tmp, "records.csv")
+            records.to_csv(records_path, index=False)
+
+            output_dir = os.path.join(tmp, "predictions")
+            chunks = ScoringData(records_path).output().read_chunks(1000)
+            rows = batch_predict(chunks, preprocessor_path, model_path, output_dir, workers=2, max_pending=1)
+            self.assertEqual(rows, 2500)
+            self.assertEqual(len(os.listdir(output_dir)), 3)
+            predictions = pd.read_parquet(output_dir).sort_values("row")
+            probability, label = score_frame(preprocessor, LazyModel(model_path), records)
+        np.testing.assert_array_equal(predictions["row"].values, np.arange(2500))
+        np.testing.assert_allclose(predictions["probability"].values, probability)
+        np.testing.assert_array_equal(predictions["label"].values, label)
+
+
+class InferenceTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        train = generate(3000, seed=1)
+        cls.x_train, cls.y_train = train.drop(columns=["target"]), train["target"]
+        cls.x = generate(LARGE_BATCH + 50, seed=2).drop(columns=["target"])
+
+    def test_identical_to_sklearn(self):
+        for model in (
+            RandomForestClassifier(n_estimators=10, min_samples_leaf=3, random_state=0),
+            LogisticRegression(max_iter=1000),
+        ):
+            model.fit(self.x_train, self.y_train)
+            compiled = compile_model(model)
+            # Small batches are traversed by the compiled arrays, large ones tree by tree
+            for x in (self.x.iloc[:32], self.x):
+                np.testing.assert_array_equal(compiled.predict_proba(x.values), model.predict_proba(x))
+                np.testing.assert_array_equal(compiled.predict(x.values), model.predict(x))
+            np.testing.assert_array_equal(
+                compiled.predict_proba(self.x.values[0]), model.predict_proba(self.x.iloc[:1])
+            )
+
+    def test_unsupported(self):
+        with self.assertRaises(TypeError):
+            compile_model(HeartPreprocessor)
+        compiled = compile_model(LogisticRegression().fit(self.x_train, self.y_train))
+        with self.assertRaises(ValueError):
+            compiled.predict_proba(np.full(len(FEATURE_COLUMNS), np.nan))
+
+    def test_transform_values(self):
+        preprocessor = HeartPreprocessor.fit(generate(3000, seed=1))
+        raw = self.x.copy()
+        raw.iloc[::5, 3] = np.nan
+        raw.iloc[::7, FEATURE_COLUMNS.index("ca")] = 4
+        columns = preprocessor.feature_columns
+        np.testing.assert_array_equal(
+            preprocessor.transform_values(raw[FEATURE_COLUMNS].values, columns),
+            preprocessor.transform(raw)[columns].values,
+        )
+
+
+class ModelIOTests(TestCase):
+    def setUp(self):
+        self.x = pd.DataFrame({"a": [2, 3, 4, -1, -2, -3], "b": [1, 1, 1, 0, 0, 0]})
+        self.y = pd.Series([1, 1, 1, 0, 0, 0])
+        self.tmp = TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "LogisticRegression_model")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_save_and_load(self):
+        clf = LogisticRegression().fit(self.x, self.y)
+        save_model(clf, self.path, ["a", "b"], scores={"train": 1.0})
+        manifest = read_model_manifest(self.path)
+        self.assertEqual(manifest["estimator"], "sklearn.linear_model._logistic.LogisticRegression")
+        self.assertEqual(manifest["feature_names"], ["a", "b"])
+        self.assertEqual(manifest["scores"], {"train": 1.0})
+        loaded = load_model(self.path)
+        self.assertIsInstance(loaded.coef_, np.memmap)
+        np.testing.assert_array_equal(loaded.coef_, clf.coef_)
+        # Saving again replaces the folder
+        save_model(clf, self.path, ["a", "b"], compress=3)
+        self.assertNotIsInstance(load_model(self.path).coef_, np.memmap)
+        self.assertEqual(os.listdir(self.tmp.name), ["LogisticRegression_model"])
+
+    def test_lazy_model(self):
+        save_model(LogisticRegression().fit(self.x, self.y), self.path, ["a", "b"])
+        model = LazyModel(self.path)
+        self.assertEqual(model.feature_names, ["a", "b"])
+        self.assertFalse(model.loaded)
+        self.assertEqual(list(model.predict(self.x)), list(self.y))
+        self.assertTrue(model.loaded)
+
+    def test_refuses_modified_model(self):
+        save_model(LogisticRegression().fit(self.x, self.y), self.path, ["a", "b"])
+        with open(os.path.join(self.path, "model.joblib"), "ab") as f:
+            f.write(b"\0")
+        with self.assertRaises(ValueError):
+            load_model(self.path)
+        with open(os.path.join(self.path, "manifest.json")) as f:
+            manifest = json.load(f)
+        manifest["preprocessor_version"] = -1
+        with open(os.path.join(self.path, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+        with self.assertRaises(ValueError):
+            LazyModel(self.path)
+
+
+class ProfilingTests(TestCase):
+    def test_task_record(self):
+        with TemporaryDirectory() as tmp:
+            get_config().set("profiling", "path", os.path.join(tmp, "profile"))
+            try:
+                build([ProfileStage(os.path.join(tmp, "out"))], local_scheduler=True)
+                records = read_records()
+            finally:
+                get_config().remove_option("profiling", "path")
+            self.assertEqual(len(records), 1)
+            record = records[0]
+            self.assertEqual(record["task_family"], "ProfileStage")
+            self.assertEqual(record["status"], "success")
+            self.assertEqual((record["rows_in"], record["rows_out"]), (1000, 900))
+            self.assertGreaterEqual(record["bytes_written"], 100000)
+            self.assertGreater(record["peak_rss_mb"], 0)
+            self.assertGreaterEqual(record["wall_seconds"], record["spans"][0]["wall_seconds"])
+            self.assertEqual(record["spans"][0]["args"], {"rows": 1000})
+
+            trace_path = os.path.join(tmp, "trace.json")
+            write_chrome_trace(records, trace_path)
+            with open(trace_path) as f:
+                trace_events = json.load(f)["traceEvents"]
+        self.assertEqual([event["name"] for event in trace_events], ["ProfileStage", "write"])
+        self.assertEqual({event["ph"] for event in trace_events}, {"X"})
+        self.assertLessEqual(trace_events[0]["ts"], trace_events[1]["ts"])
+        self.assertIn("ProfileStage", summary_table(records).splitlines()[2])
+
+    def test_read_records_since(self):
+        with TemporaryDirectory() as tmp:
+            self.assertEqual(read_records(tmp), [])
+            with open(os.path.join(tmp, "tasks.jsonl"), "w") as f:
+                f.write(json.dumps({"start": 1.0}) + "\n" + json.dumps({"start": 2.0}) + "\n")
+            self.assertEqual(read_records(tmp, since=1.5), [{"start": 2.0}])
+
+
+class ExecutionTests(TestCase):
+    def tearDown(self):
+        for section in ("resources", "execution"):
+            get_config().remove_section(section)
+
+    def test_resources(self):
+        task = Train(model={"estimator": "sklearn.ensemble.RandomForestClassifier", "params": {"n_jobs": -1}})
+        self.assertEqual(task.resources, {})
+        get_config().add_section("resources")
+        get_config().set("resources", "cpu", "64")
+        get_config().set("resources", "memory_mb", "1000")
+        get_config().add_section("execution")
+        get_config().set("execution", "memory_mb", json.dumps({"Train": 4000}))
+        self.assertEqual(task.resources, {"cpu": os.cpu_count(), "memory_mb": 1000})
+        self.assertEqual(Train().resources["cpu"], 1)
+        self.assertEqual(task.retry_count, 3)
+
+    def test_retry_transient(self):
+        get_config().add_section("execution")
+        get_config().set("execution", "backoff_seconds", "0")
+        calls = []
+
+        @retry_transient
+        def flaky(error, failures):
+            calls.append(error)
+            if len(calls) <= failures:
+                raise error
+            return len(calls)
+
+        self.assertEqual(flaky(EndpointConnectionError(endpoint_url="s3"), 2), 3)
+        calls.clear()
+        with self.assertRaises(EndpointConnectionError):
+            flaky(EndpointConnectionError(endpoint_url="s3"), 3)
+        self.assertEqual(len(calls), 3)
+        calls.clear()
+        with self.assertRaises(ValueError):
+            flaky(ValueError(), 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_missing_raw_data(self):
+        # Workers kept alive for retries stop once the missing raw data was checked retry_count times
+        options = {("scheduler", "retry_delay"): "0.1", ("worker", "keep_alive"): "true",
+                   ("worker", "retry_external_tasks"): "true", ("worker", "wait_interval"): "0.1",
+                   ("worker", "wait_jitter"): "0"}
+        for (section, option), value in options.items():
+            if not get_config().has_section(section):
+                get_config().add_section(section)
+            get_config().set(section, option, value)
+        try:
+            with local_storage():
+                start = time.perf_counter()
+                self.assertFalse(build([TrainTestSplit("missing.csv")], local_scheduler=True))
+                self.assertLess(time.perf_counter() - start, 60)
+        finally:
+            for section, option in options:
+                get_config().remove_option(section, option)
+        self.assertEqual(RawData("missing.csv").retry_count, 3)
+
+    def test_central_scheduler(self):
+        # Two worker processes share a luigid; the failing first run of a task is retried
+        with TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, "%d.txt" % i) for i in range(6)]
+            flaky = os.path.join(tmp, "failed")
+            with central_scheduler({"cpu": 2}, retry_delay=0.5) as url:
+                with ProcessPoolExecutor(max_workers=2) as pool:
+                    results = list(pool.map(build_on_scheduler, [url] * 2, [paths] * 2, [flaky] * 2))
+            self.assertTrue(all(results))
+            self.assertTrue(os.path.exists(flaky))
+            for path in paths:
+                self.assertTrue(os.path.isfile(path))
+
+
+class IncrementalTests(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.folder = os.path.join(self.tmp.name, "partitions")
+        self.data = generate(3000, seed=1)
+        for start in (0, 1000):
+            append_partition(self.folder, self.data.iloc[start:start + 1000])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_partial_fit(self):
+        spec = ModelSpec.of(IncrementalTrain().model)
+        model = IncrementalModel(os.path.join(self.tmp.name, "model"), spec)
+        self.assertTrue(model.update(self.folder)["rebuilt"])
+        self.assertTrue(model.is_current(self.folder))
+        coef = model.clf.coef_.copy()
+        append_partition(self.folder, self.data.iloc[2000:])
+        self.assertEqual(list_partitions(self.folder), ["part-000000.csv", "part-000001.csv", "part-000002.csv"])
+        self.assertFalse(model.is_current(self.folder))
+        summary = model.update(self.folder)
+        self.assertFalse(summary["rebuilt"])
+        self.assertEqual((summary["new_rows"], summary["rows"]), (1000, 3000))
+        self.assertGreater(summary["score"], 0.8)
+        self.assertFalse(np.array_equal(model.clf.coef_, coef))
+        # The running statistics match those of all rows
+        reloaded = IncrementalModel(model.path, spec)
+        self.assertTrue(reloaded.load())
+        age = reloaded.state["statistics"]["age"]
+        self.assertAlmostEqual(age["mean"], self.data["age"].mean())
+        self.assertAlmostEqual(age["m2"] / (age["n"] - 1), self.data["age"].var())
+
+    def test_forest_and_drift(self):
+        spec = ModelSpec(
+            "sklearn.ensemble.RandomForestClassifier", {"n_estimators": 5, "random_state": 0}
+        )
+        model = IncrementalModel(os.path.join(self.tmp.name, "model"), spec)
+        model.update(self.folder)
+        append_partition(self.folder, self.data.iloc[2000:2500])
+        self.assertFalse(model.update(self.folder)["rebuilt"])
+        self.assertEqual(len(model.clf.estimators_), 15)
+        drifted = self.data.iloc[2500:].copy()
+        drifted["thalach"] += 40
+        append_partition(self.folder, drifted)
+        summary = model.update(self.folder)
+        self.assertEqual(summary["reason"], "drift in thalach")
+        self.assertEqual((len(model.clf.estimators_), model.state["rebuilds"]), (5, 2))
+
+    def test_forest_partitions_missing_a_class(self):
+        spec = ModelSpec(
+            "sklearn.ensemble.RandomForestClassifier", {"n_estimators": 5, "random_state": 0}
+        )
+        model = IncrementalModel(os.path.join(self.tmp.name, "model"), spec)
+        model.update(self.folder)
+        rest = self.data.iloc[2000:]
+        append_partition(self.folder, rest[rest["target"] == 1].iloc[:50])
+        with self.assertLogs("luigi-interface", "WARNING"):
+            self.assertFalse(model.update(self.folder)["rebuilt"])
+        self.assertEqual((len(model.clf.estimators_), model.state["untrained"]), (5, ["part-000002.csv"]))
+        # The kept rows are trained on with those of the next partition
+        append_partition(self.folder, rest[rest["target"] == 0].iloc[:50])
+        self.assertFalse(model.update(self.folder)["rebuilt"])
+        self.assertEqual((len(model.clf.estimators_), model.state["untrained"]), (15, []))
+
+    def test_population_stability_index(self):
+        self.assertEqual(population_stability_index([10, 20, 30], [1, 2, 3]), 0.0)
+        self.assertGreater(population_stability_index([10, 20, 30], [30, 20, 10]), 0.2)
+
+
+class EvaluationTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.y = rng.random(500) < 0.4
+        # Rounded scores have ties, which the curves must handle like scikit-learn
+        self.scores = np.vstack([np.round(0.3 * self.y + 0.7 * rng.random(500), 2), rng.random(500)])
+
+    def test_metrics(self):
+        report, thresholds = evaluate(["tied", "random"], self.y, self.scores, n_bootstrap=50)
+        for name, score in zip(["tied", "random"], self.scores):
+            metrics = report["models"][name]
+            self.assertAlmostEqual(metrics["roc_auc"], roc_auc_score(self.y, score))
+            self.assertAlmostEqual(metrics["pr_auc"], average_precision_score(self.y, score))
+            self.assertAlmostEqual(metrics["brier"], brier_score_loss(self.y, score))
+            self.assertEqual(metrics["confusion_matrix"], confusion_matrix(self.y, score > 0.5).tolist())
+            low, high = metrics["intervals"]["roc_auc"]
+            self.assertLess(low, metrics["roc_auc"])
+            self.assertGreater(high, metrics["roc_auc"])
+        row = thresholds[(thresholds["model"] == "tied") & np.isclose(thresholds["threshold"], 0.7)].iloc[0]
+        self.assertEqual(row["tp"], np.sum(self.y & (self.scores[0] >= row["threshold"])))
+        self.assertEqual(row["fp"], np.sum(~self.y & (self.scores[0] >= row["threshold"])))
+
+    def test_bootstrap(self):
+        # The replicates only depend on the seed, not on how they are split into chunks and workers
+        with patch("final_project.evaluation.CHUNK_CELLS", 500 * 7):
+            replicates = bootstrap(self.y, self.scores, 30, seed=1, max_workers=1)
+            parallel = bootstrap(self.y, self.scores, 30, seed=1, max_workers=2)
+        self.assertEqual(replicates["roc_auc"].shape, (30, 2))
+        for metric, values in replicates.items():
+            np.testing.assert_array_equal(values, parallel[metric])
+            self.assertTrue(np.isfinite(values).all())
+        # Every replicate is one resample of the rows, scored for both models
+        index = np.random.default_rng([1, 0]).integers(0, 500, size=(7, 500))[0]
+        for model in range(2):
+            self.assertAlmostEqual(replicates["roc_auc"][0, model],
+                                   roc_auc_score(self.y[index], self.scores[model, index]))
+
+    def test_calibration(self):
+        counts, mean_predicted, fraction_positive, ece = calibration(np.array([0, 1, 1, 1.0]),
+                                                                     np.array([[0.05, 0.95, 0.95, 1.0]]))
+        self.assertEqual(counts.tolist(), [[1, 0, 0, 0, 0, 0, 0, 0, 0, 3]])
+        self.assertAlmostEqual(mean_predicted[0, 9], 29 / 30)
+        self.assertAlmostEqual(ece[0], (0.05 + 3 * (1 - 29 / 30)) / 4)
+
+    def test_task(self):
+        task = Evaluate(models=[LogisticRegression, "sklearn.ensemble.RandomForestClassifier"])
+        self.assertEqual(Evaluate.from_str_params(task.to_str_params()).task_id, task.task_id)
+        self.assertEqual([train.model for train in task.requires()["models"]],
+                         [ModelSpec.of(LogisticRegression), ModelSpec.of(RandomForestClassifier)])
+        # Evaluations of other data files or lists of models have their own outputs
+        paths = {Evaluate(data=data, models=models).output()["report"].path
+                 for data in ("heart.csv", "other.csv") for models in ([LogisticRegression], task.models)}
+        self.assertEqual(len(paths), 4)
+
+
+class ReportTests(TestCase):
+    charts = [{"title": "ROC-AUC", "kind": "bar", "x": ["a", "b"], "y": [0.8, 0.9],
+               "intervals": [[0.7, 0.85], [0.85, 0.95]], "xlabel": "Model Names", "ylabel": "ROC-AUC"}]
+
+    def test_render(self):
+        spec = {"digest": spec_digest(self.charts), "charts": self.charts}
+        with TemporaryDirectory() as tmp:
+            spec_path, png_path = os.path.join(tmp, "report.json"), os.path.join(tmp, "plotting.png")
+            with open(spec_path, "w") as f:
+                json.dump(spec, f)
+            self.assertIsNone(rendered_digest(png_path))
+            render_in_background(spec_path, png_path)
+            self.assertTrue(wait_for_renders(120, pattern=os.path.join(tmp, "*.render")))
+            with open(png_path, "rb") as f:
+                self.assertEqual(f.read(8), b"\x89PNG\r\n\x1a\n")
+            self.assertEqual(rendered_digest(png_path), spec["digest"])
+
+    def test_render_failure(self):
+        with TemporaryDirectory() as tmp:
+            spec_path, png_path = os.path.join(tmp, "report.json"), os.path.join(tmp, "plotting.png")
+            with open(spec_path, "w") as f:
+                json.dump({"digest": "no charts"}, f)
+            # Started in a forked process, which ends before the render like a luigi worker
+            process = Process(target=render_in_background, args=(spec_path, png_path))
+            process.start()
+            process.join()
+            pattern = os.path.join(tmp, "*.render")
+            with self.assertLogs("luigi-interface", "ERROR") as logs:
+                self.assertFalse(wait_for_renders(120, pattern=pattern))
+            self.assertIn("KeyError", logs.output[0])
+            self.assertTrue(wait_for_renders(120, since=time.time(), pattern=pattern))
+
+    def test_digest(self):
+        changed = [dict(self.charts[0], y=[0.8, 0.91])]
+        self.assertEqual(spec_digest(self.charts), spec_digest(json.loads(json.dumps(self.charts))))
+        self.assertNotEqual(spec_digest(self.charts), spec_digest(changed))
+
+    def test_requires(self):
+        task = Report(models=[LogisticRegression])
+        self.assertEqual([test.model for test in task.requires()["tests"]], [ModelSpec.of(LogisticRegression)])
+        self.assertEqual(task.requires()["evaluation"].models, task.models)
+        # Rendering the png or not makes the same report
+        self.assertEqual(Report(models=[LogisticRegression], png=False).task_id, task.task_id)
+        # Reports of other data files or lists of models have their own outputs
+        reports = [Report(data=data, models=models) for data in ("heart.csv", "other.csv")
+                   for models in ([LogisticRegression], [LogisticRegression, RandomForestClassifier])]
+        self.assertEqual(len({report.output().path for report in reports}), 4)
+        self.assertEqual(len({report.png_path for report in reports}), 4)
+
+
+class ExperimentTests(TestCase):
+    def test_model_spec(self):
+        spec = ModelSpec.of(RandomForestClassifier)
+        self.assertEqual(spec.path, "sklearn.ensemble.RandomForestClassifier")
+        self.assertEqual(spec, ModelSpec.of("sklearn.ensemble._forest.RandomForestClassifier"))
+        self.assertEqual(spec.name, "RandomForestClassifier")
+        tuned = ModelSpec.of({"estimator": "sklearn.linear_model.LogisticRegression", "params": {"C": 0.5}})
+        self.assertEqual(ModelSpec.of(tuned.to_json()), tuned)
+        self.assertIs(tuned.estimator, LogisticRegression)
+        self.assertEqual(tuned.name, zoo_model_name(tuned.path, {"C": 0.5}))
+        with self.assertRaises(ValueError):
+            ModelSpec.of({"estimator": "sklearn.linear_model.LogisticRegression", "C": 0.5})
+
+    def test_task_ids(self):
+        # Models given as classes, paths or json make the same tasks, and the ids survive a round trip through strings
+        self.assertEqual(TestModel(model=LogisticRegression).task_id,
+                         TestModel(model="sklearn.linear_model.LogisticRegression").task_id)
+        task = Train(model={"estimator": "sklearn.linear_model.LogisticRegression", "params": {"C": 0.5}})
+        self.assertEqual(Train.from_str_params(task.to_str_params()).task_id, task.task_id)
+        self.assertNotEqual(task.task_id, Train(model=LogisticRegression).task_id)
+        self.assertTrue(task.output().path.endswith(task.model.name + "_model"))
+
+    def test_load_experiment(self):
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "experiment.yaml")
+            with open(path, "w") as f:
+                f.write("data: [heart.csv, other.csv]\nworkers: 3\nmodels:\n"
+                        "  - sklearn.ensemble.RandomForestClassifier\n"
+                        "  - estimator: sklearn.linear_model.LogisticRegression\n"
+                        "    params: {C: 0.5}\n")
+            experiment = load_experiment(path)
+        self.assertEqual(experiment["workers"], 3)
+        self.assertEqual(experiment["models"][1].params, {"C": 0.5})
+        tasks = experiment_tasks(experiment)
+        self.assertEqual(len([task for task in tasks if isinstance(task, TestModel)]), 4)
+        self.assertEqual({task.data for task in tasks}, {"heart.csv", "other.csv"})
+
+    def test_outputs_by_data(self):
+        # The tasks of different data files of an experiment run at once and must not share outputs
+        paths = []
+        for data in ("heart.csv", "other.csv"):
+            paths += [target.path for target in TrainTestSplit(data).output().values()]
+            paths += [FitPreprocessor(data).output().path, PreProcessing(data, "train").output().path]
+            paths += [Train(data, model=LogisticRegression).output().path,
+                      TestModel(data, model=LogisticRegression).output().path]
+        self.assertEqual(len(set(paths)), len(paths))
+        self.assertEqual(os.path.dirname(Train(model=LogisticRegression).output().path),
+                         os.path.join(os.getcwd(), "data", "heart"))
+
+    def test_parse_experiment(self):
+        experiment = parse_experiment(DEFAULT_EXPERIMENT)
+        self.assertEqual([model.estimator for model in experiment["models"]],
+                         [RandomForestClassifier, LogisticRegression])
+        for config in ({"models": []}, {"model": ["sklearn.linear_model.LogisticRegression"]},
+                       {"models": [LogisticRegression, LogisticRegression]},
+                       {"models": [LogisticRegression], "workers": 0}):
+            with self.assertRaises(ValueError):
+                parse_experiment(config)
+
+
 class TestModelTests(TestCase):
     def test_params(self):
         self.assertEqual(len(TestModel().get_params()), 4)
@@ -144,7 +1650,7 @@ class TestModelTests(TestCase):
 
     def test_output_path(self):
         self.assertEqual(
-            TestModel().output().path, os.path.join(os.getcwd(), "data/plotting.png")
+            TestModel().output().path, os.path.join(os.getcwd(), "data/heart/RandomForestClassifier_test_score.json")
         )
 
     def test_model_performance(self):
@@ -157,9 +1663,10 @@ class TestModelTests(TestCase):
         self.assertTrue(0 <= acc_score <= 1)
 
     def test_run(self):
-        build(
-            [TestModel(model=LogisticRegression, source_test="test")],
-            local_scheduler=True,
-        )
+        with local_storage():
+            build(
+                [TestModel(model=LogisticRegression, source_test="test")],
+                local_scheduler=True,
+            )
 
-        self.assertTrue(os.path.isfile(TestModel().output().path))
+        self.assertTrue(os.path.isfile(TestModel(model=LogisticRegression).output().path))
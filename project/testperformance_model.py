@@ -1,24 +1,42 @@
+import json
 import os
-import pickle
+import time
 from functools import wraps
 
 import pandas as pd
-from luigi import LocalTarget, Parameter, Task, format
-from sklearn.ensemble import RandomForestClassifier
-
-from .preprocess_data import PreProcessing
+from luigi import LocalTarget, Parameter
+
+from .caching import CachedTask
+from .estimators import ModelSpecParameter
+from .events import ROWS_PROCESSED, publish
+from .features import BuildFeatures, FeatureSet
+from .load_data import data_output_path
+from .model_io import LazyModel
+from .profiling import span
+from .registry import data_hash, get_registry
 from .train import Train
 
 SHARED_RELATIVE_PATH = "data"
 
-registered_models_and_scores = {}
-
 
 def register(func):
+    """Decorator to register model name, test data hash, score and scoring time in the run registry. """
+
     @wraps(func)
-    def wrapped(*args, **kwargs):
-        model_name, testing_score = func(*args, **kwargs)
-        registered_models_and_scores[model_name + "_testing_score"] = testing_score
+    def wrapped(model_name, loaded_model, x_test, y_test, *args, **kwargs):
+        start = time.perf_counter()
+        with span("score " + model_name, rows=len(x_test)):
+            model_name, testing_score = func(
+                model_name, loaded_model, x_test, y_test, *args, **kwargs
+            )
+        get_registry().record(
+            model_name,
+            "test",
+            testing_score,
+            params=loaded_model.get_params(),
+            data_hash=data_hash(x_test, y_test),
+            seconds=time.perf_counter() - start,
+        )
         return model_name, testing_score
 
     return wrapped
@@ -30,53 +48,61 @@ def model_performance(model_name, loaded_model, x_test, y_test):
     return model_name, acc_score
 
 
-class TestModel(Task):
-    """ Takes data, source_train, source_test and model as parameters. It is suggested to set source_train parameter to "train" and source_test parameter to 'test'.
-    Plots test scores to a Local Target output file (defined in output method.)
+class TestModel(CachedTask):
+    """ Takes data, source_train, source_test and model (a model spec, see estimators) as parameters.
+    It is suggested to set source_train parameter to "train" and source_test parameter to 'test'.
+    Saves the test score of the model as json to a Local Target output file (defined in output method.) The scores of all models are plotted by the Report task.
     """
 
     data = Parameter(default="heart.csv")
     source_train = Parameter(default="train")
-    model = Parameter(default=RandomForestClassifier)
+    model = ModelSpecParameter(default="sklearn.ensemble.RandomForestClassifier")
     source_test = Parameter(default="test")
 
     def requires(self):
         return {
             "model_param": Train(self.data, self.source_train, self.model),
-            "test_data": PreProcessing(self.data, self.source_test),
+            "test_data": BuildFeatures(self.data),
         }
 
     def output(self):
-        path = os.path.join(os.path.abspath(SHARED_RELATIVE_PATH), "plotting" + ".png")
-        return LocalTarget(path, format=format.Nop)
+        name = self.model.name + "_" + self.source_test + "_score.json"
+        return LocalTarget(data_output_path(self.data, name))
 
     def run(self):
-        """Loads trained model and tests model performance on pretrained test data. Plots model scores and saves it in the output file."""
-        loaded_model = pickle.load(open(self.input()["model_param"].path, "rb"))
-        df_test = pd.read_csv(self.input()["test_data"].path)
-        x_test = df_test.drop(columns=["target"])
-        y_test = df_test["target"]
-        model_name = os.path.splitext(
-            os.path.basename(self.input()["model_param"].path)
-        )[0]
-        model_performance(model_name, loaded_model, x_test, y_test)
-        df_registered_models = pd.DataFrame.from_dict(
-            registered_models_and_scores, orient="index"
+        """Loads trained model and tests model performance on pretrained test data. Saves the score in the output file."""
+        model_path = self.input()["model_param"].path
+        loaded_model = LazyModel(model_path)
+        features = FeatureSet(self.input()["test_data"].path)
+        # Columns in the order the model was fitted on
+        x_test = features.frame(self.source_test, loaded_model.feature_names)
+        y_test = features.target(self.source_test)
+        model_name = os.path.basename(model_path)[: -len("_model")]
+        _, testing_score = model_performance(
+            model_name, loaded_model, x_test, y_test
         )
-        plot = df_registered_models.plot.bar(
-            title="Model scores on Test data set", legend=False
-        )
-        plot.set_xlabel("Model Names")
-        plot.set_ylabel("Model scores")
-        fig = plot.get_figure()
-        fig.savefig(self.output().path, bbox_inches="tight", dpi=100)
+        get_registry().set_artifact(model_name, "test", model_path)
+        self.trigger_event(ROWS_PROCESSED, self, len(x_test))
+        with self.output().open("w") as f:
+            json.dump(
+                {"model": model_name, "score": testing_score, "rows": len(x_test)}, f
+            )
         self.show_registered()
 
+    def registered_models_and_scores(self):
+        """Returns the latest test scores of all registered models"""
+        return {
+            model + "_testing_score": score
+            for model, score in get_registry().latest_scores("test").items()
+        }
+
     def show_registered(self):
-        """ Model score is shown when running luigi pipeline. Saves registered model scores to shared relative path folder"""
+        """ Model score is shown when running luigi pipeline. Saves the latest test scores of all registered models to shared relative path folder"""
+        registered_models_and_scores = self.registered_models_and_scores()
         print("***********************")
         print("Registered_models_and_training_scores:", registered_models_and_scores)
         print("***********************")
+        publish("scores", stage="test", scores=registered_models_and_scores)
         df_registered_models = pd.DataFrame.from_dict(
             registered_models_and_scores, orient="index",
         )
@@ -1,76 +1,123 @@
+import json
 import os
-import pickle
+import time
 from functools import wraps
 
 import pandas as pd
-from luigi import LocalTarget, Parameter, Task, format
-from sklearn.ensemble import RandomForestClassifier
+from luigi import BoolParameter, LocalTarget, Parameter
 from sklearn.metrics import accuracy_score
 
-from .preprocess_data import PreProcessing
+from . import estimators, features, model_io
+from .caching import CachedTask
+from .estimators import ModelSpecParameter
+from .events import ROWS_PROCESSED, publish
+from .features import BuildFeatures, FeatureSet
+from .load_data import data_output_path
+from .model_io import save_model
+from .profiling import span
+from .registry import data_hash, get_registry
+from .tune import Tune
+from .zoo import cores_needed
 
 SHARED_RELATIVE_PATH = "data"
 
-registered_models_and_scores = {}
-
 
 def register(func):
-    """Decorator to register model name and scores. """
+    """Decorator to register model name, parameters, training data hash, score and fit time in the run registry. """
 
     @wraps(func)
-    def wrapped(*args, **kwargs):
-        clf, model_name, training_score = func(*args, **kwargs)
-        registered_models_and_scores[model_name + "_training_score"] = training_score
-
+    def wrapped(model, x_train, y_train, *args, **kwargs):
+        start = time.perf_counter()
+        with span("fit " + model.__name__, rows=len(x_train)):
+            clf, model_name, training_score = func(
+                model, x_train, y_train, *args, **kwargs
+            )
+        get_registry().record(
+            model_name,
+            "train",
+            training_score,
+            params=clf.get_params(),
+            data_hash=data_hash(x_train, y_train),
+            seconds=time.perf_counter() - start,
+        )
         return clf, model_name, training_score
 
     return wrapped
 
 
 @register
-def fit_model(model, x_train, y_train):
-    """Takes a model name and data. Fits the model. Returns trained model, model name and accuracy score on the same data"""
-    clf = model()
+def fit_model(model, x_train, y_train, params=None, name=None):
+    """Takes a model class, data, optional hyperparameters and registry name (default: the class name).
+    Fits the model. Returns trained model, model name and accuracy score on the same data"""
+    clf = model(**(params or {}))
     clf.fit(x_train, y_train)
     y_train_pred = clf.predict(x_train)
-    return clf, model.__name__, accuracy_score(y_train, y_train_pred)
+    return clf, name or model.__name__, accuracy_score(y_train, y_train_pred)
 
 
-class Train(Task):
-    """ Takes data, train_or_test and model as parameters. It is suggested to set train_or_test parameter to "train".
-     Saves trained model parameters to output file defined in output method"
+class Train(CachedTask):
+    """ Takes data, train_or_test and model (a model spec, see estimators) as parameters. It is suggested to set train_or_test parameter to "train".
+     With tuned=True, the model is fitted with the best hyperparameters found by the Tune task, which override those of the spec.
+     The features of the train_or_test split are read from the feature store (see features).
+     Saves the trained model as a model folder (see model_io) to the local folder of the data (see output method)"
     """
 
     data = Parameter(default="heart.csv")
     train_or_test = Parameter("train")
-    model = Parameter(default=RandomForestClassifier)
+    model = ModelSpecParameter(default="sklearn.ensemble.RandomForestClassifier")
+    tuned = BoolParameter(default=False)
+
+    salt_modules = (estimators, features, model_io)
+
+    def cores(self):
+        return cores_needed(self.model.params, os.cpu_count())
 
     def requires(self):
-        return PreProcessing(self.data, self.train_or_test)
+        if self.tuned:
+            return {
+                "data": BuildFeatures(self.data),
+                "tuning": Tune(
+                    self.data, self.train_or_test, model=self.model.path
+                ),
+            }
+        return BuildFeatures(self.data)
 
     def output(self):
         """Returns Local Target"""
-        path = os.path.join(
-            os.path.abspath(SHARED_RELATIVE_PATH),
-            self.model.__name__ + "_parameters" + ".pkl",
-        )
-        return LocalTarget(path, format=format.Nop)
+        name = self.model.name + ("_tuned" if self.tuned else "")
+        return LocalTarget(data_output_path(self.data, name + "_model"))
 
     def run(self):
-        """Calls fit_model method to train the model. Then saves model parameters to output file."""
-        df = pd.read_csv(self.input().open("r"))
-        x_train = df.drop(columns=["target"])
-        y_train = df["target"]
-        clf, model_name, acc_score = fit_model(self.model, x_train, y_train)
-        with open(self.output().path, "wb") as f:
-            pickle.dump(clf, f)
+        """Calls fit_model method to train the model. Then saves the model with its manifest to the output folder."""
+        params = dict(self.model.params)
+        if self.tuned:
+            with self.input()["tuning"]["params"].open("r") as f:
+                params.update(json.load(f))
+            features = FeatureSet(self.input()["data"].path)
+        else:
+            features = FeatureSet(self.input().path)
+        x_train = features.frame(self.train_or_test)
+        y_train = features.target(self.train_or_test)
+        clf, model_name, acc_score = fit_model(
+            self.model.estimator, x_train, y_train, params, self.model.name
+        )
+        save_model(
+            clf, self.output().path, x_train.columns, scores={"train": acc_score}
+        )
+        get_registry().set_artifact(model_name, "train", self.output().path)
+        self.trigger_event(ROWS_PROCESSED, self, len(x_train))
         self.show_registered()
 
     def show_registered(self):
-        """ Model score is shown when running luigi pipeline. Saves registered model scores to shared relative path folder"""
+        """ Model score is shown when running luigi pipeline. Saves the latest training scores of all registered models to shared relative path folder"""
+        registered_models_and_scores = {
+            model + "_training_score": score
+            for model, score in get_registry().latest_scores("train").items()
+        }
         print("####################")
         print("Registered_models_and_training_scores:", registered_models_and_scores)
         print("####################")
+        publish("scores", stage="train", scores=registered_models_and_scores)
         df_registered_models = pd.DataFrame.from_dict(
             registered_models_and_scores, orient="index"
         )
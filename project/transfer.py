@@ -0,0 +1,266 @@
+"""Chunked, streaming transfers between local files and S3.
+
+Files are never read into memory as a whole: uploads are sent as a multipart upload
+and downloads are fetched as parallel byte ranges written straight to disk. Both
+directions keep a small JSON state file next to the partial transfer so that an
+interrupted transfer can be resumed, and both verify checksums before finishing.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .monitor import peak_rss_mb
+
+CHUNK_SIZE = 8 * 1024 * 1024  # S3 requires every part but the last to be >= 5 MiB
+READ_SIZE = 1024 * 1024  # buffer size when streaming a single part or range
+MAX_WORKERS = 4  # parts or ranges in flight at once
+CHECKSUM_METADATA_KEY = "sha256"  # object metadata key holding the sha256 of the file
+
+TransferStats = namedtuple(
+    "TransferStats", ["nbytes", "seconds", "throughput_mb_s", "peak_rss_mb"]
+)
+
+
+class ChecksumMismatch(Exception):
+    """Raised when transferred bytes do not match the expected checksum"""
+
+
+def split_s3_path(path):
+    """Splits an s3://bucket/key path into bucket and key"""
+    if not path.startswith("s3://"):
+        raise ValueError("Not an s3 path: " + path)
+    bucket, _, key = path[len("s3://") :].partition("/")
+    return bucket, key
+
+
+def _hash_file(path, algo, read_size=READ_SIZE):
+    """Returns the hex digest of a local file with the hashlib algorithm algo, reading it in chunks"""
+    digest = hashlib.new(algo)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(read_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_sha256(path, read_size=READ_SIZE):
+    """Returns the hex sha256 of a local file, reading it in chunks"""
+    return _hash_file(path, "sha256", read_size)
+
+
+def make_stats(nbytes, start):
+    """Returns the TransferStats of nbytes transferred since start (a time.perf_counter())"""
+    seconds = max(time.perf_counter() - start, 1e-9)
+    return TransferStats(
+        nbytes, seconds, nbytes / seconds / (1024 * 1024), peak_rss_mb()
+    )
+
+
+def _load_state(state_path):
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            return json.load(f)
+    return None
+
+
+def _save_state(state_path, state):
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def _read_part(path, offset, size):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def upload_file(
+    client,
+    local_path,
+    s3_path,
+    chunk_size=CHUNK_SIZE,
+    max_workers=MAX_WORKERS,
+    state_path=None,
+):
+    """Uploads a local file to s3_path with a boto3 client and returns TransferStats.
+
+    Files larger than chunk_size are sent as a multipart upload with at most
+    max_workers parts held in memory. Each part carries a Content-MD5 header so S3
+    rejects corrupted parts, and the sha256 of the whole file is stored in the object
+    metadata for download-side verification. If a previous upload of the same file was
+    interrupted, the parts S3 already holds are reused.
+    """
+    start = time.perf_counter()
+    bucket, key = split_s3_path(s3_path)
+    size = os.path.getsize(local_path)
+    sha256 = file_sha256(local_path)
+    metadata = {CHECKSUM_METADATA_KEY: sha256}
+
+    if size <= chunk_size:
+        body = _read_part(local_path, 0, size)
+        client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=body,
+            ContentMD5=base64.b64encode(hashlib.md5(body).digest()).decode(),
+            Metadata=metadata,
+        )
+        return make_stats(size, start)
+
+    state_path = state_path or local_path + ".upload.json"
+    state = _load_state(state_path)
+    if (
+        state is None
+        or state["sha256"] != sha256
+        or state["s3_path"] != s3_path
+        or state["chunk_size"] != chunk_size
+    ):
+        upload_id = client.create_multipart_upload(
+            Bucket=bucket, Key=key, Metadata=metadata
+        )["UploadId"]
+        state = dict(
+            upload_id=upload_id, sha256=sha256, s3_path=s3_path, chunk_size=chunk_size
+        )
+        _save_state(state_path, state)
+    upload_id = state["upload_id"]
+
+    # parts already stored by S3 (for a resumed upload) do not need to be sent again
+    done = {}
+    paginator = client.get_paginator("list_parts")
+    for page in paginator.paginate(Bucket=bucket, Key=key, UploadId=upload_id):
+        for part in page.get("Parts", []):
+            done[part["PartNumber"]] = part["ETag"]
+
+    def send(part_number, offset):
+        body = _read_part(local_path, offset, chunk_size)
+        md5 = hashlib.md5(body)
+        etag = client.upload_part(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=body,
+            ContentMD5=base64.b64encode(md5.digest()).decode(),
+        )["ETag"]
+        if etag.strip('"') != md5.hexdigest():
+            raise ChecksumMismatch("Part %d of %s" % (part_number, s3_path))
+        return part_number, etag
+
+    offsets = range(0, size, chunk_size)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = set()
+        for part_number, offset in enumerate(offsets, start=1):
+            if part_number in done:
+                continue
+            if len(in_flight) >= max_workers:
+                finished, in_flight = wait(in_flight, return_when="FIRST_COMPLETED")
+                done.update(f.result() for f in finished)
+            in_flight.add(pool.submit(send, part_number, offset))
+        done.update(f.result() for f in wait(in_flight).done)
+
+    client.complete_multipart_upload(
+        Bucket=bucket,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={
+            "Parts": [
+                {"PartNumber": number, "ETag": done[number]} for number in sorted(done)
+            ]
+        },
+    )
+    os.remove(state_path)
+    return make_stats(size, start)
+
+
+def download_file(
+    client,
+    s3_path,
+    local_path,
+    chunk_size=CHUNK_SIZE,
+    max_workers=MAX_WORKERS,
+):
+    """Downloads s3_path to local_path with parallel ranged GETs and returns TransferStats.
+
+    Ranges are streamed into a preallocated local_path + ".part" file, which is renamed
+    to local_path only after its checksum has been verified against the sha256 object
+    metadata (or the ETag of a single-part object). Completed ranges are recorded in a
+    state file, so rerunning after a failure only fetches the missing ranges, as long
+    as the remote object has not changed in the meantime.
+    """
+    start = time.perf_counter()
+    bucket, key = split_s3_path(s3_path)
+    head = client.head_object(Bucket=bucket, Key=key)
+    size = head["ContentLength"]
+    etag = head["ETag"].strip('"')
+
+    part_path = local_path + ".part"
+    state_path = part_path + ".json"
+    directory = os.path.dirname(local_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    state = _load_state(state_path)
+    if (
+        state is None
+        or state["etag"] != etag
+        or state["chunk_size"] != chunk_size
+        or not os.path.exists(part_path)
+    ):
+        state = dict(etag=etag, chunk_size=chunk_size, completed=[])
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+        _save_state(state_path, state)
+
+    lock = threading.Lock()
+
+    def fetch(offset):
+        end = min(offset + chunk_size, size) - 1
+        body = client.get_object(
+            Bucket=bucket, Key=key, Range="bytes=%d-%d" % (offset, end), IfMatch=etag
+        )["Body"]
+        with open(part_path, "r+b") as f:
+            f.seek(offset)
+            for block in iter(lambda: body.read(READ_SIZE), b""):
+                f.write(block)
+        with lock:
+            state["completed"].append(offset)
+            _save_state(state_path, state)
+
+    completed = set(state["completed"])
+    missing = [
+        offset for offset in range(0, size, chunk_size) if offset not in completed
+    ]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for future in [pool.submit(fetch, offset) for offset in missing]:
+            future.result()
+
+    expected = head.get("Metadata", {}).get(CHECKSUM_METADATA_KEY)
+    if expected is not None:
+        actual = file_sha256(part_path)
+    elif "-" not in etag:  # the ETag of a single-part upload is the md5 of the object
+        expected, actual = etag, _hash_file(part_path, "md5")
+    else:
+        actual = expected
+    if actual != expected:
+        os.remove(part_path)
+        os.remove(state_path)
+        raise ChecksumMismatch(s3_path)
+
+    os.replace(part_path, local_path)
+    os.remove(state_path)
+    return make_stats(size, start)
+
+
+def show_stats(label, stats):
+    """Prints transfer size, throughput and peak memory"""
+    print(
+        "%s: %d bytes in %.2fs (%.1f MB/s, peak RSS %.1f MB)"
+        % (label, stats.nbytes, stats.seconds, stats.throughput_mb_s, stats.peak_rss_mb)
+    )
@@ -0,0 +1,242 @@
+"""Hyperparameter search with successive halving over the cross-validation folds of the feature store.
+
+Candidates are sampled from the parameter space registered for an estimator in
+PARAM_SPACES. Every rung evaluates the surviving candidates in parallel on a growing
+number of training rows and keeps the best 1/eta of them, so losing configurations
+stop early. With eta=1 the search is a plain randomized search on all rows.
+"""
+
+import json
+import os
+import queue
+import time
+from multiprocessing import Pool
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pandas as pd
+from luigi import FloatParameter, IntParameter, LocalTarget, Parameter
+
+from . import estimators
+from .caching import CachedTask
+from .estimators import import_estimator
+from .events import ROWS_PROCESSED
+from .features import BuildFeatures, FeatureSet
+from .load_data import data_output_path
+
+SHARED_RELATIVE_PATH = "data"
+
+# Parameter spaces of the registered estimators: parameter name -> candidate values
+PARAM_SPACES = {
+    "sklearn.ensemble.RandomForestClassifier": {
+        "n_estimators": [50, 100, 200, 400],
+        "max_depth": [None, 3, 5, 8, 12],
+        "min_samples_leaf": [1, 2, 4, 8],
+        "max_features": ["sqrt", "log2", None],
+    },
+    "sklearn.linear_model.LogisticRegression": {
+        "C": [0.001, 0.01, 0.1, 1.0, 10.0, 100.0],
+        "solver": ["lbfgs", "liblinear"],
+        "max_iter": [1000],
+    },
+}
+
+
+def register_space(path, space):
+    """Registers the parameter space of the estimator with the given dotted path"""
+    PARAM_SPACES[path] = space
+
+
+def sample_candidates(space, n_candidates, seed):
+    """Draws up to n_candidates distinct parameter combinations from space"""
+    rng = np.random.RandomState(seed)
+    candidates = []
+    for _ in range(n_candidates * 10):
+        params = {
+            name: values[rng.randint(len(values))] for name, values in space.items()
+        }
+        if params not in candidates:
+            candidates.append(params)
+        if len(candidates) == n_candidates:
+            break
+    return candidates
+
+
+def _evaluate(path, params, resource, x_path, y_path, folds_path, order_path):
+    """Mean validation accuracy over the folds, fitting on at most resource rows of each training part"""
+    start = time.perf_counter()
+    x = np.load(x_path, mmap_mode="r")
+    y = np.load(y_path, mmap_mode="r")
+    folds = np.load(folds_path)
+    order = np.load(order_path)
+    scores = []
+    for fold in range(folds.max() + 1):
+        train_rows = order[folds[order] != fold][:resource]
+        validation_rows = np.flatnonzero(folds == fold)
+        clf = import_estimator(path)(**params)
+        clf.fit(x[train_rows], y[train_rows])
+        scores.append(clf.score(x[validation_rows], y[validation_rows]))
+    return float(np.mean(scores)), time.perf_counter() - start
+
+
+def successive_halving(
+    path,
+    candidates,
+    x,
+    y,
+    folds,
+    eta=3,
+    min_resource=50,
+    max_seconds=None,
+    max_workers=None,
+    seed=42,
+):
+    """Runs successive halving and returns the best parameters and the trial log as a DataFrame.
+    max_seconds is a hard limit: when it is reached the running trials are killed and the best
+    candidate of the last rung with finished trials is returned."""
+    start = time.perf_counter()
+    n_rungs = 1
+    if eta > 1:
+        n_rungs += int(np.floor(np.log(len(candidates)) / np.log(eta)))
+    resource = max(min_resource, int(len(y) / eta ** (n_rungs - 1)))
+    trials = []
+    best = None
+    survivors = candidates
+    with TemporaryDirectory() as shared:
+        arrays = {}
+        for name, array in (
+            ("x", np.ascontiguousarray(x, dtype=np.float32)),
+            ("y", np.asarray(y)),
+            ("folds", folds),
+            ("order", np.random.RandomState(seed).permutation(len(y))),
+        ):
+            arrays[name] = os.path.join(shared, name + ".npy")
+            np.save(arrays[name], array)
+
+        # Leaving the block terminates the pool, killing the trials still running
+        with Pool(max_workers) as pool:
+            for rung in range(n_rungs):
+                if rung == n_rungs - 1:
+                    resource = len(y)
+                # (params, (score, seconds) or None, error or None) of the finished trials
+                finished = queue.Queue()
+                for params in survivors:
+                    pool.apply_async(
+                        _evaluate,
+                        (
+                            path,
+                            params,
+                            resource,
+                            arrays["x"],
+                            arrays["y"],
+                            arrays["folds"],
+                            arrays["order"],
+                        ),
+                        callback=lambda result, params=params, put=finished.put: put(
+                            (params, result, None)
+                        ),
+                        error_callback=lambda error, params=params, put=finished.put: put(
+                            (params, None, error)
+                        ),
+                    )
+                results = []
+                out_of_time = False
+                for _ in survivors:
+                    timeout = None
+                    if max_seconds is not None:
+                        timeout = max(max_seconds - (time.perf_counter() - start), 0)
+                    try:
+                        params, result, error = finished.get(timeout=timeout)
+                    except queue.Empty:  # budget exhausted: drop the unfinished trials
+                        out_of_time = True
+                        break
+                    if error is not None:
+                        raise error
+                    score, seconds = result
+                    results.append((score, params))
+                    trials.append(
+                        dict(
+                            trial=len(trials),
+                            rung=rung,
+                            resource=resource,
+                            params=json.dumps(params),
+                            score=score,
+                            seconds=seconds,
+                        )
+                    )
+                if not results:
+                    break
+                results.sort(key=lambda result: -result[0])
+                best = results[0][1]
+                if out_of_time:
+                    break
+                n_survivors = max(1, int(np.ceil(len(results) / eta)))
+                survivors = [params for _, params in results[:n_survivors]]
+                resource = min(resource * eta, len(y))
+    if best is None:
+        raise RuntimeError(
+            "No trial of %s finished within %s seconds" % (path, max_seconds)
+        )
+    return best, pd.DataFrame(trials)
+
+
+class Tune(CachedTask):
+    """Searches the hyperparameters of model (dotted path of an estimator registered in PARAM_SPACES) on the
+    preprocessed train data with successive halving over the cross-validation folds of the feature store.
+    Saves the best parameters as json and a log of all trials with their wall time as csv to the local folder of the data.
+    n_candidates, max_seconds (0 means no limit) and eta are the budget controls.
+    """
+
+    data = Parameter(default="heart.csv")
+    train_or_test = Parameter(default="train")
+    model = Parameter(default="sklearn.ensemble.RandomForestClassifier")
+    n_candidates = IntParameter(default=27)
+    eta = IntParameter(default=3)
+    n_splits = IntParameter(default=5)
+    seed = IntParameter(default=42)
+    max_seconds = FloatParameter(default=0, significant=False)
+    max_workers = IntParameter(default=0, significant=False)
+
+    salt_modules = (estimators,)
+
+    def cores(self):
+        return self.max_workers or os.cpu_count()
+
+    def requires(self):
+        return BuildFeatures(self.data, self.n_splits, self.seed)
+
+    def output(self):
+        name = self.model.rpartition(".")[2]
+        return {
+            "params": LocalTarget(
+                data_output_path(self.data, name + "_best_params.json")
+            ),
+            "trials": LocalTarget(data_output_path(self.data, name + "_trials.csv")),
+        }
+
+    def run(self):
+        # Features and folds of the feature store, built with the same n_splits and seed
+        features = FeatureSet(self.input().path)
+        x = features.matrix(self.train_or_test)
+        y = features.target(self.train_or_test)
+        folds = features.folds(self.train_or_test)
+        candidates = sample_candidates(
+            PARAM_SPACES[self.model], self.n_candidates, self.seed
+        )
+        best, trials = successive_halving(
+            self.model,
+            candidates,
+            x,
+            y,
+            folds,
+            eta=self.eta,
+            max_seconds=self.max_seconds or None,
+            max_workers=self.max_workers or None,
+            seed=self.seed,
+        )
+        self.trigger_event(ROWS_PROCESSED, self, len(y))
+        with self.output()["trials"].open("w") as f:
+            f.write(trials.to_csv(index=False))
+        with self.output()["params"].open("w") as f:
+            json.dump(best, f)
+        print("Best parameters of %s: %s" % (self.model, best))
@@ -0,0 +1,182 @@
+"""Trains a zoo of estimators in parallel in a process pool.
+
+The preprocessed training matrix is written once as .npy files and every worker
+opens it memory-mapped and read-only, so the data is shared through the page cache
+instead of being copied into each process. Estimators are scheduled so that the sum
+of their n_jobs never exceeds the available cores; every estimator is fitted with
+n_jobs set to the cores reserved for it.
+
+TrainZoo writes the model folders of the Train tasks of its models and records their
+manifests (see caching), so the Train tasks of the same run find them complete and
+TestModel tests the models of the zoo.
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from luigi import IntParameter, LocalTarget, Parameter
+from sklearn.metrics import accuracy_score
+
+from . import estimators
+from .caching import CachedTask, record_manifest
+from .estimators import ModelSpecListParameter, import_estimator
+from .estimators import model_name as zoo_model_name
+from .events import ROWS_PROCESSED
+from .features import BuildFeatures, FeatureSet
+from .load_data import data_output_path
+from .model_io import save_model
+from .registry import data_hash, get_registry
+
+SHARED_RELATIVE_PATH = "data"
+
+# Models trained by default (model specs, see estimators)
+DEFAULT_ZOO = [
+    "sklearn.ensemble.RandomForestClassifier",
+    "sklearn.linear_model.LogisticRegression",
+]
+
+
+def cores_needed(params, cpu_count):
+    """Returns the number of cores an estimator uses, following the joblib n_jobs convention"""
+    n_jobs = params.get("n_jobs") or 1
+    if n_jobs < 0:
+        n_jobs = cpu_count + 1 + n_jobs
+    return min(max(n_jobs, 1), cpu_count)
+
+
+def _fit_shared(path, params, x_path, y_path, feature_names, output_path):
+    """Fits one estimator on the memory-mapped training data and saves it as a model folder to output_path"""
+    start = time.perf_counter()
+    x_train = np.load(x_path, mmap_mode="r")
+    y_train = np.load(y_path, mmap_mode="r")
+    clf = import_estimator(path)(**params)
+    clf.fit(x_train, y_train)
+    # Fitted on the bare array to avoid a copy; record the columns as if fitted on a DataFrame
+    clf.feature_names_in_ = np.array(feature_names, dtype=object)
+    training_score = accuracy_score(y_train, clf.predict(x_train))
+    save_model(clf, output_path, feature_names, scores={"train": training_score})
+    return training_score, time.perf_counter() - start
+
+
+def train_zoo(models, x_train, y_train, output_paths, max_cores=None):
+    """Fits all (path, params) models in parallel and returns {model name: (training score, seconds)}.
+    Every fitted model is recorded in the run registry.
+
+    x_train is a DataFrame and y_train a Series. x_train is shared as float32, the dtype tree ensembles use internally, so neither
+    random forests nor LogisticRegression make a private copy of it.
+    """
+    max_cores = max_cores or os.cpu_count()
+    train_hash = data_hash(x_train, y_train)
+    results = {}
+    with TemporaryDirectory(dir=os.path.dirname(output_paths[0]) or None) as shared:
+        x_path = os.path.join(shared, "x_train.npy")
+        y_path = os.path.join(shared, "y_train.npy")
+        np.save(x_path, np.ascontiguousarray(x_train.values, dtype=np.float32))
+        np.save(y_path, np.asarray(y_train))
+
+        # Largest jobs first, then fill the remaining cores with smaller ones
+        pending = sorted(
+            zip(models, output_paths),
+            key=lambda item: -cores_needed(dict(item[0][1]), max_cores),
+        )
+        running = {}
+        free = max_cores
+        with ProcessPoolExecutor(max_workers=min(max_cores, len(models))) as pool:
+            while pending or running:
+                for item in list(pending):
+                    (path, params), output_path = item
+                    cores = cores_needed(dict(params), max_cores)
+                    if cores <= free:
+                        fit_params = dict(params)
+                        if "n_jobs" in fit_params:
+                            # -1 or too many jobs would start a thread per core of the machine
+                            fit_params["n_jobs"] = cores
+                        future = pool.submit(
+                            _fit_shared,
+                            path,
+                            fit_params,
+                            x_path,
+                            y_path,
+                            list(x_train.columns),
+                            output_path,
+                        )
+                        running[future] = (
+                            zoo_model_name(path, params),
+                            cores,
+                            dict(params),
+                            output_path,
+                        )
+                        free -= cores
+                        pending.remove(item)
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, cores, params, output_path = running.pop(future)
+                    results[name] = future.result()
+                    free += cores
+                    get_registry().record(
+                        name,
+                        "train",
+                        results[name][0],
+                        params=params,
+                        data_hash=train_hash,
+                        seconds=results[name][1],
+                        artifact_path=output_path,
+                    )
+    return results
+
+
+class TrainZoo(CachedTask):
+    """Trains every model of the models parameter (a list of model specs, see estimators) in parallel on the
+    preprocessed train data. max_cores limits the cores used (default: all).
+    Each model is saved to the local folder of the data as the output of its Train task, which is then complete.
+    """
+
+    data = Parameter(default="heart.csv")
+    train_or_test = Parameter(default="train")
+    models = ModelSpecListParameter(default=DEFAULT_ZOO)
+    max_cores = IntParameter(default=0, significant=False)
+
+    salt_modules = (estimators,)
+
+    def cores(self):
+        return self.max_cores or os.cpu_count()
+
+    def requires(self):
+        return BuildFeatures(self.data)
+
+    def output(self):
+        return {
+            model.name: LocalTarget(data_output_path(self.data, model.name + "_model"))
+            for model in self.models
+        }
+
+    def trainings(self):
+        """Returns the Train tasks with the same outputs as the zoo"""
+        from .train import Train  # train imports this module
+
+        return [Train(self.data, self.train_or_test, model) for model in self.models]
+
+    def run(self):
+        features = FeatureSet(self.input().path)
+        x_train = features.frame(self.train_or_test)
+        y_train = features.target(self.train_or_test)
+        outputs = self.output()
+        results = train_zoo(
+            [(model.path, model.params) for model in self.models],
+            x_train,
+            y_train,
+            [outputs[model.name].path for model in self.models],
+            self.max_cores or None,
+        )
+        self.trigger_event(ROWS_PROCESSED, self, len(x_train))
+        # Else the Train tasks would fit the models again and overwrite them
+        for task in self.trainings():
+            record_manifest(task)
+        for name, (training_score, seconds) in sorted(results.items()):
+            print(
+                "%s trained in %.2fs, training score %.4f"
+                % (name, seconds, training_score)
+            )